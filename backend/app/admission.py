@@ -0,0 +1,252 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import time
+from typing import Optional
+
+from .cache import TTLCache
+
+# ---------------------------
+# Admission control
+# ---------------------------
+# Requests are admitted against an adaptive global concurrency limit and a
+# fixed per-router budget. The global limit follows latency (AIMD): it grows
+# by ~1 per limit's worth of fast completions and shrinks by 10% when
+# completions come back slower than ADMISSION_TARGET_LATENCY_MS. Requests
+# that cannot start wait in one bounded priority queue, storefront reads
+# first and admin last, for at most ADMISSION_QUEUE_TIMEOUT_MS. Beyond that,
+# or when the queue is full, they get a fast 503 with Retry-After.
+
+ADMISSION_MIN_LIMIT = int(os.getenv("ADMISSION_MIN_LIMIT", "8"))
+ADMISSION_MAX_LIMIT = int(os.getenv("ADMISSION_MAX_LIMIT", "256"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "512"))
+ADMISSION_QUEUE_TIMEOUT_MS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "2000"))
+ADMISSION_TARGET_LATENCY_MS = float(os.getenv("ADMISSION_TARGET_LATENCY_MS", "250"))
+
+# Per-router concurrency budgets (upper bounds within the global limit).
+BUDGETS = {
+    "products": int(os.getenv("ADMISSION_BUDGET_PRODUCTS", "192")),
+    "orders": int(os.getenv("ADMISSION_BUDGET_ORDERS", "64")),
+    "auth": int(os.getenv("ADMISSION_BUDGET_AUTH", "32")),
+    "admin": int(os.getenv("ADMISSION_BUDGET_ADMIN", "16")),
+    "other": int(os.getenv("ADMISSION_BUDGET_OTHER", "32")),
+}
+
+# Lower is admitted first.
+PRIORITY_PRODUCT_READ = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_ADMIN = 2
+
+# /auth/login per-IP token bucket.
+LOGIN_RATE_PER_MINUTE = float(os.getenv("LOGIN_RATE_PER_MINUTE", "10"))
+LOGIN_BURST = float(os.getenv("LOGIN_BURST", "5"))
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "0") == "1"
+
+# Observability endpoints are never queued or shed.
+EXEMPT_PATHS = {"/", "/metrics", "/stats"}
+
+
+class Shed(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ("group", "future", "cancelled")
+
+    def __init__(self, group: str, future: asyncio.Future):
+        self.group = group
+        self.future = future
+        self.cancelled = False
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        budgets: dict[str, int] = BUDGETS,
+        min_limit: int = ADMISSION_MIN_LIMIT,
+        max_limit: int = ADMISSION_MAX_LIMIT,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT_MS / 1000,
+        target_latency: float = ADMISSION_TARGET_LATENCY_MS / 1000,
+    ):
+        self.budgets = dict(budgets)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.target_latency = target_latency
+        self.limit = float(max(min_limit, min(max_limit, 64)))
+        self.in_flight = 0
+        self.group_in_flight = {g: 0 for g in budgets}
+        self._queue: list = []
+        self._queued = 0
+        self._seq = itertools.count()
+        self._last_decrease = 0.0
+        self.admitted = 0
+        self.shed = {g: {"queue_full": 0, "timeout": 0} for g in budgets}
+
+    def _can_start(self, group: str) -> bool:
+        return self.in_flight < int(self.limit) and self.group_in_flight[group] < self.budgets[group]
+
+    def _start(self, group: str) -> None:
+        self.in_flight += 1
+        self.group_in_flight[group] += 1
+        self.admitted += 1
+
+    async def acquire(self, group: str, priority: int) -> None:
+        # Nobody jumps the queue: start straight away only if no one is waiting.
+        if not self._queued and self._can_start(group):
+            self._start(group)
+            return
+        if self._queued >= self.queue_size:
+            self.shed[group]["queue_full"] += 1
+            raise Shed("queue_full")
+        waiter = _Waiter(group, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+        self._queued += 1
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if waiter.future.done():
+                # Admitted just as we gave up; hand the slot back.
+                self.release(group, 0.0)
+            else:
+                waiter.cancelled = True
+                self._queued -= 1
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+            self.shed[group]["timeout"] += 1
+            raise Shed("timeout")
+
+    def release(self, group: str, latency: float) -> None:
+        self.in_flight -= 1
+        self.group_in_flight[group] -= 1
+        now = time.monotonic()
+        if latency > self.target_latency:
+            # At most one decrease per target window, so a burst of slow
+            # completions doesn't collapse the limit.
+            if now - self._last_decrease > self.target_latency:
+                self.limit = max(self.min_limit, self.limit * 0.9)
+                self._last_decrease = now
+        elif latency > 0:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        skipped = []
+        while self._queue and self.in_flight < int(self.limit):
+            entry = heapq.heappop(self._queue)
+            waiter = entry[2]
+            if waiter.cancelled:
+                continue
+            if not self._can_start(waiter.group):
+                # Its router is at budget; let lower-priority routers through.
+                skipped.append(entry)
+                continue
+            self._queued -= 1
+            self._start(waiter.group)
+            waiter.future.set_result(None)
+        for entry in skipped:
+            heapq.heappush(self._queue, entry)
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queue_depth": self._queued,
+            "admitted": self.admitted,
+            "group_in_flight": dict(self.group_in_flight),
+            "shed": {g: dict(v) for g, v in self.shed.items()},
+        }
+
+
+class TokenBucketLimiter:
+    def __init__(self, rate_per_minute: float = LOGIN_RATE_PER_MINUTE, burst: float = LOGIN_BURST, max_keys: int = 100_000):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self._buckets = TTLCache(maxsize=max_keys, ttl=max(60.0, burst / self.rate))
+        self.limited = 0
+
+    def take(self, key: str) -> Optional[float]:
+        """Take one token; return None if allowed, else seconds until the next token."""
+        now = time.monotonic()
+        tokens, last = self._buckets.get(key) or (self.burst, now)
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        if tokens < 1:
+            self._buckets.set(key, (tokens, now))
+            self.limited += 1
+            return (1 - tokens) / self.rate
+        self._buckets.set(key, (tokens - 1, now))
+        return None
+
+    def stats(self) -> dict:
+        return {"tracked_ips": len(self._buckets), "limited": self.limited}
+
+
+def classify(method: str, path: str) -> tuple[str, int]:
+    group = path.split("/", 2)[1]
+    if group not in BUDGETS:
+        group = "other"
+    if group == "products" and method in ("GET", "HEAD"):
+        return group, PRIORITY_PRODUCT_READ
+    if group == "admin":
+        return group, PRIORITY_ADMIN
+    return group, PRIORITY_DEFAULT
+
+
+def client_ip(scope) -> str:
+    if TRUST_FORWARDED_FOR:
+        for name, value in scope.get("headers", []):
+            if name == b"x-forwarded-for":
+                return value.decode().split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+controller = AdmissionController()
+login_limiter = TokenBucketLimiter()
+
+
+class AdmissionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def _reject(self, send, status: int, detail: str, retry_after: float) -> None:
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, int(retry_after + 0.999))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        method, path = scope["method"], scope["path"]
+        if method == "POST" and path.rstrip("/") == "/auth/login":
+            wait = login_limiter.take(client_ip(scope))
+            if wait is not None:
+                await self._reject(send, 429, "Too many login attempts", wait)
+                return
+        group, priority = classify(method, path)
+        try:
+            await controller.acquire(group, priority)
+        except Shed as exc:
+            await self._reject(send, 503, f"Server busy ({exc.reason}), retry shortly", 1)
+            return
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release(group, time.perf_counter() - started)
@@ -0,0 +1,103 @@
+from collections import defaultdict
+from typing import Iterable
+
+from prisma import Prisma
+
+# ---------------------------
+# Sales rollups
+# ---------------------------
+# Running totals per day, product, category and seller, so dashboards read
+# a handful of rows instead of scanning Order/OrderItem. Every order is
+# folded in exactly once: the rollup write and the flip of Order.rolledUp
+# commit in the same transaction, whether it runs from the post-order job
+# or from the backfill. Line revenue is quantity x the product's price at
+# rollup time (seconds after checkout for new orders).
+
+PRODUCT_LOOKUP_CHUNK = 500
+
+
+def day_of(dt) -> str:
+    return dt.strftime("%Y-%m-%d")
+
+
+async def roll_up_orders(tx: Prisma, order_ids: Iterable[str]) -> int:
+    """Fold the given orders into the rollups; already-counted orders are skipped."""
+    orders = await tx.order.find_many(
+        where={"id": {"in": list(order_ids)}, "rolledUp": False},
+        include={"items": True},
+    )
+    if not orders:
+        return 0
+    await tx.order.update_many(where={"id": {"in": [o.id for o in orders]}}, data={"rolledUp": True})
+
+    product_ids = list({i.productId for o in orders for i in o.items})
+    products = {}
+    for i in range(0, len(product_ids), PRODUCT_LOOKUP_CHUNK):
+        for p in await tx.product.find_many(where={"id": {"in": product_ids[i:i + PRODUCT_LOOKUP_CHUNK]}}):
+            products[p.id] = p
+
+    daily = defaultdict(lambda: [0, 0, 0])        # day -> [orders, revenue, units]
+    by_product = defaultdict(lambda: [0, 0, 0])   # id -> [orders, revenue, units]
+    by_category = defaultdict(lambda: [0, 0])     # id -> [revenue, units]
+    by_seller = defaultdict(lambda: [0, 0])       # id -> [revenue, units]
+    for o in orders:
+        d = daily[day_of(o.createdAt)]
+        d[0] += 1
+        d[1] += o.total
+        for item in o.items:
+            d[2] += item.quantity
+            p = products.get(item.productId)
+            revenue = p.price * item.quantity if p else 0
+            row = by_product[item.productId]
+            row[0] += 1
+            row[1] += revenue
+            row[2] += item.quantity
+            if p is None:
+                continue
+            if p.categoryId is not None:
+                by_category[p.categoryId][0] += revenue
+                by_category[p.categoryId][1] += item.quantity
+            by_seller[p.sellerId][0] += revenue
+            by_seller[p.sellerId][1] += item.quantity
+
+    for day, (n, revenue, units) in daily.items():
+        await tx.dailysales.upsert(
+            where={"day": day},
+            data={
+                "create": {"day": day, "orders": n, "revenue": revenue, "units": units},
+                "update": {"orders": {"increment": n}, "revenue": {"increment": revenue}, "units": {"increment": units}},
+            },
+        )
+    for pid, (n, revenue, units) in by_product.items():
+        await tx.productsales.upsert(
+            where={"productId": pid},
+            data={
+                "create": {"productId": pid, "orders": n, "revenue": revenue, "units": units},
+                "update": {"orders": {"increment": n}, "revenue": {"increment": revenue}, "units": {"increment": units}},
+            },
+        )
+    for cid, (revenue, units) in by_category.items():
+        await tx.categorysales.upsert(
+            where={"categoryId": cid},
+            data={
+                "create": {"categoryId": cid, "revenue": revenue, "units": units},
+                "update": {"revenue": {"increment": revenue}, "units": {"increment": units}},
+            },
+        )
+    for sid, (revenue, units) in by_seller.items():
+        await tx.sellersales.upsert(
+            where={"sellerId": sid},
+            data={
+                "create": {"sellerId": sid, "revenue": revenue, "units": units},
+                "update": {"revenue": {"increment": revenue}, "units": {"increment": units}},
+            },
+        )
+    return len(orders)
+
+
+async def reset_rollups(tx: Prisma) -> None:
+    await tx.dailysales.delete_many()
+    await tx.productsales.delete_many()
+    await tx.categorysales.delete_many()
+    await tx.sellersales.delete_many()
+    await tx.order.update_many(where={"rolledUp": True}, data={"rolledUp": False})
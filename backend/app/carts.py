@@ -0,0 +1,306 @@
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from datetime import timedelta
+from typing import AsyncContextManager, Callable, Optional
+
+from prisma import Prisma
+
+from .cache import TTLCache
+from .changes import changes
+from .db import pool
+
+# ---------------------------
+# Server-side carts
+# ---------------------------
+# Hot carts live in memory (LRU, CART_CACHE_SIZE entries) and are the
+# source of truth while resident. Mutations only mark a cart dirty; a
+# background flusher writes dirty carts to the Cart table every
+# CART_FLUSH_INTERVAL seconds, CART_FLUSH_BATCH carts per transaction.
+# A dirty cart that falls out of the LRU is parked until it is written, so
+# eviction never loses an update, and flush() on shutdown drains the rest.
+#
+# Each cart keeps a running subtotal. Unit prices come from a shared price
+# cache; lines whose cached price has expired are re-priced together with
+# one lookup and the subtotal is adjusted by the difference. Most calls are
+# answered from memory, so the store leases a client only for a lookup.
+#
+# With several workers (the change feed on, see app/changes.py) a cart may
+# be resident in more than one of them. Mutations then write through: the
+# cart is flushed before the call returns, and the flush publishes a "cart"
+# change that makes the other workers drop their copy and reload it. A cart
+# changed on two workers within one poll interval keeps the last write.
+
+CART_CACHE_SIZE = int(os.getenv("CART_CACHE_SIZE", "50000"))
+CART_FLUSH_INTERVAL = float(os.getenv("CART_FLUSH_INTERVAL", "2"))
+CART_FLUSH_BATCH = int(os.getenv("CART_FLUSH_BATCH", "200"))
+CART_MAX_LINES = int(os.getenv("CART_MAX_LINES", "100"))
+PRICE_CACHE_SIZE = int(os.getenv("PRICE_CACHE_SIZE", "200000"))
+PRICE_CACHE_TTL = float(os.getenv("PRICE_CACHE_TTL", "60"))
+CART_WRITE_THROUGH = os.getenv("CART_WRITE_THROUGH", "1" if changes.enabled else "0") == "1"
+
+
+class UnknownProduct(Exception):
+    def __init__(self, product_ids: list[str]):
+        super().__init__(", ".join(product_ids))
+        self.product_ids = product_ids
+
+
+class Cart:
+    __slots__ = ("customer_id", "quantities", "prices", "subtotal")
+
+    def __init__(self, customer_id: str, quantities: Optional[dict[str, int]] = None):
+        self.customer_id = customer_id
+        self.quantities: dict[str, int] = dict(quantities or {})
+        # Unit price each line is currently counted at in subtotal.
+        self.prices: dict[str, int] = {}
+        self.subtotal = 0
+
+    def set_line(self, product_id: str, quantity: int, price: int) -> None:
+        old_qty = self.quantities.get(product_id, 0)
+        old_price = self.prices.get(product_id, 0)
+        self.subtotal += quantity * price - old_qty * old_price
+        if quantity > 0:
+            self.quantities[product_id] = quantity
+            self.prices[product_id] = price
+        else:
+            self.quantities.pop(product_id, None)
+            self.prices.pop(product_id, None)
+
+    def reprice(self, product_id: str, price: int) -> None:
+        self.set_line(product_id, self.quantities[product_id], price)
+
+
+class PriceCache:
+    def __init__(
+        self,
+        maxsize: int = PRICE_CACHE_SIZE,
+        ttl: float = PRICE_CACHE_TTL,
+        lease: Callable[[], AsyncContextManager[Prisma]] = pool.acquire,
+    ):
+        self._prices = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.lease = lease
+
+    async def get_many(self, product_ids) -> dict[str, int]:
+        """Prices for the given ids; ids that no longer exist are left out."""
+        found: dict[str, int] = {}
+        missing = []
+        for pid in product_ids:
+            price = self._prices.get(pid)
+            if price is None:
+                missing.append(pid)
+            else:
+                found[pid] = price
+        if missing:
+            async with self.lease() as prisma:
+                rows = await prisma.product.find_many(where={"id": {"in": missing}})
+            for p in rows:
+                self._prices.set(p.id, p.price)
+                found[p.id] = p.price
+        return found
+
+    def invalidate(self, product_id: str) -> None:
+        self._prices.pop(product_id)
+
+    def clear(self) -> None:
+        self._prices.clear()
+
+    def stats(self) -> dict:
+        return self._prices.stats()
+
+
+class CartStore:
+    def __init__(
+        self,
+        maxsize: int = CART_CACHE_SIZE,
+        prices: Optional[PriceCache] = None,
+        lease: Callable[[], AsyncContextManager[Prisma]] = pool.acquire,
+        write_through: bool = CART_WRITE_THROUGH,
+    ):
+        self.maxsize = maxsize
+        self.prices = prices or PriceCache(lease=lease)
+        self.lease = lease
+        self.write_through = write_through
+        self._carts: "OrderedDict[str, Cart]" = OrderedDict()
+        self._dirty: set[str] = set()
+        # Evicted before their last change was written.
+        self._parked: dict[str, dict[str, int]] = {}
+        self._flushing: set[str] = set()
+        self._flush_lock = asyncio.Lock()
+        self.loads = 0
+        self.evictions = 0
+        self.flushes = 0
+        self.flushed_carts = 0
+        self.flush_errors = 0
+
+    # -- residency ---------------------------------------------------------
+
+    def _remember(self, cart: Cart) -> Cart:
+        self._carts[cart.customer_id] = cart
+        self._carts.move_to_end(cart.customer_id)
+        while len(self._carts) > self.maxsize:
+            uid, evicted = self._carts.popitem(last=False)
+            self.evictions += 1
+            if uid in self._dirty or uid in self._flushing:
+                self._parked[uid] = dict(evicted.quantities)
+        return cart
+
+    async def _load(self, customer_id: str) -> Cart:
+        cart = self._carts.get(customer_id)
+        if cart is not None:
+            self._carts.move_to_end(customer_id)
+            return cart
+        quantities = self._parked.get(customer_id)
+        if quantities is None:
+            async with self.lease() as prisma:
+                row = await prisma.cart.find_unique(where={"customerId": customer_id})
+            quantities = json.loads(row.items) if row else {}
+            self.loads += 1
+            # Another request may have loaded it while we waited.
+            cart = self._carts.get(customer_id)
+            if cart is not None:
+                return cart
+        return self._remember(Cart(customer_id, quantities))
+
+    def _reprice(self, cart: Cart, prices: dict[str, int]) -> None:
+        for pid in list(cart.quantities):
+            if pid not in prices:
+                # Product was deleted since it was added.
+                cart.set_line(pid, 0, 0)
+                self._dirty.add(cart.customer_id)
+            elif prices[pid] != cart.prices.get(pid):
+                cart.reprice(pid, prices[pid])
+
+    # -- reads and writes --------------------------------------------------
+
+    async def get(self, customer_id: str) -> Cart:
+        cart = await self._load(customer_id)
+        # Cache hits cost a dict lookup; only expired prices go to the database.
+        self._reprice(cart, await self.prices.get_many(list(cart.quantities)))
+        return cart
+
+    async def set_quantity(self, customer_id: str, product_id: str, quantity: int, add: bool = False) -> Cart:
+        prices = await self.prices.get_many([product_id])
+        if product_id not in prices:
+            raise UnknownProduct([product_id])
+        cart = await self._load(customer_id)
+        if add:
+            quantity += cart.quantities.get(product_id, 0)
+        if quantity > 0 and product_id not in cart.quantities and len(cart.quantities) >= CART_MAX_LINES:
+            raise ValueError(f"A cart holds at most {CART_MAX_LINES} products")
+        cart.set_line(product_id, quantity, prices[product_id])
+        await self._changed(customer_id)
+        return await self.get(customer_id)
+
+    async def remove(self, customer_id: str, product_id: str) -> Cart:
+        cart = await self._load(customer_id)
+        if product_id in cart.quantities:
+            cart.set_line(product_id, 0, 0)
+            await self._changed(customer_id)
+        return await self.get(customer_id)
+
+    async def clear(self, customer_id: str) -> None:
+        cart = await self._load(customer_id)
+        cart.quantities.clear()
+        cart.prices.clear()
+        cart.subtotal = 0
+        await self._changed(customer_id)
+
+    async def _changed(self, customer_id: str) -> None:
+        self._dirty.add(customer_id)
+        if self.write_through:
+            async with self.lease() as prisma:
+                await self.flush(prisma)
+
+    def forget(self, customer_ids: list[str]) -> None:
+        # Changed on another worker. A copy with unwritten changes of its
+        # own is kept; whichever flush lands last wins.
+        for uid in customer_ids:
+            if uid not in self._dirty and uid not in self._flushing:
+                self._carts.pop(uid, None)
+                self._parked.pop(uid, None)
+
+    # -- write-behind ------------------------------------------------------
+
+    async def flush(self, prisma: Prisma) -> int:
+        async with self._flush_lock:
+            # Snapshot everything before the first await, so later changes
+            # just mark the cart dirty again for the next round.
+            snapshot = {}
+            for uid in self._dirty:
+                cart = self._carts.get(uid)
+                quantities = cart.quantities if cart is not None else self._parked.get(uid)
+                if quantities is None:
+                    # Dropped for another worker's newer copy.
+                    continue
+                snapshot[uid] = json.dumps(quantities, separators=(",", ":"))
+            self._dirty.clear()
+            self._flushing = set(snapshot)
+            pending = list(snapshot)
+            written = 0
+            try:
+                for i in range(0, len(pending), CART_FLUSH_BATCH):
+                    batch = pending[i:i + CART_FLUSH_BATCH]
+                    try:
+                        async with prisma.tx(timeout=timedelta(seconds=30)) as tx:
+                            for uid in batch:
+                                await tx.cart.upsert(
+                                    where={"customerId": uid},
+                                    data={"create": {"customerId": uid, "items": snapshot[uid]}, "update": {"items": snapshot[uid]}},
+                                )
+                            await changes.publish(tx, "cart", batch)
+                    except Exception:
+                        self.flush_errors += 1
+                        raise
+                    for uid in batch:
+                        self._flushing.discard(uid)
+                        if uid not in self._dirty:
+                            self._parked.pop(uid, None)
+                    written += len(batch)
+            finally:
+                # Whatever was not written, on an error or a cancellation
+                # alike, stays dirty for the next round.
+                self._dirty.update(self._flushing)
+                self._flushing = set()
+                self.flushes += 1
+                self.flushed_carts += written
+            return written
+
+    def stats(self) -> dict:
+        return {
+            "resident": len(self._carts),
+            "maxsize": self.maxsize,
+            "write_through": self.write_through,
+            "dirty": len(self._dirty),
+            "parked": len(self._parked),
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "flushes": self.flushes,
+            "flushed_carts": self.flushed_carts,
+            "flush_errors": self.flush_errors,
+            "price_cache": self.prices.stats(),
+        }
+
+
+carts = CartStore()
+
+
+@changes.handler("cart")
+async def carts_changed(customer_ids: list[str]) -> None:
+    carts.forget(customer_ids)
+
+
+async def run_cart_flusher(interval: float = CART_FLUSH_INTERVAL) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        if not carts._dirty:
+            continue
+        try:
+            async with pool.acquire() as prisma:
+                await carts.flush(prisma)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Dirty carts stay queued; try again next tick.
+            pass
@@ -0,0 +1,140 @@
+import gzip
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+from fastapi import Request, Response
+
+from .changes import changes
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+# ---------------------------
+# Catalog snapshot
+# ---------------------------
+# Pre-serialized, pre-compressed response bodies for product pages and
+# single products. Bodies are keyed by request shape and evicted LRU once
+# the byte budget is exceeded. Writes bump `version`: a changed product
+# drops its own entry and every cached page (any page may list it).
+# The snapshot is per process; each worker invalidates on its own writes
+# and on the ones other workers publish (app/changes.py).
+# `changed_at` is when that last happened, so a rebuilt body is never read
+# from a replica that has not caught up with the write.
+
+CATALOG_CACHE_MAX_BYTES = int(os.getenv("CATALOG_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+MIN_COMPRESS_BYTES = 512
+
+
+class CachedBody:
+    __slots__ = ("etag", "raw", "gzip", "br", "size")
+
+    def __init__(self, raw: bytes):
+        self.raw = raw
+        self.etag = '"' + hashlib.blake2b(raw, digest_size=16).hexdigest() + '"'
+        self.gzip = gzip.compress(raw, compresslevel=6) if len(raw) >= MIN_COMPRESS_BYTES else None
+        self.br = brotli.compress(raw, quality=5) if brotli is not None and len(raw) >= MIN_COMPRESS_BYTES else None
+        self.size = len(raw) + len(self.gzip or b"") + len(self.br or b"")
+
+
+class CatalogSnapshot:
+    def __init__(self, max_bytes: int = CATALOG_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.version = 0
+        self.changed_at = 0.0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, CachedBody]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[CachedBody]:
+        body = self._entries.get(key)
+        if body is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return body
+
+    def put(self, key: Hashable, raw: bytes, version: int) -> CachedBody:
+        body = CachedBody(raw)
+        # A write landed while this body was being built; serve it but don't keep it.
+        if version != self.version or body.size > self.max_bytes:
+            return body
+        self._drop(key)
+        self._entries[key] = body
+        self.bytes += body.size
+        while self.bytes > self.max_bytes:
+            old_key, _ = next(iter(self._entries.items()))
+            self._drop(old_key)
+            self.evictions += 1
+        return body
+
+    def _drop(self, key: Hashable) -> None:
+        body = self._entries.pop(key, None)
+        if body is not None:
+            self.bytes -= body.size
+
+    def invalidate_product(self, product_id: str) -> None:
+        self._drop(("product", product_id))
+        self.invalidate_pages()
+
+    def invalidate_pages(self) -> None:
+        self.version += 1
+        self.changed_at = time.time()
+        for key in [k for k in self._entries if k[0] == "page"]:
+            self._drop(key)
+
+    def clear(self) -> None:
+        self.version += 1
+        self.changed_at = time.time()
+        self._entries.clear()
+        self.bytes = 0
+
+    def respond(self, request: Request, body: CachedBody) -> Response:
+        headers = {"ETag": body.etag, "Vary": "Accept-Encoding", "X-Catalog-Version": str(self.version)}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or body.etag in [t.strip().removeprefix("W/") for t in if_none_match.split(",")]):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        accept = request.headers.get("accept-encoding", "")
+        if body.br is not None and "br" in accept:
+            headers["Content-Encoding"] = "br"
+            content = body.br
+        elif body.gzip is not None and "gzip" in accept:
+            headers["Content-Encoding"] = "gzip"
+            content = body.gzip
+        else:
+            content = body.raw
+        return Response(content=content, media_type="application/json", headers=headers)
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "evictions": self.evictions,
+            "brotli": brotli is not None,
+        }
+
+
+def page_key(request: Request) -> tuple:
+    return ("page", tuple(sorted(request.query_params.multi_items())))
+
+
+catalog = CatalogSnapshot()
+
+
+@changes.handler("pages")
+async def pages_changed(keys: list[str]) -> None:
+    catalog.invalidate_pages()
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Iterable
+
+from prisma import Prisma
+
+from .db import pool
+
+# ---------------------------
+# Change feed
+# ---------------------------
+# Caches and indexes live in each worker process: the catalog snapshot, the
+# price cache, the search and facet indexes, the user cache, resident carts.
+# A write updates the handling worker's copies directly and also appends a
+# row per changed key to the Change table, inside the write's transaction
+# where it has one. Every worker polls the table every CHANGE_POLL_INTERVAL
+# seconds and hands the rows other processes wrote to the handler
+# registered for their kind, so another worker serves a stale copy for
+# about one poll interval at most.
+#
+# app/server.py turns the feed on: its workers share the database, and even
+# with one worker the old and new process overlap in a rolling restart. Set
+# CHANGE_FEED=1 yourself when several hosts share a database. With it off,
+# publish() writes nothing and a lone process behaves exactly as before. The
+# leader prunes rows older than CHANGE_RETENTION.
+
+CHANGE_FEED = os.getenv("CHANGE_FEED", "0") == "1"
+CHANGE_POLL_INTERVAL = float(os.getenv("CHANGE_POLL_INTERVAL", "0.5"))
+CHANGE_RETENTION = float(os.getenv("CHANGE_RETENTION", "3600"))
+CHANGE_BATCH = 1000
+PRUNE_INTERVAL = 60.0
+
+log = logging.getLogger("cartify.changes")
+
+# handler(keys) applies changes another process made; keys are deduplicated.
+Handler = Callable[[list[str]], Awaitable[None]]
+
+
+class ChangeFeed:
+    def __init__(self, enabled: bool = CHANGE_FEED):
+        self.enabled = enabled
+        self.handlers: dict[str, Handler] = {}
+        # Set per process in connect(): preloaded modules are shared by every fork.
+        self.origin = ""
+        self.position = 0
+        self.published = 0
+        self.applied = 0
+        self.polls = 0
+        self.errors = 0
+
+    def handler(self, kind: str):
+        """Register the handler for changes of one kind made elsewhere."""
+        def register(fn: Handler) -> Handler:
+            self.handlers[kind] = fn
+            return fn
+        return register
+
+    # -- producing ---------------------------------------------------------
+
+    async def publish(self, prisma: Prisma, kind: str, keys: Iterable[str] = ("",)) -> None:
+        if not self.enabled:
+            return
+        rows = [{"kind": kind, "key": key, "origin": self.origin} for key in dict.fromkeys(keys)]
+        if rows:
+            await prisma.change.create_many(data=rows)
+            self.published += len(rows)
+
+    async def publish_now(self, kind: str, keys: Iterable[str] = ("",)) -> None:
+        # For writes with no transaction of their own to publish in.
+        if self.enabled:
+            async with pool.acquire() as prisma:
+                await self.publish(prisma, kind, keys)
+
+    # -- consuming ---------------------------------------------------------
+
+    async def connect(self) -> None:
+        # Before the indexes load: whatever commits from here on is replayed.
+        if not self.enabled:
+            return
+        self.origin = uuid.uuid4().hex
+        async with pool.acquire() as prisma:
+            last = await prisma.change.find_first(order={"id": "desc"})
+        self.position = last.id if last else 0
+
+    def start(self, leader: bool = False) -> asyncio.Task:
+        return asyncio.create_task(self.run(leader=leader))
+
+    async def poll(self) -> int:
+        self.polls += 1
+        seen = 0
+        while True:
+            async with pool.acquire() as prisma:
+                rows = await prisma.change.find_many(where={"id": {"gt": self.position}}, order={"id": "asc"}, take=CHANGE_BATCH)
+            keys: dict[str, dict[str, None]] = {}
+            for row in rows:
+                if row.origin != self.origin:
+                    keys.setdefault(row.kind, {})[row.key] = None
+            for kind, batch in keys.items():
+                handler = self.handlers.get(kind)
+                if handler is None:
+                    continue
+                await handler(list(batch))
+                self.applied += len(batch)
+            if rows:
+                self.position = rows[-1].id
+            seen += len(rows)
+            if len(rows) < CHANGE_BATCH:
+                return seen
+
+    async def prune(self, prisma: Prisma) -> int:
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=CHANGE_RETENTION)
+        return await prisma.change.delete_many(where={"createdAt": {"lt": cutoff}})
+
+    async def run(self, interval: float = CHANGE_POLL_INTERVAL, leader: bool = False) -> None:
+        pruned_at = time.monotonic()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.poll()
+                if leader and time.monotonic() - pruned_at >= PRUNE_INTERVAL:
+                    pruned_at = time.monotonic()
+                    async with pool.acquire() as prisma:
+                        await self.prune(prisma)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # The position only moves past rows that were applied; retry.
+                self.errors += 1
+                log.exception("change feed poll failed")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "position": self.position,
+            "published": self.published,
+            "applied": self.applied,
+            "polls": self.polls,
+            "errors": self.errors,
+        }
+
+
+changes = ChangeFeed()
@@ -0,0 +1,171 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from prisma import Prisma, errors
+
+from .metrics import registry
+
+# ---------------------------
+# Pooled Prisma clients
+# ---------------------------
+# Each Prisma() owns one query-engine connection. The pool keeps a fixed set
+# of them connected for the lifetime of the app and leases them out, so no
+# request ever pays for a connect/disconnect handshake.
+#
+# A lease is exclusive and the pool is small (PRISMA_POOL_SIZE), so hold one
+# only around the queries that need it. The get_prisma dependency leases for
+# the whole request; it is only for handlers that do nothing but query. A
+# handler that awaits anything else (password hashing, an idempotency wait,
+# a streamed response, a cache that usually answers) takes
+# `async with pool.acquire()` around the queries instead, and never holds a
+# lease across the other awaits.
+
+PRISMA_POOL_SIZE = int(os.getenv("PRISMA_POOL_SIZE", "4"))
+PRISMA_ACQUIRE_TIMEOUT = float(os.getenv("PRISMA_ACQUIRE_TIMEOUT", "10"))
+PRISMA_HEALTH_CHECK_INTERVAL = float(os.getenv("PRISMA_HEALTH_CHECK_INTERVAL", "30"))
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class InstrumentedPrisma(Prisma):
+    # Every model/raw query funnels through _execute, including on the
+    # copies handed out by tx(), which keep this class.
+    async def _execute(self, *, method, arguments, model=None, root_selection=None):
+        started = time.perf_counter()
+        try:
+            return await super()._execute(method=method, arguments=arguments, model=model, root_selection=root_selection)
+        finally:
+            name = getattr(model, "__name__", None) or "raw"
+            registry.record_query(name, method, time.perf_counter() - started)
+
+
+class _Slot:
+    def __init__(self, client: Prisma):
+        self.client = client
+        self.checked_at = 0.0
+        self.suspect = False
+
+
+class PrismaPool:
+    def __init__(
+        self,
+        size: int = PRISMA_POOL_SIZE,
+        acquire_timeout: float = PRISMA_ACQUIRE_TIMEOUT,
+        health_check_interval: float = PRISMA_HEALTH_CHECK_INTERVAL,
+        datasource_url: Optional[str] = None,
+    ):
+        self.size = max(1, size)
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+        self.datasource_url = datasource_url
+        self._slots: list[_Slot] = []
+        self._idle: Optional[asyncio.Queue] = None
+        self._in_use = 0
+        self._waiting = 0
+        self._acquired = 0
+        self._timeouts = 0
+        self._reconnects = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _new_client(self) -> Prisma:
+        if self.datasource_url:
+            return InstrumentedPrisma(datasource={"url": self.datasource_url})
+        return InstrumentedPrisma()
+
+    async def connect(self) -> None:
+        if self._idle is not None:
+            return
+        self._idle = asyncio.Queue()
+        for _ in range(self.size):
+            slot = _Slot(self._new_client())
+            await slot.client.connect()
+            slot.checked_at = time.monotonic()
+            self._slots.append(slot)
+            self._idle.put_nowait(slot)
+
+    async def disconnect(self) -> None:
+        for slot in self._slots:
+            if slot.client.is_connected():
+                await slot.client.disconnect()
+        self._slots = []
+        self._idle = None
+        self._in_use = 0
+
+    async def _reconnect(self, slot: _Slot) -> None:
+        try:
+            if slot.client.is_connected():
+                await slot.client.disconnect()
+        except Exception:
+            pass
+        slot.client = self._new_client()
+        await slot.client.connect()
+        self._reconnects += 1
+
+    async def _ensure_healthy(self, slot: _Slot) -> None:
+        now = time.monotonic()
+        if not slot.suspect and now - slot.checked_at < self.health_check_interval:
+            return
+        try:
+            if not slot.client.is_connected():
+                raise ConnectionError("client not connected")
+            await slot.client.query_raw("SELECT 1")
+        except Exception:
+            await self._reconnect(slot)
+        slot.suspect = False
+        slot.checked_at = time.monotonic()
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[Prisma]:
+        if self._idle is None:
+            await self.connect()
+        started = time.monotonic()
+        self._waiting += 1
+        try:
+            slot = await asyncio.wait_for(self._idle.get(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            raise PoolTimeout(f"no Prisma client available after {self.acquire_timeout}s")
+        finally:
+            self._waiting -= 1
+        waited = time.monotonic() - started
+        self._acquired += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        self._in_use += 1
+        try:
+            await self._ensure_healthy(slot)
+            yield slot.client
+        except errors.DataError:
+            raise
+        except Exception as exc:
+            # HTTP errors raised by the route say nothing about the engine;
+            # anything else gets a health check on the next lease.
+            if not hasattr(exc, "status_code"):
+                slot.suspect = True
+            raise
+        finally:
+            self._in_use -= 1
+            if self._idle is not None:
+                self._idle.put_nowait(slot)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "in_use": self._in_use,
+            "idle": self._idle.qsize() if self._idle is not None else 0,
+            "waiting": self._waiting,
+            "acquired": self._acquired,
+            "timeouts": self._timeouts,
+            "reconnects": self._reconnects,
+            "wait_avg_ms": round(self._wait_total / self._acquired * 1000, 3) if self._acquired else 0.0,
+            "wait_max_ms": round(self._wait_max * 1000, 3),
+        }
+
+
+pool = PrismaPool()
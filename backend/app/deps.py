@@ -1,36 +1,113 @@
 from fastapi import Depends, HTTPException, Header
 from prisma import Prisma
+import hashlib
 import os
+import time
 import jwt
+from typing import Optional
+
+from .cache import TTLCache
+from .catalog import catalog
+from .changes import changes
+from .db import pool
+from .replicas import reads
 
 JWT_SECRET = os.getenv("JWT_SECRET", "change_me")
 JWT_ALG = "HS256"
 
+# Resolved users keyed by `sub`, and verified token payloads keyed by token digest.
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "20000"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+
 async def get_prisma() -> Prisma:
-    prisma = Prisma()
-    await prisma.connect()
-    try:
+    # Leased for the whole request: only for handlers that await nothing but
+    # queries (see app/db.py).
+    async with pool.acquire() as prisma:
         yield prisma
-    finally:
-        await prisma.disconnect()
 
-async def get_current_user(authorization: str = Header(None), prisma: Prisma = Depends(get_prisma)):
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Missing bearer token")
-    token = authorization.split(" ", 1)[1]
+def decode_token(token: str) -> dict:
+    digest = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(digest)
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid token")
+    # Never keep a payload around past the token's own expiry.
+    ttl = TOKEN_CACHE_TTL
+    if "exp" in payload:
+        ttl = min(ttl, payload["exp"] - time.time())
+    if ttl > 0:
+        token_cache.set(digest, payload, ttl=ttl)
+    return payload
+
+async def load_user(prisma: Prisma, uid: str):
+    user = user_cache.get(uid)
+    if user is None:
+        user = await prisma.user.find_unique(where={"id": uid})
+        if user:
+            user_cache.set(uid, user)
+    return user
+
+def invalidate_user(uid: str) -> None:
+    # Call after any write to a user row (role, profile, rewards), and
+    # publish a "user" change for the other workers.
+    user_cache.pop(uid)
+
+@changes.handler("user")
+async def users_changed(uids: list[str]):
+    for uid in uids:
+        user_cache.pop(uid)
+
+def invalidate_all_users() -> None:
+    user_cache.clear()
+
+async def get_current_user(authorization: str = Header(None)):
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Missing bearer token")
+    token = authorization.split(" ", 1)[1]
+    payload = decode_token(token)
     uid = str(payload.get("sub"))
-    user = await prisma.user.find_unique(where={"id": uid})
+    user = user_cache.get(uid)
+    if user is None:
+        # A lease of its own, handed back before the route takes its client,
+        # so a request never holds two.
+        async with pool.acquire() as prisma:
+            user = await load_user(prisma, uid)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
+def session_id(authorization: Optional[str]) -> Optional[str]:
+    # Read-your-writes is tracked per signed-in user.
+    if not authorization or not authorization.startswith("Bearer "):
+        return None
+    try:
+        payload = decode_token(authorization.split(" ", 1)[1])
+    except HTTPException:
+        return None
+    return str(payload.get("sub"))
+
+async def get_read_prisma(authorization: str = Header(None)) -> Prisma:
+    # For read-only routes: a replica when one has the caller's writes.
+    async with reads.acquire(session=session_id(authorization)) as prisma:
+        yield prisma
+
+def catalog_reader(authorization: str = Header(None)):
+    # Returns the lease unopened: catalog routes answer most requests from the
+    # snapshot and only take a client on a miss. Bodies built from it go into
+    # the snapshot, so they must also see the write that last invalidated it.
+    return lambda: reads.acquire(session=session_id(authorization), after=catalog.changed_at)
+
 def require_role(roles: set[str]):
     async def _dep(user = Depends(get_current_user)):
         if user.role not in roles:
             raise HTTPException(status_code=403, detail="Forbidden")
         return user
-    return _dep
\ No newline at end of file
+    return _dep
@@ -0,0 +1,204 @@
+import asyncio
+import heapq
+import logging
+import os
+import re
+import time
+from collections import defaultdict
+from datetime import timedelta
+from typing import Iterable, Optional
+
+from prisma import Prisma
+
+from .db import pool
+
+# ---------------------------
+# Delivery-partner assignment
+# ---------------------------
+# Orders are assigned in batches. Every partner sits in a min-heap keyed by
+# load / capacity (open orders over DELIVERY_PARTNER_CAPACITY), once
+# globally and once in the heap of their own zone. An order first takes the
+# least-loaded partner in its zone and falls back to the least-loaded
+# partner overall. Heaps are updated lazily: a popped entry whose load is
+# out of date is dropped, so each assignment costs O(log partners).
+# Assignments are written with one conditional update_many per partner per
+# batch, not one query per order.
+
+DELIVERY_PARTNER_CAPACITY = int(os.getenv("DELIVERY_PARTNER_CAPACITY", "50"))
+DISPATCH_BATCH_SIZE = int(os.getenv("DISPATCH_BATCH_SIZE", "5000"))
+DISPATCH_INTERVAL = float(os.getenv("DISPATCH_INTERVAL", "60"))  # 0 disables the periodic sweep
+# Without an explicit "Zone N", addresses are grouped on the first
+# DISPATCH_PREFIX_LEN characters of their last comma-separated part.
+DISPATCH_PREFIX_LEN = int(os.getenv("DISPATCH_PREFIX_LEN", "6"))
+OPEN_ORDER_STATUSES = ["pending", "shipped"]
+WRITE_CHUNK = 500
+
+log = logging.getLogger("cartify.dispatch")
+
+_ZONE_RE = re.compile(r"\bzone\s*([a-z0-9-]+)", re.IGNORECASE)
+
+
+def zone_of(address: Optional[str]) -> Optional[str]:
+    if not address:
+        return None
+    m = _ZONE_RE.search(address)
+    if m:
+        return f"zone:{m.group(1).lower()}"
+    tail = address.rsplit(",", 1)[-1].strip().lower()
+    return f"prefix:{tail[:DISPATCH_PREFIX_LEN]}" if tail else None
+
+
+class Dispatcher:
+    """Heap-based planner; holds partner loads across batches."""
+
+    def __init__(self, partners: Iterable, loads: dict[str, int], capacity: int = DELIVERY_PARTNER_CAPACITY, affinity: bool = True):
+        self.capacity = capacity
+        self.affinity = affinity
+        self.load: dict[str, int] = {}
+        self._global: list = []
+        self._zones: dict[str, list] = defaultdict(list)
+        self.zone_of_partner: dict[str, Optional[str]] = {}
+        for p in partners:
+            self.load[p.id] = loads.get(p.id, 0)
+            self.zone_of_partner[p.id] = zone_of(p.address) if affinity else None
+            self._push(p.id)
+        self.zone_hits = 0
+        self.fallbacks = 0
+
+    def _push(self, pid: str) -> None:
+        load = self.load[pid]
+        if load >= self.capacity:
+            return
+        entry = (load / self.capacity, load, pid)
+        heapq.heappush(self._global, entry)
+        zone = self.zone_of_partner[pid]
+        if zone is not None:
+            heapq.heappush(self._zones[zone], entry)
+
+    def _pop(self, heap: list) -> Optional[str]:
+        while heap:
+            _, load, pid = heapq.heappop(heap)
+            if load == self.load[pid]:
+                return pid
+        return None
+
+    def pick(self, address: Optional[str]) -> Optional[str]:
+        pid = None
+        if self.affinity:
+            zone = zone_of(address)
+            if zone in self._zones:
+                pid = self._pop(self._zones[zone])
+                if pid is not None:
+                    self.zone_hits += 1
+        if pid is None:
+            pid = self._pop(self._global)
+            if pid is None:
+                return None
+            if self.affinity:
+                self.fallbacks += 1
+        self.load[pid] += 1
+        self._push(pid)
+        return pid
+
+    def plan(self, orders: Iterable) -> tuple[dict[str, list[str]], list[str]]:
+        """Return ({partner id: [order ids]}, [order ids nobody had room for])."""
+        assigned: dict[str, list[str]] = defaultdict(list)
+        unassigned: list[str] = []
+        for o in orders:
+            pid = self.pick(o.shippingAddress)
+            if pid is None:
+                unassigned.append(o.id)
+            else:
+                assigned[pid].append(o.id)
+        return assigned, unassigned
+
+
+async def load_dispatcher(prisma: Prisma, capacity: int = DELIVERY_PARTNER_CAPACITY, affinity: bool = True) -> Dispatcher:
+    partners = await prisma.user.find_many(where={"role": "delivery"}, order={"id": "asc"})
+    loads: dict[str, int] = {}
+    if partners:
+        for row in await prisma.order.group_by(
+            by=["deliveryPartnerId"],
+            where={"deliveryPartnerId": {"in": [p.id for p in partners]}, "status": {"in": OPEN_ORDER_STATUSES}},
+            count=True,
+        ):
+            loads[row["deliveryPartnerId"]] = row["_count"]["_all"]
+    return Dispatcher(partners, loads, capacity=capacity, affinity=affinity)
+
+
+async def write_assignments(tx: Prisma, assigned: dict[str, list[str]]) -> int:
+    written = 0
+    for pid, order_ids in assigned.items():
+        for i in range(0, len(order_ids), WRITE_CHUNK):
+            # Conditional: an order assigned meanwhile keeps its partner.
+            written += await tx.order.update_many(
+                where={"id": {"in": order_ids[i:i + WRITE_CHUNK]}, "deliveryPartnerId": None},
+                data={"deliveryPartnerId": pid},
+            )
+    return written
+
+
+async def assign_pending(
+    prisma: Prisma,
+    batch_size: int = DISPATCH_BATCH_SIZE,
+    dry_run: bool = False,
+    affinity: bool = True,
+    capacity: int = DELIVERY_PARTNER_CAPACITY,
+    limit: Optional[int] = None,
+) -> dict:
+    """Assign unassigned pending orders in id order, batch_size at a time."""
+    started = time.perf_counter()
+    dispatcher = await load_dispatcher(prisma, capacity=capacity, affinity=affinity)
+    per_partner: dict[str, int] = defaultdict(int)
+    planned = written = unassigned = batches = 0
+    last_id = None
+    while limit is None or planned + unassigned < limit:
+        take = batch_size if limit is None else min(batch_size, limit - planned - unassigned)
+        where: dict = {"status": "pending", "deliveryPartnerId": None}
+        if last_id is not None:
+            # Keyset on id: in a dry run nothing is written, so the same rows
+            # would come back forever without it.
+            where["id"] = {"gt": last_id}
+        orders = await prisma.order.find_many(where=where, order={"id": "asc"}, take=take)
+        if not orders:
+            break
+        last_id = orders[-1].id
+        batches += 1
+        assigned, left = dispatcher.plan(orders)
+        planned += sum(len(ids) for ids in assigned.values())
+        unassigned += len(left)
+        for pid, ids in assigned.items():
+            per_partner[pid] += len(ids)
+        if not dry_run and assigned:
+            async with prisma.tx(timeout=timedelta(seconds=60)) as tx:
+                written += await write_assignments(tx, assigned)
+        if left and len(left) == len(orders):
+            # Every partner is at capacity.
+            break
+    return {
+        "dryRun": dry_run,
+        "partners": len(dispatcher.load),
+        "batches": batches,
+        "planned": planned,
+        "written": written,
+        "unassigned": unassigned,
+        "zoneHits": dispatcher.zone_hits,
+        "fallbacks": dispatcher.fallbacks,
+        "perPartner": dict(per_partner),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+async def run_dispatcher(interval: float = DISPATCH_INTERVAL) -> None:
+    # Catches orders the per-order jobs left unassigned (no partner had room).
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with pool.acquire() as prisma:
+                report = await assign_pending(prisma)
+            if report["planned"] or report["unassigned"]:
+                log.info("dispatch: %d assigned, %d unassigned in %.3fs", report["written"], report["unassigned"], report["seconds"])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("dispatch sweep failed")
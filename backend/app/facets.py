@@ -0,0 +1,184 @@
+import bisect
+import time
+from collections import Counter, OrderedDict
+from typing import Iterable, Optional
+
+# ---------------------------
+# Facet index
+# ---------------------------
+# Every product maps to one cell (category, price bucket, rating band,
+# discount band, in stock). The index keeps a count per cell, a few
+# thousand cells at most, so any combination of filters is answered by one
+# pass over the cells instead of a GROUP BY over Product. Counts follow the
+# usual faceted-navigation rule: a facet's own selection does not narrow
+# that facet, only the others. Recent answers are memoized, and a product
+# moving between cells patches them in place rather than dropping them.
+
+PRICE_EDGES = [0, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+RATING_EDGES = [0.0, 1.0, 2.0, 3.0, 4.0, 4.5]
+DISCOUNT_EDGES = [0, 1, 10, 25, 50]
+BUILD_BATCH = 1000
+QUERY_MEMO_SIZE = 256
+
+# Cell tuple positions.
+CATEGORY, PRICE, RATING, DISCOUNT, STOCK = range(5)
+FACETS = ("category", "price", "rating", "discount", "stock")
+
+
+def _labels(edges: list, unit: str = "") -> list[str]:
+    out = [f"{lo}-{hi}{unit}" for lo, hi in zip(edges, edges[1:])]
+    out.append(f"{edges[-1]}+{unit}")
+    return out
+
+
+PRICE_LABELS = _labels(PRICE_EDGES)
+RATING_LABELS = _labels(RATING_EDGES)
+DISCOUNT_LABELS = ["none"] + _labels(DISCOUNT_EDGES[1:], "%")
+STOCK_LABELS = ["out_of_stock", "in_stock"]
+
+
+def _band(edges: list, value) -> int:
+    return max(0, bisect.bisect_right(edges, value) - 1)
+
+
+def cell_of(p) -> tuple:
+    return (
+        p.categoryId,
+        _band(PRICE_EDGES, p.price),
+        _band(RATING_EDGES, p.rating or 0.0),
+        _band(DISCOUNT_EDGES, p.discount or 0),
+        p.stock > 0,
+    )
+
+
+class FacetIndex:
+    def __init__(self):
+        self._cell_of: dict[str, tuple] = {}
+        self._counts: Counter = Counter()
+        self._memo: "OrderedDict[tuple, list]" = OrderedDict()
+        self.built_at: Optional[float] = None
+        self.build_seconds = 0.0
+        self.queries = 0
+        self.memo_hits = 0
+
+    # -- maintenance -------------------------------------------------------
+
+    def _move(self, product_id: str, cell: Optional[tuple]) -> None:
+        old = self._cell_of.get(product_id)
+        if old == cell:
+            return
+        if old is not None:
+            self._counts[old] -= 1
+            if not self._counts[old]:
+                del self._counts[old]
+        if cell is None:
+            self._cell_of.pop(product_id, None)
+        else:
+            self._cell_of[product_id] = cell
+            self._counts[cell] += 1
+        # Patch memoized answers instead of dropping them.
+        for selected, raw in self._memo.items():
+            if old is not None:
+                _tally(raw, selected, old, -1)
+            if cell is not None:
+                _tally(raw, selected, cell, 1)
+
+    def add(self, product) -> None:
+        self._move(product.id, cell_of(product))
+
+    def remove(self, product_id: str) -> None:
+        self._move(product_id, None)
+
+    def set_stock(self, product_id: str, stock: int) -> None:
+        cell = self._cell_of.get(product_id)
+        if cell is not None and cell[STOCK] != (stock > 0):
+            self._move(product_id, cell[:STOCK] + (stock > 0,))
+
+    async def build(self, prisma) -> None:
+        started = time.perf_counter()
+        cells: dict[str, tuple] = {}
+        last_id = None
+        while True:
+            where = {"id": {"gt": last_id}} if last_id else {}
+            rows = await prisma.product.find_many(where=where, order={"id": "asc"}, take=BUILD_BATCH)
+            for p in rows:
+                cells[p.id] = cell_of(p)
+            if len(rows) < BUILD_BATCH:
+                break
+            last_id = rows[-1].id
+        self._cell_of = cells
+        self._counts = Counter(cells.values())
+        self._memo.clear()
+        self.built_at = time.time()
+        self.build_seconds = time.perf_counter() - started
+
+    # -- queries -----------------------------------------------------------
+
+    def query(
+        self,
+        categories: Iterable[Optional[int]] = (),
+        prices: Iterable[int] = (),
+        ratings: Iterable[int] = (),
+        discounts: Iterable[int] = (),
+        in_stock: Optional[bool] = None,
+    ) -> dict:
+        """Counts per facet value under the given selections (bucket indexes)."""
+        selected = (
+            frozenset(categories),
+            frozenset(prices),
+            frozenset(ratings),
+            frozenset(discounts),
+            frozenset() if in_stock is None else frozenset([in_stock]),
+        )
+        self.queries += 1
+        raw = self._memo.get(selected)
+        if raw is not None:
+            self._memo.move_to_end(selected)
+            self.memo_hits += 1
+        else:
+            raw = [0] + [Counter() for _ in FACETS]
+            for cell, n in self._counts.items():
+                _tally(raw, selected, cell, n)
+            self._memo[selected] = raw
+            while len(self._memo) > QUERY_MEMO_SIZE:
+                self._memo.popitem(last=False)
+
+        total, categories, prices, ratings, discounts, stock = raw
+        return {
+            "total": total,
+            "category": {("General" if k is None else str(k)): v for k, v in categories.items() if v},
+            "price": {PRICE_LABELS[k]: v for k, v in sorted(prices.items()) if v},
+            "rating": {RATING_LABELS[k]: v for k, v in sorted(ratings.items()) if v},
+            "discount": {DISCOUNT_LABELS[k]: v for k, v in sorted(discounts.items()) if v},
+            "stock": {STOCK_LABELS[k]: v for k, v in sorted(stock.items()) if v},
+        }
+
+    def stats(self) -> dict:
+        return {
+            "products": len(self._cell_of),
+            "cells": len(self._counts),
+            "queries": self.queries,
+            "memo_hits": self.memo_hits,
+            "build_seconds": round(self.build_seconds, 3),
+        }
+
+
+def _tally(raw: list, selected: tuple, cell: tuple, n: int) -> None:
+    """Add n products in `cell` to raw = [total, per-facet counters]."""
+    miss = -1
+    for i in range(5):
+        sel = selected[i]
+        if sel and cell[i] not in sel:
+            if miss >= 0:
+                return
+            miss = i
+    if miss < 0:
+        raw[0] += n
+        for i in range(5):
+            raw[i + 1][cell[i]] += n
+    else:
+        # Fails only its own facet's selection: still counts there.
+        raw[miss + 1][cell[miss]] += n
+
+
+facet_index = FacetIndex()
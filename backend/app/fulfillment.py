@@ -0,0 +1,80 @@
+import json
+import os
+import secrets
+from collections import defaultdict
+from typing import Iterable
+
+from prisma import Prisma
+
+from .analytics import roll_up_orders
+from .changes import changes
+from .deps import invalidate_user
+from .dispatch import load_dispatcher, write_assignments
+from .jobs import job_queue
+
+# ---------------------------
+# Post-order follow-up work
+# ---------------------------
+# Checkout enqueues one job of each type below per order, in the order's
+# own transaction, and returns. Handlers receive a batch of jobs and must
+# tolerate orders that were already processed.
+
+ORDER_JOB_TYPES = ("order.tracking", "order.rewards", "order.assign_partner", "order.rollup")
+
+# Reward points credited per REWARDS_UNIT of order total.
+REWARDS_UNIT = int(os.getenv("REWARDS_UNIT", "100"))
+
+
+async def enqueue_order_followups(tx: Prisma, order_ids: Iterable[str]) -> None:
+    payloads = [{"orderId": oid} for oid in order_ids]
+    for job_type in ORDER_JOB_TYPES:
+        await job_queue.enqueue(tx, job_type, payloads)
+
+
+def _order_ids(jobs: list) -> list[str]:
+    return [json.loads(j.payload)["orderId"] for j in jobs]
+
+
+def tracking_number() -> str:
+    return f"CTF{secrets.token_hex(6).upper()}"
+
+
+@job_queue.handler("order.tracking")
+async def assign_tracking_numbers(tx: Prisma, jobs: list) -> None:
+    for order in await tx.order.find_many(where={"id": {"in": _order_ids(jobs)}, "trackingNumber": None}):
+        await tx.order.update(where={"id": order.id}, data={"trackingNumber": tracking_number()})
+
+
+@job_queue.handler("order.rewards")
+async def credit_rewards(tx: Prisma, jobs: list):
+    points: dict[str, int] = defaultdict(int)
+    for order in await tx.order.find_many(where={"id": {"in": _order_ids(jobs)}}):
+        points[order.customerId] += order.total // REWARDS_UNIT
+    credited = [uid for uid, n in points.items() if n > 0]
+    if credited:
+        # rewards is nullable and NULL + n stays NULL.
+        await tx.user.update_many(where={"id": {"in": credited}, "rewards": None}, data={"rewards": 0})
+    for uid in credited:
+        await tx.user.update(where={"id": uid}, data={"rewards": {"increment": points[uid]}})
+    await changes.publish(tx, "user", credited)
+
+    def after_commit():
+        for uid in credited:
+            invalidate_user(uid)
+    return after_commit
+
+
+@job_queue.handler("order.assign_partner")
+async def assign_delivery_partners(tx: Prisma, jobs: list) -> None:
+    orders = await tx.order.find_many(where={"id": {"in": _order_ids(jobs)}, "deliveryPartnerId": None})
+    if not orders:
+        return
+    dispatcher = await load_dispatcher(tx)
+    # Orders nobody has room for are picked up by the periodic dispatch sweep.
+    assigned, _ = dispatcher.plan(orders)
+    await write_assignments(tx, assigned)
+
+
+@job_queue.handler("order.rollup")
+async def update_sales_rollups(tx: Prisma, jobs: list) -> None:
+    await roll_up_orders(tx, _order_ids(jobs))
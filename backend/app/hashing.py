@@ -0,0 +1,93 @@
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from passlib.context import CryptContext
+
+from .metrics import LatencyRecorder
+
+# ---------------------------
+# Password hashing off the event loop
+# ---------------------------
+# pbkdf2 is slow on purpose; running it inline in an async handler stalls
+# every other request on the worker. Hashes run on a bounded executor and
+# callers beyond the queue limit are rejected instead of piling up.
+
+pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+
+PASSWORD_POOL_KIND = os.getenv("PASSWORD_POOL_KIND", "thread")  # "thread" or "process"
+PASSWORD_POOL_WORKERS = int(os.getenv("PASSWORD_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_MAX_QUEUE = int(os.getenv("PASSWORD_MAX_QUEUE", "64"))
+
+
+class HasherBusy(Exception):
+    pass
+
+
+# Module-level so the process pool can pickle them.
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed: str) -> bool:
+    return pwd_context.verify(password, hashed)
+
+
+class PasswordHasher:
+    def __init__(self, kind: str = PASSWORD_POOL_KIND, workers: int = PASSWORD_POOL_WORKERS, max_queue: int = PASSWORD_MAX_QUEUE):
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self._executor: Optional[Executor] = None
+        self._slots = asyncio.Semaphore(self.workers)
+        self._pending = 0
+        self.rejected = 0
+        self.latency = {"hash": LatencyRecorder(), "verify": LatencyRecorder()}
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pwhash")
+        return self._executor
+
+    async def _run(self, op: str, fn, *args):
+        # Pending counts both running and queued calls.
+        if self._pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise HasherBusy(op)
+        self._pending += 1
+        try:
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                with self.latency[op].time():
+                    return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", _hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run("verify", _verify, password, hashed)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "pending": self._pending,
+            "rejected": self.rejected,
+            "hash": self.latency["hash"].stats(),
+            "verify": self.latency["verify"].stats(),
+        }
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,217 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import AsyncContextManager, Awaitable, Callable, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+from prisma import Prisma, errors
+from pydantic import BaseModel
+
+from .cache import TTLCache
+from .changes import changes
+from .db import pool
+
+# ---------------------------
+# Idempotency keys
+# ---------------------------
+# A client retrying a POST with the same Idempotency-Key gets the first
+# response back verbatim, without the handler running again. A retry that
+# arrives while the first attempt is still running waits for it. Results
+# (including 4xx errors) are kept for IDEMPOTENCY_TTL seconds; 5xx and
+# unexpected failures are not stored, so the client can retry them.
+# Keys are scoped per user by the caller.
+#
+# With several workers (the change feed on, see app/changes.py) a retry may
+# land on another process, so keys are also claimed in the IdempotencyKey
+# table: the first attempt inserts the row and fills in its response, and
+# an attempt elsewhere that finds the row waits for that and replays it. A
+# claim whose owner died is taken over after IDEMPOTENCY_CLAIM_TIMEOUT.
+
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "100000"))
+IDEMPOTENCY_SHARED = os.getenv("IDEMPOTENCY_SHARED", "1" if changes.enabled else "0") == "1"
+IDEMPOTENCY_CLAIM_TIMEOUT = float(os.getenv("IDEMPOTENCY_CLAIM_TIMEOUT", "300"))
+IDEMPOTENCY_POLL_INTERVAL = 0.1
+IDEMPOTENCY_SWEEP_INTERVAL = 300.0
+MAX_KEY_LENGTH = 255
+
+log = logging.getLogger("cartify.idempotency")
+
+
+class _Stored:
+    __slots__ = ("fingerprint", "status", "body")
+
+    def __init__(self, fingerprint: str, status: int, body: bytes):
+        self.fingerprint = fingerprint
+        self.status = status
+        self.body = body
+
+
+class IdempotencyStore:
+    def __init__(
+        self,
+        maxsize: int = IDEMPOTENCY_MAX_KEYS,
+        ttl: float = IDEMPOTENCY_TTL,
+        shared: bool = IDEMPOTENCY_SHARED,
+        lease: Callable[[], AsyncContextManager[Prisma]] = pool.acquire,
+    ):
+        self.ttl = ttl
+        self.shared = shared
+        self.lease = lease
+        self._done = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight: dict[str, tuple[str, asyncio.Future]] = {}
+        self.replays = 0
+        self.waits = 0
+        self.executions = 0
+        self.mismatches = 0
+
+    def _respond(self, stored: _Stored, replayed: bool) -> Response:
+        headers = {"Idempotent-Replayed": "true"} if replayed else {}
+        return Response(content=stored.body, status_code=stored.status, media_type="application/json", headers=headers)
+
+    def _mismatch(self) -> HTTPException:
+        self.mismatches += 1
+        return HTTPException(status_code=422, detail="Idempotency-Key reused with a different request")
+
+    async def run(self, key: str, payload: BaseModel, handler: Callable[[], Awaitable[BaseModel]]) -> Response:
+        if len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail="Idempotency-Key too long")
+        fingerprint = hashlib.sha256(payload.model_dump_json().encode()).hexdigest()
+
+        stored: Optional[_Stored] = self._done.get(key)
+        if stored is None and key in self._inflight:
+            first_fingerprint, future = self._inflight[key]
+            if first_fingerprint != fingerprint:
+                raise self._mismatch()
+            self.waits += 1
+            # shield: a waiter giving up must not cancel the original request.
+            stored = await asyncio.shield(future)
+        if stored is not None:
+            if stored.fingerprint != fingerprint:
+                raise self._mismatch()
+            self.replays += 1
+            return self._respond(stored, replayed=True)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = (fingerprint, future)
+        claimed = False
+        try:
+            # Retries on this worker wait on the future meanwhile.
+            stored = await self._claim(key, fingerprint) if self.shared else None
+            replayed = stored is not None
+            if replayed:
+                self.replays += 1
+            else:
+                claimed = self.shared
+                self.executions += 1
+                try:
+                    result = await handler()
+                    stored = _Stored(fingerprint, 200, result.model_dump_json().encode())
+                except HTTPException as exc:
+                    if exc.status_code >= 500:
+                        raise
+                    body = json.dumps(jsonable_encoder({"detail": exc.detail}), separators=(",", ":")).encode()
+                    stored = _Stored(fingerprint, exc.status_code, body)
+                if claimed:
+                    claimed = False
+                    await self._save(key, stored)
+            self._done.set(key, stored)
+            future.set_result(stored)
+            return self._respond(stored, replayed=replayed)
+        except BaseException as exc:
+            if claimed:
+                # Not stored, so a retry may run it again, here or elsewhere.
+                try:
+                    await asyncio.shield(self._release(key))
+                except Exception:
+                    log.exception("could not release idempotency key")
+            if not future.done():
+                future.set_exception(exc if isinstance(exc, Exception) else HTTPException(status_code=503, detail="Original request was cancelled"))
+                # Nobody may be waiting; don't let asyncio warn about it.
+                future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    # -- shared table --------------------------------------------------------
+
+    async def _claim(self, key: str, fingerprint: str) -> Optional[_Stored]:
+        """Claim the key for this attempt, or return another process's result."""
+        waited = False
+        while True:
+            now = datetime.now(timezone.utc)
+            async with self.lease() as prisma:
+                # Expired results, and claims whose owner never finished.
+                await prisma.idempotencykey.delete_many(where={"key": key, "OR": [
+                    {"createdAt": {"lt": now - timedelta(seconds=self.ttl)}},
+                    {"status": None, "createdAt": {"lt": now - timedelta(seconds=IDEMPOTENCY_CLAIM_TIMEOUT)}},
+                ]})
+                try:
+                    await prisma.idempotencykey.create(data={"key": key, "fingerprint": fingerprint})
+                    return None
+                except errors.UniqueViolationError:
+                    row = await prisma.idempotencykey.find_unique(where={"key": key})
+            if row is not None:
+                if row.fingerprint != fingerprint:
+                    raise self._mismatch()
+                if row.status is not None:
+                    return _Stored(row.fingerprint, row.status, row.body.encode())
+                if not waited:
+                    waited = True
+                    self.waits += 1
+            # Running elsewhere; no client is held while waiting.
+            await asyncio.sleep(IDEMPOTENCY_POLL_INTERVAL)
+
+    async def _save(self, key: str, stored: _Stored) -> None:
+        try:
+            async with self.lease() as prisma:
+                await prisma.idempotencykey.update_many(
+                    where={"key": key, "status": None},
+                    data={"status": stored.status, "body": stored.body.decode()},
+                )
+        except Exception:
+            # The handler's work is done; its claim expires after
+            # IDEMPOTENCY_CLAIM_TIMEOUT rather than letting a retry in now.
+            log.exception("could not store idempotency key")
+
+    async def _release(self, key: str) -> None:
+        async with self.lease() as prisma:
+            await prisma.idempotencykey.delete_many(where={"key": key, "status": None})
+
+    async def sweep(self, prisma: Prisma) -> int:
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+        return await prisma.idempotencykey.delete_many(where={"createdAt": {"lt": cutoff}})
+
+    def stats(self) -> dict:
+        # Replays include requests that waited on an in-flight original.
+        lookups = self.replays + self.executions
+        return {
+            "shared": self.shared,
+            "keys": len(self._done),
+            "inflight": len(self._inflight),
+            "executions": self.executions,
+            "replays": self.replays,
+            "inflight_waits": self.waits,
+            "mismatches": self.mismatches,
+            "hit_rate": round(self.replays / lookups, 4) if lookups else 0.0,
+        }
+
+
+idempotency = IdempotencyStore()
+
+
+async def run_idempotency_sweeper(interval: float = IDEMPOTENCY_SWEEP_INTERVAL) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with pool.acquire() as prisma:
+                await idempotency.sweep(prisma)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("idempotency sweep failed")
@@ -0,0 +1,268 @@
+import csv
+import json
+import time
+from datetime import datetime, timezone
+from typing import AsyncContextManager, AsyncIterator, Callable, Optional
+
+from prisma import Prisma
+from pydantic import AliasChoices, BaseModel, Field, ValidationError
+
+# ---------------------------
+# Bulk product import
+# ---------------------------
+# Rows are parsed as they stream in, validated one by one and inserted with
+# create_many in batches. A bad row is recorded and skipped; a batch the
+# database rejects is retried row by row so only the offending rows fail.
+# Progress is checkpointed in ProductImport after every batch, so a failed
+# upload can be resumed by sending the same file with the same importId.
+# The failed count is saved only with the checkpoint it belongs to; rows
+# past the last checkpoint are read again on resume and counted then.
+#
+# The importer takes a client per step from `lease` rather than holding
+# one for the whole upload, which can take minutes.
+
+IMPORT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+# What iter_lines decodes an invalid UTF-8 sequence to.
+REPLACEMENT_CHAR = "\ufffd"
+
+
+class ImportRow(BaseModel):
+    title: str = Field(validation_alias=AliasChoices("title", "name"), min_length=1)
+    description: str = ""
+    category: str = "General"
+    price: float = Field(ge=0)
+    image: str = ""
+    stock: int = Field(100, ge=0)
+    comparePrice: Optional[int] = None
+    discount: Optional[int] = None
+    tags: Optional[str] = None
+    deliveryTime: Optional[int] = None
+    trending: Optional[bool] = None
+
+
+class ImportReport:
+    def __init__(self, import_id: str, resumed_from: int):
+        self.import_id = import_id
+        self.resumed_from = resumed_from
+        self.last_record = resumed_from
+        self.inserted = 0
+        self.failed = 0
+        self.errors: list[dict] = []
+        self.started = time.perf_counter()
+
+    def error(self, record: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"record": record, "error": message})
+
+    def as_dict(self, status: str) -> dict:
+        elapsed = time.perf_counter() - self.started
+        processed = self.inserted + self.failed
+        return {
+            "importId": self.import_id,
+            "status": status,
+            "resumedFrom": self.resumed_from,
+            "lastRecord": self.last_record,
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": self.errors,
+            "elapsedSeconds": round(elapsed, 3),
+            "rowsPerSecond": round(processed / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    # Invalid bytes are replaced rather than raised, so they fail their own
+    # record in iter_records instead of aborting the import.
+    buf = b""
+    async for chunk in chunks:
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8", errors="replace").rstrip("\r")
+    if buf:
+        yield buf.decode("utf-8", errors="replace").rstrip("\r")
+
+
+async def iter_records(lines: AsyncIterator[str], fmt: str) -> AsyncIterator[tuple[int, object]]:
+    """Yield (record number, dict or parse error message), numbering from 1."""
+    record = 0
+    if fmt == "ndjson":
+        async for line in lines:
+            if not line.strip():
+                continue
+            record += 1
+            if REPLACEMENT_CHAR in line:
+                yield record, "invalid UTF-8"
+                continue
+            try:
+                yield record, json.loads(line)
+            except ValueError as exc:
+                yield record, f"invalid JSON: {exc}"
+        return
+
+    header: Optional[list[str]] = None
+    pending = ""
+    async for line in lines:
+        # A quoted field may span lines: wait until the quotes balance.
+        pending = f"{pending}\n{line}" if pending else line
+        if pending.count('"') % 2:
+            continue
+        text, pending = pending, ""
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [h.strip() for h in values]
+            continue
+        record += 1
+        if REPLACEMENT_CHAR in text:
+            yield record, "invalid UTF-8"
+            continue
+        if len(values) != len(header):
+            yield record, f"expected {len(header)} columns, got {len(values)}"
+            continue
+        yield record, {k: v for k, v in zip(header, values) if v != ""}
+
+
+class ProductImporter:
+    def __init__(
+        self,
+        lease: Callable[[], AsyncContextManager[Prisma]],
+        seller_id: str,
+        batch_size: int = IMPORT_BATCH_SIZE,
+    ):
+        self.lease = lease
+        self.seller_id = seller_id
+        self.batch_size = batch_size
+        self._categories: dict[str, int] = {}
+        self.import_id: Optional[str] = None
+        self.started_at: Optional[datetime] = None
+
+    async def _load_categories(self) -> None:
+        async with self.lease() as prisma:
+            self._categories = {c.name: c.id for c in await prisma.category.find_many()}
+
+    async def _category_id(self, name: str) -> int:
+        cat_id = self._categories.get(name)
+        if cat_id is None:
+            async with self.lease() as prisma:
+                cat = await prisma.category.upsert(
+                    where={"name": name},
+                    data={"create": {"name": name}, "update": {}},
+                )
+            cat_id = self._categories[name] = cat.id
+        return cat_id
+
+    async def _row_data(self, row: ImportRow) -> dict:
+        data = {
+            "name": row.title,
+            "description": row.description,
+            "categoryId": await self._category_id(row.category),
+            "price": int(row.price),
+            "image": row.image,
+            "sellerId": self.seller_id,
+            "rating": 0.0,
+            "reviews": 0,
+            "stock": row.stock,
+        }
+        for field in ("comparePrice", "discount", "tags", "deliveryTime", "trending"):
+            value = getattr(row, field)
+            if value is not None:
+                data[field] = value
+        return data
+
+    async def _flush(self, batch: list[tuple[int, dict]], report: ImportReport) -> None:
+        if not batch:
+            return
+        async with self.lease() as prisma:
+            try:
+                async with prisma.tx() as tx:
+                    await tx.product.create_many(data=[d for _, d in batch])
+                    await tx.productimport.update(
+                        where={"id": report.import_id},
+                        data={"lastRecord": batch[-1][0], "inserted": {"increment": len(batch)}, "failed": report.failed},
+                    )
+                report.inserted += len(batch)
+            except Exception:
+                # Isolate the rows the database refuses.
+                for record, data in batch:
+                    try:
+                        await prisma.product.create(data=data)
+                        report.inserted += 1
+                    except Exception as exc:
+                        report.error(record, str(exc))
+                await prisma.productimport.update(
+                    where={"id": report.import_id},
+                    data={"lastRecord": batch[-1][0], "inserted": report.inserted, "failed": report.failed},
+                )
+        report.last_record = batch[-1][0]
+
+    async def run(self, records: AsyncIterator[tuple[int, object]], import_id: Optional[str] = None) -> dict:
+        self.started_at = datetime.now(timezone.utc)
+        async with self.lease() as prisma:
+            job = None
+            if import_id:
+                job = await prisma.productimport.find_unique(where={"id": import_id})
+                if job and job.sellerId != self.seller_id:
+                    raise PermissionError("import belongs to another seller")
+            if job is None:
+                job = await prisma.productimport.create(data={"sellerId": self.seller_id, "status": "running"})
+            else:
+                await prisma.productimport.update(where={"id": job.id}, data={"status": "running"})
+
+        self.import_id = job.id
+        report = ImportReport(job.id, job.lastRecord)
+        report.inserted = job.inserted
+        report.failed = job.failed
+        await self._load_categories()
+
+        batch: list[tuple[int, dict]] = []
+        last_seen = job.lastRecord
+        status = "failed"
+        try:
+            async for record, raw in records:
+                if record <= job.lastRecord:
+                    continue
+                last_seen = record
+                if isinstance(raw, str):
+                    report.error(record, raw)
+                    continue
+                try:
+                    row = ImportRow.model_validate(raw)
+                except ValidationError as exc:
+                    report.error(record, "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in exc.errors()))
+                    continue
+                batch.append((record, await self._row_data(row)))
+                if len(batch) >= self.batch_size:
+                    await self._flush(batch, report)
+                    batch = []
+            await self._flush(batch, report)
+            status = "completed"
+        finally:
+            data = {"status": status}
+            if status == "completed":
+                # Rejected rows after the last good one belong to this final checkpoint.
+                report.last_record = last_seen
+                data.update(lastRecord=last_seen, failed=report.failed)
+            async with self.lease() as prisma:
+                await prisma.productimport.update(where={"id": job.id}, data=data)
+        return report.as_dict(status)
+
+    async def imported_products(self, page_size: int = IMPORT_BATCH_SIZE) -> AsyncIterator:
+        """Yield the products this run created, a page (and lease) at a time."""
+        if self.started_at is None:
+            return
+        last_id = None
+        while True:
+            where = {"sellerId": self.seller_id, "createdAt": {"gte": self.started_at}}
+            if last_id:
+                where["id"] = {"gt": last_id}
+            async with self.lease() as prisma:
+                rows = await prisma.product.find_many(where=where, order={"id": "asc"}, take=page_size)
+            for row in rows:
+                yield row
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1].id
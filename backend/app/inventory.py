@@ -0,0 +1,188 @@
+import asyncio
+import os
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+from prisma import Prisma
+
+from .catalog import catalog
+from .changes import changes
+from .db import pool
+from .facets import facet_index
+
+# ---------------------------
+# Stock reservation
+# ---------------------------
+# Stock is only ever changed with conditional updates
+# (UPDATE ... SET stock = stock - n WHERE id = ? AND stock >= n), so two
+# checkouts racing for the last unit cannot both win and nobody holds a
+# lock between a read and a write. All lines of a cart are reserved in the
+# caller's transaction: the first line that cannot be satisfied raises
+# OutOfStock and the whole transaction rolls back.
+#
+# Holds take stock out of circulation for HOLD_TTL_SECONDS while a customer
+# is checking out; a sweeper returns expired holds to stock.
+
+HOLD_TTL_SECONDS = int(os.getenv("HOLD_TTL_SECONDS", "900"))
+HOLD_SWEEP_INTERVAL = float(os.getenv("HOLD_SWEEP_INTERVAL", "30"))
+HOLD_SWEEP_BATCH = 500
+
+
+class OutOfStock(Exception):
+    def __init__(self, product_id: str, requested: int):
+        super().__init__(product_id)
+        self.product_id = product_id
+        self.requested = requested
+
+
+def line_quantities(items: Iterable) -> dict[str, int]:
+    quantities: Counter = Counter()
+    for it in items:
+        quantities[it.productId] += it.quantity
+    return dict(quantities)
+
+
+async def reserve_stock(tx: Prisma, quantities: dict[str, int]) -> None:
+    # Fixed order keeps concurrent multi-line reservations from deadlocking.
+    for product_id in sorted(quantities):
+        qty = quantities[product_id]
+        updated = await tx.product.update_many(
+            where={"id": product_id, "stock": {"gte": qty}},
+            data={"stock": {"decrement": qty}},
+        )
+        if updated == 0:
+            raise OutOfStock(product_id, qty)
+
+
+async def try_reserve_stock(tx: Prisma, quantities: dict[str, int]) -> Optional[str]:
+    """Reserve one order's lines inside a transaction shared with other orders.
+
+    On a shortfall the lines already taken are put back and the product id
+    that ran out is returned, so the other orders in the transaction stand.
+    """
+    taken: dict[str, int] = {}
+    for product_id in sorted(quantities):
+        qty = quantities[product_id]
+        updated = await tx.product.update_many(
+            where={"id": product_id, "stock": {"gte": qty}},
+            data={"stock": {"decrement": qty}},
+        )
+        if updated == 0:
+            await release_stock(tx, taken)
+            return product_id
+        taken[product_id] = qty
+    return None
+
+
+async def release_stock(tx: Prisma, quantities: dict[str, int]) -> None:
+    for product_id in sorted(quantities):
+        await tx.product.update_many(
+            where={"id": product_id},
+            data={"stock": {"increment": quantities[product_id]}},
+        )
+
+
+async def refresh_sold_out(prisma: Prisma, product_ids: Iterable[str]) -> None:
+    # Cached "in stock" pages and stock facet counts go stale when a
+    # product sells out or comes back.
+    sold_out = []
+    for p in await prisma.product.find_many(where={"id": {"in": list(product_ids)}}):
+        facet_index.set_stock(p.id, p.stock)
+        if p.stock <= 0:
+            sold_out.append(p.id)
+    if sold_out:
+        catalog.invalidate_pages()
+        await changes.publish(prisma, "stock", sold_out)
+
+
+# ---------------------------
+# Holds
+# ---------------------------
+
+async def create_hold(prisma: Prisma, customer_id: str, quantities: dict[str, int], ttl: int = HOLD_TTL_SECONDS) -> tuple[str, datetime]:
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+    async with prisma.tx() as tx:
+        await reserve_stock(tx, quantities)
+        reservation = await tx.stockreservation.create(data={
+            "customerId": customer_id,
+            "status": "held",
+            "expiresAt": expires_at,
+            "items": {"create": [{"productId": pid, "quantity": qty} for pid, qty in quantities.items()]},
+        })
+    await refresh_sold_out(prisma, quantities)
+    return reservation.id, expires_at
+
+
+async def claim_hold(tx: Prisma, reservation_id: str, customer_id: str) -> Optional[dict[str, int]]:
+    """Mark a live hold as committed and return its quantities, or None if it is gone."""
+    claimed = await tx.stockreservation.update_many(
+        where={
+            "id": reservation_id,
+            "customerId": customer_id,
+            "status": "held",
+            "expiresAt": {"gt": datetime.now(timezone.utc)},
+        },
+        data={"status": "committed"},
+    )
+    if claimed == 0:
+        return None
+    items = await tx.stockreservationitem.find_many(where={"reservationId": reservation_id})
+    return {i.productId: i.quantity for i in items}
+
+
+async def unclaim_hold(tx: Prisma, reservation_id: str) -> None:
+    # Undo claim_hold within the same transaction; the hold is live again.
+    await tx.stockreservation.update_many(where={"id": reservation_id, "status": "committed"}, data={"status": "held"})
+
+
+async def release_hold(prisma: Prisma, reservation_id: str, customer_id: Optional[str] = None) -> bool:
+    where = {"id": reservation_id, "status": "held"}
+    if customer_id is not None:
+        where["customerId"] = customer_id
+    async with prisma.tx() as tx:
+        # The status flip is the guard: only one releaser gets count == 1.
+        if await tx.stockreservation.update_many(where=where, data={"status": "released"}) == 0:
+            return False
+        items = await tx.stockreservationitem.find_many(where={"reservationId": reservation_id})
+        await release_stock(tx, {i.productId: i.quantity for i in items})
+    catalog.invalidate_pages()
+    for p in await prisma.product.find_many(where={"id": {"in": [i.productId for i in items]}}):
+        facet_index.set_stock(p.id, p.stock)
+    await changes.publish(prisma, "stock", [i.productId for i in items])
+    return True
+
+
+@changes.handler("stock")
+async def stock_changed(product_ids: list[str]) -> None:
+    # Sold out or back in stock on another worker.
+    catalog.invalidate_pages()
+    async with pool.acquire() as prisma:
+        rows = await prisma.product.find_many(where={"id": {"in": product_ids}})
+    for p in rows:
+        facet_index.set_stock(p.id, p.stock)
+
+
+async def sweep_expired_holds(prisma: Prisma) -> int:
+    expired = await prisma.stockreservation.find_many(
+        where={"status": "held", "expiresAt": {"lte": datetime.now(timezone.utc)}},
+        take=HOLD_SWEEP_BATCH,
+    )
+    released = 0
+    for r in expired:
+        if await release_hold(prisma, r.id):
+            released += 1
+    return released
+
+
+async def run_hold_sweeper(interval: float = HOLD_SWEEP_INTERVAL) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with pool.acquire() as prisma:
+                await sweep_expired_holds(prisma)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Try again next tick; holds only stay out of stock a little longer.
+            pass
@@ -0,0 +1,238 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Iterable, Optional
+
+from prisma import Prisma
+
+from .db import pool
+from .metrics import LatencyRecorder
+
+# ---------------------------
+# Background jobs
+# ---------------------------
+# Jobs are rows in the Job table, written in the same transaction as the
+# change that needs them, so follow-up work is never lost or run for a
+# rolled-back order. Workers claim due jobs of one type at a time, up to
+# JOB_BATCH_SIZE, by stamping them with a lease token (a conditional
+# update, so several processes can share the table). The batch handler
+# runs in one transaction with the deletion of its jobs, so its effects
+# land exactly once. If a batch fails, its jobs are retried one by one to
+# isolate the bad one. A failed job goes back to the queue with exponential
+# backoff and is dead-lettered (status "dead") after JOB_MAX_ATTEMPTS.
+#
+# A worker that outlives JOB_LEASE_SECONDS has its jobs requeued and maybe
+# claimed by another. Deleting and failing jobs is therefore conditional on
+# the lease: if any job of the batch has changed hands, the transaction
+# rolls back and only the new owner's run takes effect.
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "100"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_BACKOFF_BASE = float(os.getenv("JOB_BACKOFF_BASE", "2"))
+JOB_BACKOFF_MAX = float(os.getenv("JOB_BACKOFF_MAX", "600"))
+# A claim older than this is assumed to belong to a crashed worker.
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+
+log = logging.getLogger("cartify.jobs")
+
+# handler(tx, jobs) runs inside the transaction that deletes the jobs. It may
+# return a callable to run once that transaction has committed.
+Handler = Callable[[Prisma, list], Awaitable[Optional[Callable[[], None]]]]
+
+
+class LeaseLost(Exception):
+    pass
+
+
+def backoff_seconds(attempts: int) -> float:
+    delay = min(JOB_BACKOFF_MAX, JOB_BACKOFF_BASE ** attempts)
+    return delay * random.uniform(0.5, 1.0)
+
+
+class JobQueue:
+    def __init__(self, batch_size: int = JOB_BATCH_SIZE, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.handlers: dict[str, Handler] = {}
+        self._wake = asyncio.Event()
+        self.lag = LatencyRecorder()
+        self.run_time = LatencyRecorder()
+        self.completed = 0
+        self.retried = 0
+        self.dead = 0
+        self.lease_lost = 0
+        self.batches = 0
+        self.depth = 0
+        self._started = time.monotonic()
+
+    def handler(self, job_type: str):
+        """Register a batch handler for a job type."""
+        def register(fn: Handler) -> Handler:
+            self.handlers[job_type] = fn
+            return fn
+        return register
+
+    # -- producing ---------------------------------------------------------
+
+    async def enqueue(self, tx: Prisma, job_type: str, payloads: Iterable[dict], delay: float = 0) -> int:
+        run_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+        rows = [{"type": job_type, "payload": json.dumps(p, separators=(",", ":")), "runAt": run_at} for p in payloads]
+        if not rows:
+            return 0
+        await tx.job.create_many(data=rows)
+        return len(rows)
+
+    def notify(self) -> None:
+        # Call after the enqueuing transaction commits.
+        self._wake.set()
+
+    # -- consuming ---------------------------------------------------------
+
+    async def claim(self, prisma: Prisma) -> tuple[str, list]:
+        now = datetime.now(timezone.utc)
+        due = {"status": "queued", "runAt": {"lte": now}, "type": {"in": list(self.handlers)}}
+        oldest = await prisma.job.find_first(where=due, order=[{"runAt": "asc"}, {"id": "asc"}])
+        if oldest is None:
+            return "", []
+        candidates = await prisma.job.find_many(
+            where={**due, "type": oldest.type},
+            order=[{"runAt": "asc"}, {"id": "asc"}],
+            take=self.batch_size,
+        )
+        lease = uuid.uuid4().hex
+        await prisma.job.update_many(
+            where={"id": {"in": [j.id for j in candidates]}, "status": "queued"},
+            data={"status": "running", "lease": lease, "leasedAt": now},
+        )
+        # Only what this lease actually won; another process may have raced us.
+        jobs = await prisma.job.find_many(where={"lease": lease}, order={"id": "asc"})
+        for j in jobs:
+            self.lag.observe(max(0.0, (now - j.runAt).total_seconds()))
+        return oldest.type, jobs
+
+    async def _apply(self, prisma: Prisma, handler: Handler, jobs: list) -> None:
+        # The handler's writes and the job deletion commit together, so a
+        # job's effects are applied exactly once.
+        async with prisma.tx(timeout=timedelta(seconds=60)) as tx:
+            after_commit = await handler(tx, jobs)
+            deleted = await tx.job.delete_many(where={"id": {"in": [j.id for j in jobs]}, "lease": jobs[0].lease})
+            if deleted != len(jobs):
+                raise LeaseLost(f"{len(jobs) - deleted} of {len(jobs)} {jobs[0].type} jobs were requeued")
+        self.completed += len(jobs)
+        if after_commit is not None:
+            after_commit()
+
+    async def _fail(self, prisma: Prisma, job, exc: Exception) -> None:
+        attempts = job.attempts + 1
+        error = f"{exc.__class__.__name__}: {exc}"[:1000]
+        mine = {"id": job.id, "lease": job.lease}
+        if attempts >= self.max_attempts:
+            if await prisma.job.update_many(where=mine, data={"status": "dead", "attempts": attempts, "lastError": error, "lease": None}):
+                self.dead += 1
+                log.error("job %s (%s) dead after %d attempts: %s", job.id, job.type, attempts, error)
+            return
+        run_at = datetime.now(timezone.utc) + timedelta(seconds=backoff_seconds(attempts))
+        if await prisma.job.update_many(where=mine, data={"status": "queued", "attempts": attempts, "lastError": error, "runAt": run_at, "lease": None}):
+            self.retried += 1
+
+    async def run_batch(self, prisma: Prisma, job_type: str, jobs: list) -> None:
+        handler = self.handlers[job_type]
+        self.batches += 1
+        with self.run_time.time():
+            try:
+                await self._apply(prisma, handler, jobs)
+            except Exception as exc:
+                if len(jobs) == 1:
+                    await self._fail_unless_lost(prisma, jobs[0], exc)
+                    return
+                # Isolate the failing job(s), and any that changed hands.
+                for job in jobs:
+                    try:
+                        await self._apply(prisma, handler, [job])
+                    except Exception as exc:
+                        await self._fail_unless_lost(prisma, job, exc)
+
+    async def _fail_unless_lost(self, prisma: Prisma, job, exc: Exception) -> None:
+        if isinstance(exc, LeaseLost):
+            # Its new owner runs it; nothing of ours was committed.
+            self.lease_lost += 1
+            log.warning("job %s (%s) was requeued while running; dropping this run", job.id, job.type)
+            return
+        await self._fail(prisma, job, exc)
+
+    async def run_once(self, prisma: Prisma) -> int:
+        job_type, jobs = await self.claim(prisma)
+        if jobs:
+            await self.run_batch(prisma, job_type, jobs)
+        return len(jobs)
+
+    async def requeue_stale(self, prisma: Prisma) -> int:
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=JOB_LEASE_SECONDS)
+        return await prisma.job.update_many(
+            where={"status": "running", "leasedAt": {"lt": cutoff}},
+            data={"status": "queued", "lease": None},
+        )
+
+    async def refresh_depth(self, prisma: Prisma) -> None:
+        self.depth = await prisma.job.count(where={"status": "queued"})
+
+    async def worker(self, poll_interval: float = JOB_POLL_INTERVAL) -> None:
+        while True:
+            try:
+                async with pool.acquire() as prisma:
+                    done = await self.run_once(prisma)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("job worker iteration failed")
+                done = 0
+            if done:
+                continue
+            # Idle: sleep until new work is announced or the next poll.
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def maintenance(self, interval: float = 30.0) -> None:
+        while True:
+            try:
+                async with pool.acquire() as prisma:
+                    await self.requeue_stale(prisma)
+                    await self.refresh_depth(prisma)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("job maintenance failed")
+            await asyncio.sleep(interval)
+
+    def start(self, workers: int = JOB_WORKERS) -> list[asyncio.Task]:
+        self._started = time.monotonic()
+        tasks = [asyncio.create_task(self.worker()) for _ in range(workers)]
+        tasks.append(asyncio.create_task(self.maintenance()))
+        return tasks
+
+    def stats(self) -> dict:
+        uptime = max(time.monotonic() - self._started, 1e-9)
+        return {
+            "depth": self.depth,
+            "completed": self.completed,
+            "retried": self.retried,
+            "dead": self.dead,
+            "lease_lost": self.lease_lost,
+            "batches": self.batches,
+            "throughput_per_s": round(self.completed / uptime, 3),
+            "lag": self.lag.stats(),
+            "run_time": self.run_time.stats(),
+        }
+
+
+job_queue = JobQueue()
@@ -1,23 +1,98 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
-from prisma import Prisma
+import asyncio
+import os
+import time
 
-from .routers import auth, products, orders, admin
+from .admission import AdmissionMiddleware, controller, login_limiter
+from .carts import carts, run_cart_flusher
+from .catalog import catalog
+from .changes import changes
+from .db import pool, PoolTimeout
+from .dispatch import DISPATCH_INTERVAL, run_dispatcher
+from .facets import facet_index
+from .deps import session_id, user_cache, token_cache
+from .hashing import hasher, HasherBusy
+from .idempotency import idempotency, run_idempotency_sweeper
+from .inventory import run_hold_sweeper
+from .jobs import job_queue
+from .metrics import MetricsMiddleware, registry
+from .replicas import ReadYourWritesMiddleware, reads
+from .search import search_index
+from .trending import TRENDING_INTERVAL, run_trending_job, trending
+from .warmup import WARMUP, warm_up
+from .routers import auth, products, orders, admin, cart
 
-# Global Prisma instance
-prisma = Prisma()
+# Per-phase startup timings for this worker, exported under "startup".
+startup_report: dict = {}
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    await prisma.connect()
+    # app/server.py runs the singleton loops in one worker only; a bare
+    # `uvicorn app.main:app` process runs them all.
+    leader = os.getenv("CARTIFY_LEADER", "1") != "0"
+    started = time.perf_counter()
+    await pool.connect()
+    await reads.connect()
+    # Before the indexes load, so no other worker's change is missed.
+    await changes.connect()
+    connected = time.perf_counter()
+    await search_index.load_or_build()
+    async with pool.acquire() as prisma:
+        await facet_index.build(prisma)
+    indexed = time.perf_counter()
+    cart_flusher = asyncio.create_task(run_cart_flusher())
+    job_workers = job_queue.start()
+    if reads.enabled:
+        job_workers.append(asyncio.create_task(reads.run()))
+    if changes.enabled:
+        job_workers.append(changes.start(leader=leader))
+    if leader:
+        job_workers.append(asyncio.create_task(run_hold_sweeper()))
+        if idempotency.shared:
+            job_workers.append(asyncio.create_task(run_idempotency_sweeper()))
+        if DISPATCH_INTERVAL > 0:
+            job_workers.append(asyncio.create_task(run_dispatcher()))
+        if TRENDING_INTERVAL > 0:
+            job_workers.append(asyncio.create_task(run_trending_job()))
+    warmup = await warm_up(app) if WARMUP else {}
+    startup_report.update(
+        leader=leader,
+        connect_seconds=round(connected - started, 3),
+        indexes_seconds=round(indexed - connected, 3),
+        warmup_seconds=warmup.get("seconds", 0.0),
+        warmup_failed=warmup.get("failed", 0),
+        total_seconds=round(time.perf_counter() - started, 3),
+    )
     yield
     # Shutdown
-    await prisma.disconnect()
+    cart_flusher.cancel()
+    for task in job_workers:
+        task.cancel()
+    # Let them unwind first: a flush cut short re-marks its carts dirty, and
+    # the final flush must not overlap one still running.
+    await asyncio.gather(cart_flusher, *job_workers, return_exceptions=True)
+    # Write-behind carts must reach the database before the pool closes.
+    async with pool.acquire() as prisma:
+        await carts.flush(prisma)
+    if leader:
+        search_index.save_snapshot()
+    await reads.disconnect()
+    await pool.disconnect()
+    hasher.shutdown()
 
 app = FastAPI(lifespan=lifespan)
 
+# Admission control. Added first so it sits innermost: CORS preflights are
+# answered before admission, and shed responses still get CORS headers.
+app.add_middleware(AdmissionMiddleware)
+
+# Pins a session's reads to the primary until a replica has its writes.
+app.add_middleware(ReadYourWritesMiddleware, session_of=session_id)
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -26,12 +101,24 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 # Include Routers
 app.include_router(auth.router, prefix="/auth", tags=["Auth"])
 app.include_router(products.router, prefix="/products", tags=["Products"])
 app.include_router(orders.router, prefix="/orders", tags=["Orders"])
 app.include_router(admin.router, prefix="/admin", tags=["Admin"])
+app.include_router(cart.router, prefix="/cart", tags=["Cart"])
+
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    return JSONResponse(status_code=503, content={"detail": "Database busy, retry shortly"}, headers={"Retry-After": "1"})
+
+
+@app.exception_handler(HasherBusy)
+async def hasher_busy_handler(request: Request, exc: HasherBusy):
+    return JSONResponse(status_code=503, content={"detail": "Too many authentication requests, retry shortly"}, headers={"Retry-After": "1"})
 
 
 @app.get("/")
@@ -39,5 +126,33 @@ def home():
     return {"message": "Cartify backend running successfully!"}
 
 
+registry.register("startup", lambda: startup_report)
+registry.register("db_pool", pool.stats)
+registry.register("read_replicas", reads.stats)
+registry.register("user_cache", user_cache.stats)
+registry.register("token_cache", token_cache.stats)
+registry.register("password_hasher", hasher.stats)
+registry.register("catalog", catalog.stats)
+registry.register("search_index", search_index.stats)
+registry.register("facets", facet_index.stats)
+registry.register("idempotency", idempotency.stats)
+registry.register("changes", changes.stats)
+registry.register("carts", carts.stats)
+registry.register("jobs", job_queue.stats)
+registry.register("trending", trending.stats)
+registry.register("admission", controller.stats)
+registry.register("login_rate_limit", login_limiter.stats)
+
+
+@app.get("/stats")
+def stats():
+    return registry.snapshot()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 
 
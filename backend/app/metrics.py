@@ -0,0 +1,242 @@
+import bisect
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+# ---------------------------
+# Latency recording
+# ---------------------------
+
+class LatencyRecorder:
+    def __init__(self, window: int = 2048):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._recent: deque = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self._recent.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        if not self._recent:
+            return 0.0
+        ordered = sorted(self._recent)
+        idx = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[idx]
+
+    def time(self):
+        return _Timer(self)
+
+    def stats(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(0.50) * 1000, 3),
+            "p95_ms": round(self.percentile(0.95) * 1000, 3),
+            "p99_ms": round(self.percentile(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+class _Timer:
+    def __init__(self, recorder: LatencyRecorder):
+        self.recorder = recorder
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.observe(time.perf_counter() - self.started)
+        return False
+
+
+# ---------------------------
+# Request / DB instrumentation
+# ---------------------------
+# A pure ASGI middleware times every request under its route template and
+# counts the Prisma queries issued while serving it (InstrumentedPrisma in
+# db.py reports each one here through a context variable). Everything is
+# exposed in Prometheus text format on /metrics.
+
+METRICS_SLOW_REQUEST_MS = float(os.getenv("METRICS_SLOW_REQUEST_MS", "0"))  # 0 disables
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+slow_log = logging.getLogger("cartify.slow")
+
+
+class Histogram:
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+
+    def cumulative(self):
+        running = 0
+        for bound, n in zip(self.buckets, self.counts):
+            running += n
+            yield bound, running
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds", "breakdown")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.breakdown: dict[str, list] = {}
+
+
+_current_request: ContextVar[Optional[RequestStats]] = ContextVar("cartify_request_stats", default=None)
+
+
+class Registry:
+    def __init__(self):
+        self.in_flight = 0
+        self.requests: dict[tuple, Histogram] = {}
+        self.statuses: dict[tuple, int] = defaultdict(int)
+        self.request_queries: dict[tuple, Histogram] = {}
+        self.request_db_seconds: dict[tuple, float] = defaultdict(float)
+        self.queries: dict[tuple, list] = {}
+        self.slow_requests = 0
+        self._collectors: dict[str, Callable[[], dict]] = {}
+
+    def register(self, name: str, collector: Callable[[], dict]) -> None:
+        self._collectors[name] = collector
+
+    def snapshot(self) -> dict:
+        return {name: collector() for name, collector in self._collectors.items()}
+
+    def record_query(self, model: str, method: str, seconds: float) -> None:
+        entry = self.queries.get((model, method))
+        if entry is None:
+            entry = self.queries[(model, method)] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+        stats = _current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += seconds
+            key = f"{model}.{method}"
+            b = stats.breakdown.get(key)
+            if b is None:
+                b = stats.breakdown[key] = [0, 0.0]
+            b[0] += 1
+            b[1] += seconds
+
+    def record_request(self, method: str, route: str, status: int, seconds: float, stats: RequestStats) -> None:
+        key = (method, route)
+        hist = self.requests.get(key)
+        if hist is None:
+            hist = self.requests[key] = Histogram()
+            self.request_queries[key] = Histogram(buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100))
+        hist.observe(seconds)
+        self.request_queries[key].observe(stats.queries)
+        self.request_db_seconds[key] += stats.db_seconds
+        self.statuses[(method, route, status)] += 1
+
+    def render(self) -> str:
+        out: list[str] = []
+        out.append("# TYPE cartify_http_in_flight gauge")
+        out.append(f"cartify_http_in_flight {self.in_flight}")
+        out.append("# TYPE cartify_http_request_duration_seconds histogram")
+        for (method, route), h in self.requests.items():
+            _render_histogram(out, "cartify_http_request_duration_seconds", f'method="{method}",route="{route}"', h)
+        out.append("# TYPE cartify_http_request_db_queries histogram")
+        for (method, route), h in self.request_queries.items():
+            _render_histogram(out, "cartify_http_request_db_queries", f'method="{method}",route="{route}"', h)
+        out.append("# TYPE cartify_http_request_db_seconds_total counter")
+        for (method, route), v in self.request_db_seconds.items():
+            out.append(f'cartify_http_request_db_seconds_total{{method="{method}",route="{route}"}} {v:.6f}')
+        out.append("# TYPE cartify_http_responses_total counter")
+        for (method, route, status), n in self.statuses.items():
+            out.append(f'cartify_http_responses_total{{method="{method}",route="{route}",status="{status}"}} {n}')
+        out.append("# TYPE cartify_db_queries_total counter")
+        out.append("# TYPE cartify_db_query_seconds_total counter")
+        for (model, method), (n, secs) in self.queries.items():
+            labels = f'model="{model}",method="{method}"'
+            out.append(f"cartify_db_queries_total{{{labels}}} {n}")
+            out.append(f"cartify_db_query_seconds_total{{{labels}}} {secs:.6f}")
+        out.append("# TYPE cartify_http_slow_requests_total counter")
+        out.append(f"cartify_http_slow_requests_total {self.slow_requests}")
+        for name, collector in self._collectors.items():
+            for key, value in _flatten(collector()):
+                out.append(f"cartify_{name}_{key} {value}")
+        return "\n".join(out) + "\n"
+
+
+def _render_histogram(out: list, name: str, labels: str, h: Histogram) -> None:
+    for bound, n in h.cumulative():
+        out.append(f'{name}_bucket{{{labels},le="{bound}"}} {n}')
+    out.append(f'{name}_bucket{{{labels},le="+Inf"}} {h.count}')
+    out.append(f"{name}_sum{{{labels}}} {h.sum:.6f}")
+    out.append(f"{name}_count{{{labels}}} {h.count}")
+
+
+def _flatten(data: dict, prefix: str = ""):
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from _flatten(value, name + "_")
+        elif isinstance(value, bool):
+            yield name, int(value)
+        elif isinstance(value, (int, float)):
+            yield name, value
+
+
+registry = Registry()
+
+
+class MetricsMiddleware:
+    def __init__(self, app, slow_ms: float = METRICS_SLOW_REQUEST_MS):
+        self.app = app
+        self.slow_ms = slow_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        status = 500
+        registry.in_flight += 1
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            registry.in_flight -= 1
+            _current_request.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            registry.record_request(scope["method"], path, status, elapsed, stats)
+            if self.slow_ms and elapsed * 1000 >= self.slow_ms:
+                registry.slow_requests += 1
+                breakdown = ", ".join(f"{k}={n}/{s * 1000:.1f}ms" for k, (n, s) in sorted(stats.breakdown.items(), key=lambda kv: -kv[1][1]))
+                slow_log.warning(
+                    "slow request %s %s -> %s in %.1fms; %d queries, %.1fms db [%s]",
+                    scope["method"], path, status, elapsed * 1000, stats.queries, stats.db_seconds * 1000, breakdown,
+                )
@@ -0,0 +1,40 @@
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+
+# ---------------------------
+# Opaque keyset cursors
+# ---------------------------
+# A cursor is the URL-safe base64 of a small JSON object holding the sort
+# key values of the last row on the page. Datetimes round-trip as ISO strings.
+
+def encode_cursor(data: dict) -> str:
+    data = {k: v.isoformat() if isinstance(v, datetime) else v for k, v in data.items()}
+    raw = json.dumps(data, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        if not isinstance(data, dict):
+            raise ValueError("cursor is not an object")
+        return data
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_datetime(value) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def after_keyset(key: str, value, last_id, direction: str) -> dict:
+    # Rows strictly after (value, last_id) in (key, id) order.
+    op = "lt" if direction == "desc" else "gt"
+    return {"OR": [
+        {key: {op: value}},
+        {key: value, "id": {op: last_id}},
+    ]}
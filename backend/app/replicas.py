@@ -0,0 +1,236 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Optional
+
+from prisma import Prisma
+
+from .cache import TTLCache
+from .changes import changes
+from .db import PRISMA_POOL_SIZE, PrismaPool, pool
+
+# ---------------------------
+# Read replicas
+# ---------------------------
+# Writes always use the primary pool. Read-only routes lease a client from
+# `reads`, which hands out a replica when one is fresh enough and the
+# primary otherwise. With no REPLICA_DATABASE_URLS everything goes to the
+# primary, exactly as before.
+#
+# Freshness comes from a heartbeat: the primary's ReplicaHeartbeat row is
+# stamped every REPLICA_HEARTBEAT_INTERVAL, and each replica's copy of the
+# row says what it has applied up to. Replication applies commits in
+# order, so a replica showing a stamp taken after some write also has that
+# write. That gives read-your-writes: a session that wrote at time t reads
+# only from replicas whose stamp is >= t, and from the primary until one
+# catches up. Replicas more than REPLICA_MAX_LAG behind, or unreachable,
+# are skipped until the next check says otherwise. Other workers learn of a
+# session's write through app/changes.py, one poll interval later.
+#
+# Locally, a copy of the SQLite file kept fresh by scripts/sync_replica.py
+# stands in for a replica.
+
+REPLICA_DATABASE_URLS = [u.strip() for u in os.getenv("REPLICA_DATABASE_URLS", "").split(",") if u.strip()]
+REPLICA_POOL_SIZE = int(os.getenv("REPLICA_POOL_SIZE", str(PRISMA_POOL_SIZE)))
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "5"))
+REPLICA_HEARTBEAT_INTERVAL = float(os.getenv("REPLICA_HEARTBEAT_INTERVAL", "1"))
+# How long a session's last write pins its reads; past REPLICA_MAX_LAG any
+# replica still in rotation has it anyway.
+READ_YOUR_WRITES_TTL = float(os.getenv("READ_YOUR_WRITES_TTL", str(max(60.0, REPLICA_MAX_LAG * 2))))
+READ_YOUR_WRITES_SESSIONS = int(os.getenv("READ_YOUR_WRITES_SESSIONS", "100000"))
+HEARTBEAT_ID = 1
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+log = logging.getLogger("cartify.replicas")
+
+
+class Replica:
+    def __init__(self, name: str, url: str, size: int):
+        self.name = name
+        self.pool = PrismaPool(size=size, datasource_url=url)
+        self.applied_at: Optional[float] = None  # heartbeat stamp seen on the replica
+        self.available = False
+        self.reads = 0
+        self.failures = 0
+
+    def lag(self, now: float) -> Optional[float]:
+        return None if self.applied_at is None else max(0.0, now - self.applied_at)
+
+
+class ReadRouter:
+    def __init__(
+        self,
+        primary: PrismaPool,
+        urls: list[str] = REPLICA_DATABASE_URLS,
+        size: int = REPLICA_POOL_SIZE,
+        max_lag: float = REPLICA_MAX_LAG,
+        read_your_writes_ttl: float = READ_YOUR_WRITES_TTL,
+    ):
+        self.primary = primary
+        self.replicas = [Replica(f"replica{i}", url, size) for i, url in enumerate(urls)]
+        self.max_lag = max_lag
+        self.sessions = TTLCache(maxsize=READ_YOUR_WRITES_SESSIONS, ttl=read_your_writes_ttl)
+        self._rotation = itertools.count()
+        self.primary_reads = 0
+        self.pinned_reads = 0
+        self.fallbacks = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    async def connect(self) -> None:
+        for replica in self.replicas:
+            try:
+                await replica.pool.connect()
+            except Exception:
+                # Stays out of rotation; check() connects it later.
+                log.exception("could not connect %s", replica.name)
+                await replica.pool.disconnect()
+        await self.check()
+
+    async def disconnect(self) -> None:
+        for replica in self.replicas:
+            await replica.pool.disconnect()
+
+    # -- routing -------------------------------------------------------------
+
+    def note_write(self, session: Optional[str]) -> None:
+        """Pin the session's reads to data at least as new as now."""
+        if session and self.replicas:
+            self.sessions.set(session, time.time())
+
+    def _pick(self, after: float) -> Optional[Replica]:
+        now = time.time()
+        fresh = [
+            r for r in self.replicas
+            if r.available and r.applied_at is not None and r.applied_at >= after and now - r.applied_at <= self.max_lag
+        ]
+        if not fresh:
+            return None
+        return fresh[next(self._rotation) % len(fresh)]
+
+    @asynccontextmanager
+    async def acquire(self, session: Optional[str] = None, after: float = 0.0) -> AsyncIterator[Prisma]:
+        """Lease a client for reads that must see every write up to `after`."""
+        if not self.replicas:
+            async with self.primary.acquire() as prisma:
+                yield prisma
+            return
+        written = self.sessions.get(session) if session else None
+        if written is not None and written > after:
+            after = written
+        replica = self._pick(after)
+        async with AsyncExitStack() as stack:
+            prisma = None
+            if replica is not None:
+                try:
+                    prisma = await stack.enter_async_context(replica.pool.acquire())
+                    replica.reads += 1
+                except Exception:
+                    replica.available = False
+                    replica.failures += 1
+                    self.fallbacks += 1
+            if prisma is None:
+                if replica is None and written is not None:
+                    self.pinned_reads += 1
+                self.primary_reads += 1
+                prisma = await stack.enter_async_context(self.primary.acquire())
+            yield prisma
+
+    # -- lag tracking --------------------------------------------------------
+
+    async def heartbeat(self) -> None:
+        now = datetime.now(timezone.utc)
+        async with self.primary.acquire() as prisma:
+            await prisma.replicaheartbeat.upsert(
+                where={"id": HEARTBEAT_ID},
+                data={"create": {"id": HEARTBEAT_ID, "at": now}, "update": {"at": now}},
+            )
+
+    async def _check_one(self, replica: Replica) -> None:
+        try:
+            async with replica.pool.acquire() as prisma:
+                row = await prisma.replicaheartbeat.find_unique(where={"id": HEARTBEAT_ID})
+        except Exception:
+            if replica.available:
+                log.warning("%s unreachable, reading from the primary", replica.name)
+            replica.available = False
+            replica.failures += 1
+            return
+        # The stamp only moves forward; never trust an older read.
+        if row is not None and (replica.applied_at is None or row.at.timestamp() > replica.applied_at):
+            replica.applied_at = row.at.timestamp()
+        replica.available = True
+
+    async def check(self) -> None:
+        await asyncio.gather(*(self._check_one(r) for r in self.replicas))
+
+    async def run(self, interval: float = REPLICA_HEARTBEAT_INTERVAL) -> None:
+        while True:
+            try:
+                await self.heartbeat()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("replica heartbeat failed")
+            await self.check()
+            await asyncio.sleep(interval)
+
+    def stats(self) -> dict:
+        now = time.time()
+        return {
+            "replicas": {
+                r.name: {
+                    "available": r.available,
+                    "lag_seconds": None if r.lag(now) is None else round(r.lag(now), 3),
+                    "reads": r.reads,
+                    "failures": r.failures,
+                    "pool": r.pool.stats(),
+                }
+                for r in self.replicas
+            },
+            "primary_reads": self.primary_reads,
+            "pinned_reads": self.pinned_reads,
+            "fallbacks": self.fallbacks,
+            "sessions": len(self.sessions),
+        }
+
+
+class ReadYourWritesMiddleware:
+    """Marks the caller's session as having written once a write request answers."""
+
+    def __init__(self, app, session_of: Callable[[Optional[str]], Optional[str]]):
+        self.app = app
+        self.session_of = session_of
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS or not reads.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            # Before the client can see the response, so its next read is pinned.
+            if message["type"] == "http.response.start":
+                authorization = dict(scope["headers"]).get(b"authorization")
+                session = self.session_of(authorization.decode("latin-1") if authorization else None)
+                reads.note_write(session)
+                if session:
+                    await changes.publish_now("session", [session])
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+reads = ReadRouter(pool)
+
+
+@changes.handler("session")
+async def sessions_wrote(sessions: list[str]) -> None:
+    # The write is no later than now, so this pins at least as long.
+    for session in sessions:
+        reads.note_write(session)
@@ -1,8 +1,16 @@
-from fastapi import APIRouter, Depends
-from typing import List, Optional
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Dict, List, Literal, Optional
+from datetime import date, datetime, timedelta, timezone
+import os
+from pydantic import BaseModel, Field
 from prisma import Prisma
-from ..deps import get_prisma, require_role
+from ..cache import TTLCache
+from ..catalog import catalog
+from ..changes import changes
+from ..deps import get_prisma, get_read_prisma, require_role
+from ..dispatch import DELIVERY_PARTNER_CAPACITY, assign_pending
+from ..pagination import after_keyset, decode_cursor, encode_cursor, parse_datetime
+from ..serialization import json_response
 
 router = APIRouter()
 
@@ -22,6 +30,32 @@ class ApplicationOut(ApplicationIn):
 class UpdateStatusIn(BaseModel):
     status: str
 
+class ApplicationPage(BaseModel):
+    items: List[ApplicationOut]
+    nextCursor: Optional[str] = None
+
+class ApplicationCounts(BaseModel):
+    total: int
+    byStatus: Dict[str, int]
+
+class BulkStatusIn(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=1000)
+    status: Literal["pending", "approved", "rejected"]
+
+class BulkStatusResult(BaseModel):
+    id: str
+    ok: bool
+    changed: bool = False
+    previousStatus: Optional[str] = None
+    error: Optional[str] = None
+
+class BulkStatusResponse(BaseModel):
+    status: str
+    changed: int
+    unchanged: int
+    failed: int
+    results: List[BulkStatusResult]
+
 class CategoryIn(BaseModel):
     name: str
 
@@ -29,13 +63,56 @@ class CategoryOut(BaseModel):
     id: int
     name: str
 
-async def get_prisma() -> Prisma:
-    prisma = Prisma()
-    await prisma.connect()
-    try:
-        yield prisma
-    finally:
-        await prisma.disconnect()
+class DailySalesOut(BaseModel):
+    day: str
+    orders: int
+    revenue: int
+    units: int
+
+class DailySalesReport(BaseModel):
+    days: List[DailySalesOut]
+    orders: int
+    revenue: int
+    units: int
+
+class ProductSalesOut(BaseModel):
+    productId: str
+    name: Optional[str]
+    orders: int
+    revenue: int
+    units: int
+
+class CategorySalesOut(BaseModel):
+    categoryId: int
+    name: Optional[str]
+    revenue: int
+    units: int
+
+class SellerSalesOut(BaseModel):
+    sellerId: str
+    name: Optional[str]
+    revenue: int
+    units: int
+
+# ---------------------------
+# Partner applications (review queue)
+# ---------------------------
+# Listing is keyset-paginated on (date, id) within a status, oldest first
+# by default, so the pending queue reads in arrival order at any depth.
+# Per-status counts are cached briefly and dropped on any worker's writes.
+
+APPLICATION_PAGE_MAX = 200
+APPLICATION_BULK_CHUNK = 500
+APPLICATION_COUNTS_TTL = float(os.getenv("APPLICATION_COUNTS_TTL", "30"))
+
+application_counts = TTLCache(maxsize=1, ttl=APPLICATION_COUNTS_TTL)
+
+@changes.handler("applications")
+async def applications_changed(keys: list[str]):
+    application_counts.clear()
+
+def application_row(a) -> dict:
+    return {"id": a.id, "name": a.name, "email": a.email, "phone": a.phone, "role": a.role, "details": a.details, "extraInfo": a.extraInfo, "status": a.status, "date": str(a.date)}
 
 @router.post("/applications", response_model=ApplicationOut)
 async def submit_application(payload: ApplicationIn, prisma: Prisma = Depends(get_prisma)):
@@ -48,30 +125,179 @@ async def submit_application(payload: ApplicationIn, prisma: Prisma = Depends(ge
         "extraInfo": payload.extraInfo,
         "status": "pending",
     })
-    return ApplicationOut(id=app.id, name=app.name, email=app.email, phone=app.phone, role=app.role, details=app.details, extraInfo=app.extraInfo, status=app.status, date=str(app.date))
+    application_counts.clear()
+    await changes.publish(prisma, "applications")
+    return ApplicationOut(**application_row(app))
+
+@router.get("/applications", response_model=ApplicationPage)
+async def list_applications(
+    status: Optional[str] = None,
+    sort: Literal["oldest", "newest"] = "oldest",
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=APPLICATION_PAGE_MAX),
+    current = Depends(require_role({"admin"})),
+    prisma: Prisma = Depends(get_read_prisma),
+):
+    direction = "asc" if sort == "oldest" else "desc"
+    where: dict = {"status": status} if status else {}
+    if cursor:
+        data = decode_cursor(cursor)
+        if data.get("s") != sort or "t" not in data or "id" not in data:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        after = after_keyset("date", parse_datetime(data["t"]), str(data["id"]), direction)
+        where = {"AND": [where, after]} if where else after
+    rows = await prisma.partnerapplication.find_many(
+        where=where,
+        order=[{"date": direction}, {"id": direction}],
+        take=limit + 1,
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor({"s": sort, "t": rows[-1].date, "id": rows[-1].id})
+    return json_response(ApplicationPage, {"items": [application_row(a) for a in rows], "nextCursor": next_cursor})
+
+@router.get("/applications/counts", response_model=ApplicationCounts)
+async def count_applications(current = Depends(require_role({"admin"})), prisma: Prisma = Depends(get_read_prisma)):
+    counts = application_counts.get("counts")
+    if counts is None:
+        groups = await prisma.partnerapplication.group_by(by=["status"], count=True)
+        by_status = {g["status"]: g["_count"]["_all"] for g in groups}
+        counts = {"total": sum(by_status.values()), "byStatus": by_status}
+        application_counts.set("counts", counts)
+    return counts
 
-@router.get("/applications", response_model=List[ApplicationOut])
-async def list_applications(status: Optional[str] = None, current = Depends(require_role({"admin"})), prisma: Prisma = Depends(get_prisma)):
-    where = {"status": status} if status else {}
-    apps = await prisma.partnerapplication.find_many(where=where)
-    return [ApplicationOut(id=a.id, name=a.name, email=a.email, phone=a.phone, role=a.role, details=a.details, extraInfo=a.extraInfo, status=a.status, date=str(a.date)) for a in apps]
+@router.post("/applications/bulk-status", response_model=BulkStatusResponse)
+async def bulk_update_application_status(payload: BulkStatusIn, current = Depends(require_role({"admin"})), prisma: Prisma = Depends(get_prisma)):
+    ids = list(dict.fromkeys(payload.ids))
+    async with prisma.tx() as tx:
+        found: dict[str, str] = {}
+        for i in range(0, len(ids), APPLICATION_BULK_CHUNK):
+            for a in await tx.partnerapplication.find_many(where={"id": {"in": ids[i:i + APPLICATION_BULK_CHUNK]}}):
+                found[a.id] = a.status
+        to_change = [i for i in ids if i in found and found[i] != payload.status]
+        for i in range(0, len(to_change), APPLICATION_BULK_CHUNK):
+            await tx.partnerapplication.update_many(
+                where={"id": {"in": to_change[i:i + APPLICATION_BULK_CHUNK]}},
+                data={"status": payload.status},
+            )
+        if to_change:
+            await changes.publish(tx, "applications")
+    if to_change:
+        application_counts.clear()
+
+    results = []
+    for app_id in ids:
+        if app_id not in found:
+            results.append(BulkStatusResult(id=app_id, ok=False, error="Not found"))
+        else:
+            results.append(BulkStatusResult(id=app_id, ok=True, changed=found[app_id] != payload.status, previousStatus=found[app_id]))
+    failed = len(ids) - len(found)
+    return BulkStatusResponse(
+        status=payload.status,
+        changed=len(to_change),
+        unchanged=len(found) - len(to_change),
+        failed=failed,
+        results=results,
+    )
 
 @router.patch("/applications/{app_id}", response_model=ApplicationOut)
 async def update_application_status(app_id: str, payload: UpdateStatusIn, current = Depends(require_role({"admin"})), prisma: Prisma = Depends(get_prisma)):
     a = await prisma.partnerapplication.update(where={"id": app_id}, data={"status": payload.status})
-    return ApplicationOut(id=a.id, name=a.name, email=a.email, phone=a.phone, role=a.role, details=a.details, extraInfo=a.extraInfo, status=a.status, date=str(a.date))
+    application_counts.clear()
+    await changes.publish(prisma, "applications")
+    return ApplicationOut(**application_row(a))
 
 @router.get("/categories", response_model=List[CategoryOut])
-async def list_categories(prisma: Prisma = Depends(get_prisma)):
+async def list_categories(prisma: Prisma = Depends(get_read_prisma)):
     cats = await prisma.category.find_many()
     return [CategoryOut(id=c.id, name=c.name) for c in cats]
 
 @router.post("/categories", response_model=CategoryOut)
 async def add_category(payload: CategoryIn, current = Depends(require_role({"admin"})), prisma: Prisma = Depends(get_prisma)):
     c = await prisma.category.create(data={"name": payload.name})
+    # Pages filtered by category name may now match.
+    catalog.invalidate_pages()
+    await changes.publish(prisma, "pages")
     return CategoryOut(id=c.id, name=c.name)
 
 @router.delete("/categories/{category_id}")
 async def remove_category(category_id: int, current = Depends(require_role({"admin"})), prisma: Prisma = Depends(get_prisma)):
     await prisma.category.delete(where={"id": category_id})
-    return {"ok": True}
\ No newline at end of file
+    catalog.invalidate_pages()
+    await changes.publish(prisma, "pages")
+    return {"ok": True}
+
+@router.post("/dispatch")
+async def dispatch_orders(
+    dryRun: bool = False,
+    affinity: bool = True,
+    capacity: int = Query(DELIVERY_PARTNER_CAPACITY, ge=1),
+    limit: Optional[int] = Query(None, ge=1),
+    current = Depends(require_role({"admin"})),
+    prisma: Prisma = Depends(get_prisma),
+):
+    return await assign_pending(prisma, dry_run=dryRun, affinity=affinity, capacity=capacity, limit=limit)
+
+# ---------------------------
+# Analytics (served from the rollup tables)
+# ---------------------------
+
+ANALYTICS_MAX_DAYS = 366
+ANALYTICS_TOP_MAX = 100
+
+def parse_day(value: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+
+@router.get("/analytics/daily", response_model=DailySalesReport)
+async def daily_sales(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    current = Depends(require_role({"admin"})),
+    prisma: Prisma = Depends(get_read_prisma),
+):
+    end_day = parse_day(end) if end else datetime.now(timezone.utc).date()
+    start_day = parse_day(start) if start else end_day - timedelta(days=29)
+    if start_day > end_day or (end_day - start_day).days >= ANALYTICS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range must be 1 to {ANALYTICS_MAX_DAYS} days")
+    rows = await prisma.dailysales.find_many(
+        where={"day": {"gte": start_day.isoformat(), "lte": end_day.isoformat()}},
+        order={"day": "asc"},
+    )
+    days = [DailySalesOut(day=r.day, orders=r.orders, revenue=r.revenue, units=r.units) for r in rows]
+    return DailySalesReport(
+        days=days,
+        orders=sum(d.orders for d in days),
+        revenue=sum(d.revenue for d in days),
+        units=sum(d.units for d in days),
+    )
+
+@router.get("/analytics/products", response_model=List[ProductSalesOut])
+async def top_products(
+    by: Literal["revenue", "units"] = "revenue",
+    limit: int = Query(10, ge=1, le=ANALYTICS_TOP_MAX),
+    current = Depends(require_role({"admin"})),
+    prisma: Prisma = Depends(get_read_prisma),
+):
+    rows = await prisma.productsales.find_many(order={by: "desc"}, take=limit)
+    names = {p.id: p.name for p in await prisma.product.find_many(where={"id": {"in": [r.productId for r in rows]}})}
+    return [ProductSalesOut(productId=r.productId, name=names.get(r.productId), orders=r.orders, revenue=r.revenue, units=r.units) for r in rows]
+
+@router.get("/analytics/categories", response_model=List[CategorySalesOut])
+async def category_sales(current = Depends(require_role({"admin"})), prisma: Prisma = Depends(get_read_prisma)):
+    rows = await prisma.categorysales.find_many(order={"revenue": "desc"})
+    names = {c.id: c.name for c in await prisma.category.find_many(where={"id": {"in": [r.categoryId for r in rows]}})}
+    return [CategorySalesOut(categoryId=r.categoryId, name=names.get(r.categoryId), revenue=r.revenue, units=r.units) for r in rows]
+
+@router.get("/analytics/sellers", response_model=List[SellerSalesOut])
+async def top_sellers(
+    limit: int = Query(10, ge=1, le=ANALYTICS_TOP_MAX),
+    current = Depends(require_role({"admin"})),
+    prisma: Prisma = Depends(get_read_prisma),
+):
+    rows = await prisma.sellersales.find_many(order={"revenue": "desc"}, take=limit)
+    names = {u.id: u.name for u in await prisma.user.find_many(where={"id": {"in": [r.sellerId for r in rows]}})}
+    return [SellerSalesOut(sellerId=r.sellerId, name=names.get(r.sellerId), revenue=r.revenue, units=r.units) for r in rows]
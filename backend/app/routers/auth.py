@@ -2,16 +2,16 @@ from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, EmailStr
 from typing import Optional
 from datetime import datetime, timedelta
-from passlib.context import CryptContext
 import jwt
 import os
-from prisma import Prisma
+from prisma import errors
 
-from ..deps import get_prisma
+from ..db import pool
+from ..deps import decode_token, load_user, user_cache
+from ..hashing import hasher
 
 router = APIRouter()
 
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 JWT_SECRET = os.getenv("JWT_SECRET", "change_me")
 JWT_ALG = "HS256"
 
@@ -55,23 +55,31 @@ def create_access_token(sub: str, expires_delta: Optional[timedelta] = None) ->
 # ---------------------------
 # Register
 # ---------------------------
+# Register and login lease a client around each query only; it goes back to
+# the pool before the password is hashed, which takes far longer.
 
 @router.post("/register", response_model=TokenResponse)
-async def register(payload: RegisterRequest, prisma: Prisma = Depends(get_prisma)):
-    existing = await prisma.user.find_unique(where={"email": payload.email})
+async def register(payload: RegisterRequest):
+    async with pool.acquire() as prisma:
+        existing = await prisma.user.find_unique(where={"email": payload.email})
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    hashed = pwd_context.hash(payload.password)
+    hashed = await hasher.hash(payload.password)
 
-    user = await prisma.user.create(
-        data={
-            "name": payload.name,
-            "email": payload.email,
-            "password": hashed,
-            "role": payload.role, # Ensure role is valid enum in Prisma
-        }
-    )
+    try:
+        async with pool.acquire() as prisma:
+            user = await prisma.user.create(
+                data={
+                    "name": payload.name,
+                    "email": payload.email,
+                    "password": hashed,
+                    "role": payload.role, # Ensure role is valid enum in Prisma
+                }
+            )
+    except errors.UniqueViolationError:
+        # Registered by a concurrent request while we were hashing.
+        raise HTTPException(status_code=400, detail="Email already registered")
 
     token = create_access_token(user.id)
     return TokenResponse(access_token=token, token_type="bearer")
@@ -81,10 +89,11 @@ async def register(payload: RegisterRequest, prisma: Prisma = Depends(get_prisma
 # ---------------------------
 
 @router.post("/login", response_model=TokenResponse)
-async def login(payload: LoginRequest, prisma: Prisma = Depends(get_prisma)):
-    user = await prisma.user.find_unique(where={"email": payload.email})
+async def login(payload: LoginRequest):
+    async with pool.acquire() as prisma:
+        user = await prisma.user.find_unique(where={"email": payload.email})
 
-    if not user or not pwd_context.verify(payload.password, user.password):
+    if not user or not await hasher.verify(payload.password, user.password):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
     token = create_access_token(user.id)
@@ -99,20 +108,23 @@ from fastapi import Header
 def get_current_user_id(authorization: str = Header(...)) -> str:
     try:
         scheme, token = authorization.split()
-        if scheme.lower() != 'bearer':
-            raise HTTPException(status_code=401, detail="Invalid authentication scheme")
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
-        return str(payload.get("sub"))
-    except Exception:
+    except ValueError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    if scheme.lower() != 'bearer':
+        raise HTTPException(status_code=401, detail="Invalid authentication scheme")
+    payload = decode_token(token)
+    return str(payload.get("sub"))
 
 # ---------------------------
 # Get logged-in user
 # ---------------------------
 
 @router.get("/me", response_model=UserOut)
-async def me(current_user_id: str = Depends(get_current_user_id), prisma: Prisma = Depends(get_prisma)):
-    user = await prisma.user.find_unique(where={"id": current_user_id})
+async def me(current_user_id: str = Depends(get_current_user_id)):
+    user = user_cache.get(current_user_id)
+    if user is None:
+        async with pool.acquire() as prisma:
+            user = await load_user(prisma, current_user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
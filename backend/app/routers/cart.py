@@ -0,0 +1,78 @@
+from fastapi import APIRouter, Depends, HTTPException
+from typing import List
+from pydantic import BaseModel, Field
+
+from ..carts import Cart, UnknownProduct, carts
+from ..deps import require_role
+
+router = APIRouter()
+
+# ---------------------------
+# Pydantic Schemas
+# ---------------------------
+
+class CartItemIn(BaseModel):
+    productId: str
+    quantity: int = Field(gt=0)
+
+class CartQuantityIn(BaseModel):
+    quantity: int = Field(ge=0)
+
+class CartLineOut(BaseModel):
+    productId: str
+    quantity: int
+    unitPrice: int
+    lineTotal: int
+
+class CartOut(BaseModel):
+    items: List[CartLineOut]
+    itemCount: int
+    subtotal: int
+
+def cart_out(cart: Cart) -> CartOut:
+    return CartOut(
+        items=[
+            CartLineOut(productId=pid, quantity=qty, unitPrice=cart.prices[pid], lineTotal=qty * cart.prices[pid])
+            for pid, qty in cart.quantities.items()
+        ],
+        itemCount=sum(cart.quantities.values()),
+        subtotal=cart.subtotal,
+    )
+
+# ---------------------------
+# Cart
+# ---------------------------
+# No request-scoped client: the cart store leases one only on a miss.
+
+@router.get("/", response_model=CartOut)
+async def get_cart(current = Depends(require_role({"customer"}))):
+    return cart_out(await carts.get(current.id))
+
+@router.post("/items", response_model=CartOut)
+async def add_item(payload: CartItemIn, current = Depends(require_role({"customer"}))):
+    try:
+        cart = await carts.set_quantity(current.id, payload.productId, payload.quantity, add=True)
+    except UnknownProduct:
+        raise HTTPException(status_code=404, detail="Product not found")
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return cart_out(cart)
+
+@router.put("/items/{product_id}", response_model=CartOut)
+async def update_item(product_id: str, payload: CartQuantityIn, current = Depends(require_role({"customer"}))):
+    try:
+        cart = await carts.set_quantity(current.id, product_id, payload.quantity)
+    except UnknownProduct:
+        raise HTTPException(status_code=404, detail="Product not found")
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return cart_out(cart)
+
+@router.delete("/items/{product_id}", response_model=CartOut)
+async def remove_item(product_id: str, current = Depends(require_role({"customer"}))):
+    return cart_out(await carts.remove(current.id, product_id))
+
+@router.delete("/")
+async def clear_cart(current = Depends(require_role({"customer"}))):
+    await carts.clear(current.id)
+    return {"message": "Cart cleared"}
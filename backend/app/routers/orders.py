@@ -1,18 +1,40 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Header, Query
+from fastapi.responses import StreamingResponse
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field
 from prisma import Prisma
-from ..deps import get_prisma, require_role
+import uuid
+from ..db import pool
+from ..deps import get_prisma, get_read_prisma, require_role, session_id
+from ..fulfillment import enqueue_order_followups
+from ..idempotency import idempotency
+from ..inventory import OutOfStock, claim_hold, create_hold, line_quantities, refresh_sold_out, release_hold, reserve_stock, try_reserve_stock, unclaim_hold
+from ..jobs import job_queue
+from ..pagination import after_keyset, decode_cursor, encode_cursor, parse_datetime
+from ..replicas import reads
+from ..serialization import dump, json_response
 
 router = APIRouter()
 
+PRICE_LOOKUP_CHUNK = 500
+BULK_ORDER_MAX = 1000
+BULK_ORDER_BATCH = 100
+
 class OrderItemIn(BaseModel):
     productId: str
-    quantity: int
+    quantity: int = Field(gt=0)
 
 class CreateOrderRequest(BaseModel):
     items: List[OrderItemIn]
     shippingAddress: str
+    reservationId: Optional[str] = None
+
+class ReservationRequest(BaseModel):
+    items: List[OrderItemIn]
+
+class ReservationOut(BaseModel):
+    id: str
+    expiresAt: str
 
 class OrderItemOut(BaseModel):
     productId: str
@@ -30,67 +52,297 @@ class OrderOut(BaseModel):
     shippingAddress: str
     trackingNumber: str | None
 
-async def get_prisma() -> Prisma:
-    prisma = Prisma()
-    await prisma.connect()
-    try:
-        yield prisma
-    finally:
-        await prisma.disconnect()
+class BulkOrderRequest(BaseModel):
+    orders: List[CreateOrderRequest] = Field(max_length=BULK_ORDER_MAX)
+
+class BulkOrderResult(BaseModel):
+    index: int
+    ok: bool
+    orderId: Optional[str] = None
+    total: Optional[int] = None
+    error: Optional[str] = None
+
+class BulkOrderResponse(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[BulkOrderResult]
+
+class OrderPage(BaseModel):
+    items: List[OrderOut]
+    nextCursor: Optional[str] = None
+
+class StatusSummary(BaseModel):
+    count: int
+    total: int
+
+class OrderSummary(BaseModel):
+    count: int
+    totalSpent: int
+    byStatus: Dict[str, StatusSummary]
+
+def order_row(o) -> dict:
+    return {
+        "id": o.id,
+        "customerId": o.customerId,
+        "items": [{"productId": i.productId, "quantity": i.quantity} for i in o.items],
+        "total": o.total,
+        "status": o.status,
+        "paymentStatus": o.paymentStatus,
+        "deliveryPartnerId": o.deliveryPartnerId,
+        "createdAt": str(o.createdAt),
+        "shippingAddress": o.shippingAddress,
+        "trackingNumber": o.trackingNumber,
+    }
+
+def order_out(o) -> OrderOut:
+    return OrderOut(**order_row(o))
+
+async def fetch_prices(prisma: Prisma, product_ids: set[str]) -> dict[str, int]:
+    prices: dict[str, int] = {}
+    ids = list(product_ids)
+    for i in range(0, len(ids), PRICE_LOOKUP_CHUNK):
+        for p in await prisma.product.find_many(where={"id": {"in": ids[i:i + PRICE_LOOKUP_CHUNK]}}):
+            prices[p.id] = p.price
+    return prices
 
 @router.post("/", response_model=OrderOut)
-async def create_order(payload: CreateOrderRequest, current = Depends(require_role({"customer"})), prisma: Prisma = Depends(get_prisma)):
-    product_ids = [i.productId for i in payload.items]
-    products = await prisma.product.find_many(where={"id": {"in": product_ids}})
-    if len(products) != len(product_ids):
+async def create_order(
+    payload: CreateOrderRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    current = Depends(require_role({"customer"})),
+):
+    # Leased inside the handler: a duplicate waiting on the first request
+    # holds no client.
+    async def run():
+        async with pool.acquire() as prisma:
+            return await place_order(payload, current, prisma)
+
+    if idempotency_key:
+        return await idempotency.run(f"order:{current.id}:{idempotency_key}", payload, run)
+    return await run()
+
+async def place_order(payload: CreateOrderRequest, current, prisma: Prisma) -> OrderOut:
+    prices = await fetch_prices(prisma, {i.productId for i in payload.items})
+    if any(it.productId not in prices for it in payload.items):
         raise HTTPException(status_code=400, detail="Invalid product ids")
-    total = 0
-    for it in payload.items:
-        price = next(p.price for p in products if p.id == it.productId)
-        total += price * it.quantity
-    order = await prisma.order.create(
-        data={
-            "customerId": current.id,
-            "total": total,
-            "status": "pending",
-            "paymentStatus": "paid",
-            "shippingAddress": payload.shippingAddress,
-            "items": {
-                "create": [
-                    {"productId": it.productId, "quantity": it.quantity} for it in payload.items
-                ]
-            },
-        },
+    total = sum(prices[it.productId] * it.quantity for it in payload.items)
+    quantities = line_quantities(payload.items)
+    try:
+        async with prisma.tx() as tx:
+            if payload.reservationId:
+                held = await claim_hold(tx, payload.reservationId, current.id)
+                if held is None:
+                    raise HTTPException(status_code=409, detail="Reservation expired or not found")
+                if held != quantities:
+                    raise HTTPException(status_code=409, detail="Reservation does not match order items")
+            else:
+                await reserve_stock(tx, quantities)
+            order = await tx.order.create(
+                data={
+                    "customerId": current.id,
+                    "total": total,
+                    "status": "pending",
+                    "paymentStatus": "paid",
+                    "shippingAddress": payload.shippingAddress,
+                    "items": {
+                        "create": [
+                            {"productId": it.productId, "quantity": it.quantity} for it in payload.items
+                        ]
+                    },
+                },
+                include={"items": True},
+            )
+            await enqueue_order_followups(tx, [order.id])
+    except OutOfStock as exc:
+        raise HTTPException(status_code=409, detail={"error": "out_of_stock", "productId": exc.product_id, "requested": exc.requested})
+    job_queue.notify()
+    if not payload.reservationId:
+        await refresh_sold_out(prisma, quantities)
+    return order_out(order)
+
+# ---------------------------
+# Bulk checkout
+# ---------------------------
+# Every referenced product is priced with one lookup pass, each order is
+# validated on its own, and valid orders are written BULK_ORDER_BATCH at a
+# time per transaction with create_many. An order that runs out of stock
+# gives back what it took and fails alone; the rest of its batch commits.
+# An order carrying a reservationId claims that hold instead of taking
+# stock again, as on the single-order path.
+
+@router.post("/bulk", response_model=BulkOrderResponse)
+async def create_orders_bulk(
+    payload: BulkOrderRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    current = Depends(require_role({"customer"})),
+):
+    async def run():
+        async with pool.acquire() as prisma:
+            return await place_orders_bulk(payload, current, prisma)
+
+    if idempotency_key:
+        return await idempotency.run(f"bulk:{current.id}:{idempotency_key}", payload, run)
+    return await run()
+
+async def place_orders_bulk(payload: BulkOrderRequest, current, prisma: Prisma) -> BulkOrderResponse:
+    prices = await fetch_prices(prisma, {it.productId for o in payload.orders for it in o.items})
+    results: list[Optional[BulkOrderResult]] = [None] * len(payload.orders)
+    valid: list[tuple[int, CreateOrderRequest, int]] = []
+    for idx, o in enumerate(payload.orders):
+        if not o.items:
+            results[idx] = BulkOrderResult(index=idx, ok=False, error="No items")
+            continue
+        missing = next((it.productId for it in o.items if it.productId not in prices), None)
+        if missing:
+            results[idx] = BulkOrderResult(index=idx, ok=False, error=f"Invalid product id {missing}")
+            continue
+        valid.append((idx, o, sum(prices[it.productId] * it.quantity for it in o.items)))
+
+    touched: set[str] = set()
+    for start in range(0, len(valid), BULK_ORDER_BATCH):
+        batch = valid[start:start + BULK_ORDER_BATCH]
+        orders, items, placed = [], [], []
+        try:
+            async with prisma.tx() as tx:
+                for idx, o, total in batch:
+                    quantities = line_quantities(o.items)
+                    if o.reservationId:
+                        held = await claim_hold(tx, o.reservationId, current.id)
+                        if held is None:
+                            results[idx] = BulkOrderResult(index=idx, ok=False, error="Reservation expired or not found")
+                            continue
+                        if held != quantities:
+                            await unclaim_hold(tx, o.reservationId)
+                            results[idx] = BulkOrderResult(index=idx, ok=False, error="Reservation does not match order items")
+                            continue
+                    else:
+                        short = await try_reserve_stock(tx, quantities)
+                        if short:
+                            results[idx] = BulkOrderResult(index=idx, ok=False, error=f"Out of stock: {short}")
+                            continue
+                        touched.update(quantities)
+                    order_id = uuid.uuid4().hex
+                    orders.append({
+                        "id": order_id,
+                        "customerId": current.id,
+                        "total": total,
+                        "status": "pending",
+                        "paymentStatus": "paid",
+                        "shippingAddress": o.shippingAddress,
+                    })
+                    items.extend({"orderId": order_id, "productId": it.productId, "quantity": it.quantity} for it in o.items)
+                    placed.append((idx, order_id, total))
+                if orders:
+                    await tx.order.create_many(data=orders)
+                    await tx.orderitem.create_many(data=items)
+                    await enqueue_order_followups(tx, [o["id"] for o in orders])
+        except Exception as exc:
+            # The whole batch rolled back, stock included.
+            for idx, _, _ in batch:
+                results[idx] = BulkOrderResult(index=idx, ok=False, error=f"Batch failed: {exc.__class__.__name__}")
+            continue
+        for idx, order_id, total in placed:
+            results[idx] = BulkOrderResult(index=idx, ok=True, orderId=order_id, total=total)
+
+    if touched:
+        await refresh_sold_out(prisma, touched)
+    succeeded = sum(1 for r in results if r.ok)
+    if succeeded:
+        job_queue.notify()
+    return BulkOrderResponse(succeeded=succeeded, failed=len(results) - succeeded, results=results)
+
+# ---------------------------
+# Order history
+# ---------------------------
+# Newest first, keyset-paginated on (createdAt, id). The streaming variant
+# walks the same keyset in chunks and writes one JSON object per line.
+
+ORDER_PAGE_MAX = 100
+ORDER_STREAM_CHUNK = 200
+
+async def fetch_orders_page(prisma: Prisma, customer_id: str, limit: int, cursor: Optional[str] = None):
+    where: dict = {"customerId": customer_id}
+    if cursor:
+        data = decode_cursor(cursor)
+        if "t" not in data or "id" not in data:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        where = {"AND": [where, after_keyset("createdAt", parse_datetime(data["t"]), str(data["id"]), "desc")]}
+    rows = await prisma.order.find_many(
+        where=where,
         include={"items": True},
+        order=[{"createdAt": "desc"}, {"id": "desc"}],
+        take=limit + 1,
     )
-    return OrderOut(
-        id=order.id,
-        customerId=order.customerId,
-        items=[OrderItemOut(productId=i.productId, quantity=i.quantity) for i in order.items],
-        total=order.total,
-        status=order.status,
-        paymentStatus=order.paymentStatus,
-        deliveryPartnerId=order.deliveryPartnerId,
-        createdAt=str(order.createdAt),
-        shippingAddress=order.shippingAddress,
-        trackingNumber=order.trackingNumber,
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor({"t": rows[-1].createdAt, "id": rows[-1].id})
+    return rows, next_cursor
+
+@router.get("/me", response_model=OrderPage)
+async def my_orders(
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=ORDER_PAGE_MAX),
+    current = Depends(require_role({"customer"})),
+    prisma: Prisma = Depends(get_read_prisma),
+):
+    orders, next_cursor = await fetch_orders_page(prisma, current.id, limit, cursor)
+    return json_response(OrderPage, {"items": [order_row(o) for o in orders], "nextCursor": next_cursor})
+
+@router.get("/me/stream")
+async def stream_my_orders(current = Depends(require_role({"customer"})), authorization: str = Header(None)):
+    customer_id = current.id
+    session = session_id(authorization)
+
+    async def lines():
+        # A lease per page, handed back before the page is written, so a
+        # slow reader never holds a client.
+        cursor = None
+        while True:
+            async with reads.acquire(session=session) as prisma:
+                orders, cursor = await fetch_orders_page(prisma, customer_id, ORDER_STREAM_CHUNK, cursor)
+            if orders:
+                yield b"".join(dump(OrderOut, order_row(o)) + b"\n" for o in orders)
+            if cursor is None:
+                return
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@router.get("/me/summary", response_model=OrderSummary)
+async def my_order_summary(current = Depends(require_role({"customer"})), prisma: Prisma = Depends(get_read_prisma)):
+    groups = await prisma.order.group_by(
+        by=["status"],
+        where={"customerId": current.id},
+        count=True,
+        sum={"total": True},
     )
+    by_status = {}
+    count = 0
+    spent = 0
+    for g in groups:
+        n = g["_count"]["_all"]
+        total = g["_sum"]["total"] or 0
+        by_status[g["status"]] = StatusSummary(count=n, total=total)
+        count += n
+        spent += total
+    return OrderSummary(count=count, totalSpent=spent, byStatus=by_status)
+
+# ---------------------------
+# Stock holds for checkout
+# ---------------------------
+
+@router.post("/reservations", response_model=ReservationOut)
+async def reserve(payload: ReservationRequest, current = Depends(require_role({"customer"})), prisma: Prisma = Depends(get_prisma)):
+    if not payload.items:
+        raise HTTPException(status_code=400, detail="No items")
+    try:
+        reservation_id, expires_at = await create_hold(prisma, current.id, line_quantities(payload.items))
+    except OutOfStock as exc:
+        raise HTTPException(status_code=409, detail={"error": "out_of_stock", "productId": exc.product_id, "requested": exc.requested})
+    return ReservationOut(id=reservation_id, expiresAt=expires_at.isoformat())
 
-@router.get("/me", response_model=List[OrderOut])
-async def my_orders(current = Depends(require_role({"customer"})), prisma: Prisma = Depends(get_prisma)):
-    orders = await prisma.order.find_many(where={"customerId": current.id}, include={"items": True})
-    return [
-        OrderOut(
-            id=o.id,
-            customerId=o.customerId,
-            items=[OrderItemOut(productId=i.productId, quantity=i.quantity) for i in o.items],
-            total=o.total,
-            status=o.status,
-            paymentStatus=o.paymentStatus,
-            deliveryPartnerId=o.deliveryPartnerId,
-            createdAt=str(o.createdAt),
-            shippingAddress=o.shippingAddress,
-            trackingNumber=o.trackingNumber,
-        )
-        for o in orders
-    ]
\ No newline at end of file
+@router.delete("/reservations/{reservation_id}")
+async def cancel_reservation(reservation_id: str, current = Depends(require_role({"customer"})), prisma: Prisma = Depends(get_prisma)):
+    if not await release_hold(prisma, reservation_id, customer_id=current.id):
+        raise HTTPException(status_code=404, detail="Reservation not found")
+    return {"ok": True}
\ No newline at end of file
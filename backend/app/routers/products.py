@@ -1,9 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from typing import Dict, List, Literal, Optional
 from pydantic import BaseModel
 from prisma import Prisma
 
-from ..deps import get_prisma
+from ..carts import carts
+from ..catalog import catalog, page_key
+from ..changes import changes
+from ..db import pool
+from ..deps import catalog_reader, get_prisma, require_role
+from ..facets import DISCOUNT_LABELS, PRICE_LABELS, RATING_LABELS, facet_index
+from ..importer import ProductImporter, iter_lines, iter_records
+from ..pagination import after_keyset, decode_cursor, encode_cursor, parse_datetime
+from ..search import search_index
+from ..serialization import dump, json_response
+from ..trending import TRENDING_TOP_N, top_trending
 
 router = APIRouter()
 
@@ -21,49 +31,222 @@ class ProductIn(BaseModel):
 class ProductOut(ProductIn):
     id: str
 
+class ProductPage(BaseModel):
+    items: List[ProductOut]
+    nextCursor: Optional[str] = None
+
+class TrendingList(BaseModel):
+    items: List[ProductOut]
+
+class FacetCounts(BaseModel):
+    total: int
+    category: Dict[str, int]
+    price: Dict[str, int]
+    rating: Dict[str, int]
+    discount: Dict[str, int]
+    stock: Dict[str, int]
+
+class SearchResult(BaseModel):
+    items: List[ProductOut]
+    total: int
+    facets: Dict[str, int]
+
+def product_row(p) -> dict:
+    # Map 'name' to 'title' for frontend compatibility
+    return {
+        "id": p.id,
+        "title": p.name,
+        "description": p.description,
+        "category": str(p.categoryId) if p.categoryId else "General", # simplistic handling
+        "price": p.price,
+        "image": p.image,
+    }
+
+# ---------------------------
+# Keyset pagination
+# ---------------------------
+# Each sort orders by (key, id) and the cursor carries the last row's key
+# and id, so every page is an index range scan of `limit` rows no matter
+# how deep the client has paged. Matching indexes live in schema.prisma.
+
+SORTS = {
+    "recent": ("createdAt", "desc"),
+    "price_asc": ("price", "asc"),
+    "price_desc": ("price", "desc"),
+    "rating": ("rating", "desc"),
+}
+
+def encode_product_cursor(sort: str, value, product_id: str) -> str:
+    return encode_cursor({"s": sort, "v": value, "id": product_id})
+
+def decode_product_cursor(cursor: str, sort: str):
+    data = decode_cursor(cursor)
+    if data.get("s") != sort or "v" not in data or "id" not in data:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    value = data["v"]
+    if SORTS[sort][0] == "createdAt":
+        value = parse_datetime(value)
+    return value, str(data["id"])
+
+def build_filters(category: Optional[str], min_price: Optional[int], max_price: Optional[int], trending: Optional[bool], in_stock: Optional[bool]) -> dict:
+    where: dict = {}
+    if category:
+        if category.isdigit():
+            where["categoryId"] = int(category)
+        else:
+            where["category"] = {"is": {"name": category}}
+    price: dict = {}
+    if min_price is not None:
+        price["gte"] = min_price
+    if max_price is not None:
+        price["lte"] = max_price
+    if price:
+        where["price"] = price
+    if trending is not None:
+        where["trending"] = trending
+    if in_stock:
+        where["stock"] = {"gt": 0}
+    elif in_stock is False:
+        where["stock"] = {"lte": 0}
+    return where
+
 # ---------------------------
 # Get all products
 # ---------------------------
 
-@router.get("/", response_model=List[ProductOut])
-async def list_products(prisma: Prisma = Depends(get_prisma)):
-    # Note: Prisma model has 'name' but Pydantic has 'title'. Mapping needed or schema update.
-    # Looking at schema.prisma: Product has 'name', 'description', 'price', 'image', 'categoryId'.
-    # But ProductIn uses 'title', 'category' (string).
-    # I will adapt the code to match SCHEMA.PRISMA first, then map if needed.
-    # Schema: name, description, price, image...
-    # Let's align Pydantic with Schema for simplicity in this migration.
-    
-    products = await prisma.product.find_many()
-    # Map 'name' to 'title' for frontend compatibility if frontend expects 'title'
-    return [
-        ProductOut(
-            id=p.id,
-            title=p.name, # Map name -> title
-            description=p.description,
-            category=str(p.categoryId) if p.categoryId else "General", # simplistic handling
-            price=p.price,
-            image=p.image
-        ) for p in products
-    ]
+@router.get("/", response_model=ProductPage)
+async def list_products(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(24, ge=1, le=100),
+    sort: Literal["recent", "price_asc", "price_desc", "rating"] = "recent",
+    category: Optional[str] = None,
+    minPrice: Optional[int] = Query(None, ge=0),
+    maxPrice: Optional[int] = Query(None, ge=0),
+    trending: Optional[bool] = None,
+    inStock: Optional[bool] = None,
+    read=Depends(catalog_reader),
+):
+    cache_key = page_key(request)
+    body = catalog.get(cache_key)
+    if body is not None:
+        return catalog.respond(request, body)
+    version = catalog.version
+
+    key, direction = SORTS[sort]
+    where = build_filters(category, minPrice, maxPrice, trending, inStock)
+    if cursor:
+        value, last_id = decode_product_cursor(cursor, sort)
+        after = after_keyset(key, value, last_id, direction)
+        where = {"AND": [where, after]} if where else after
+
+    # One extra row tells us whether another page exists.
+    async with read() as prisma:
+        rows = await prisma.product.find_many(
+            where=where,
+            order=[{key: direction}, {"id": direction}],
+            take=limit + 1,
+        )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_product_cursor(sort, getattr(last, key), last.id)
+    page = {"items": [product_row(p) for p in rows], "nextCursor": next_cursor}
+    body = catalog.put(cache_key, dump(ProductPage, page), version)
+    return catalog.respond(request, body)
+
+# ---------------------------
+# Search
+# ---------------------------
+
+@router.get("/search", response_model=SearchResult)
+async def search_products(
+    q: str = Query(..., min_length=1, max_length=200),
+    category: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    prefix: bool = True,
+    read=Depends(catalog_reader),
+):
+    hits = search_index.search(q, category_id=category, limit=limit, prefix=prefix)
+    rows = []
+    if hits["ids"]:
+        async with read() as prisma:
+            rows = await prisma.product.find_many(where={"id": {"in": hits["ids"]}})
+    by_id = {p.id: p for p in rows}
+    items = [product_row(by_id[i]) for i in hits["ids"] if i in by_id]
+    return json_response(SearchResult, {"items": items, "total": hits["total"], "facets": hits["facets"]})
+
+# ---------------------------
+# Facets
+# ---------------------------
+# Answered from the in-memory facet index; price, rating and discount
+# selections use the bucket labels the endpoint returns.
+
+def label_indexes(values: Optional[List[str]], labels: List[str], name: str) -> List[int]:
+    out = []
+    for v in values or []:
+        if v not in labels:
+            raise HTTPException(status_code=400, detail=f"Unknown {name} bucket: {v}")
+        out.append(labels.index(v))
+    return out
+
+@router.get("/facets", response_model=FacetCounts)
+async def product_facets(
+    category: Optional[List[int]] = Query(None),
+    price: Optional[List[str]] = Query(None),
+    rating: Optional[List[str]] = Query(None),
+    discount: Optional[List[str]] = Query(None),
+    inStock: Optional[bool] = None,
+):
+    return facet_index.query(
+        categories=category or (),
+        prices=label_indexes(price, PRICE_LABELS, "price"),
+        ratings=label_indexes(rating, RATING_LABELS, "rating"),
+        discounts=label_indexes(discount, DISCOUNT_LABELS, "discount"),
+        in_stock=inStock,
+    )
+
+# ---------------------------
+# Trending
+# ---------------------------
+# Ranked by the precomputed scores in app/trending.py and kept in the
+# catalog snapshot until the next trending run or product change.
+
+@router.get("/trending", response_model=TrendingList)
+async def trending_products(
+    request: Request,
+    category: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=TRENDING_TOP_N),
+    read=Depends(catalog_reader),
+):
+    cache_key = ("page", ("trending", category, limit))
+    body = catalog.get(cache_key)
+    if body is not None:
+        return catalog.respond(request, body)
+    version = catalog.version
+    async with read() as prisma:
+        rows = await top_trending(prisma, category_id=category, limit=limit)
+    body = catalog.put(cache_key, dump(TrendingList, {"items": [product_row(p) for p in rows]}), version)
+    return catalog.respond(request, body)
 
 # ---------------------------
 # Get product by ID
 # ---------------------------
 
 @router.get("/{product_id}", response_model=ProductOut)
-async def get_product(product_id: str, prisma: Prisma = Depends(get_prisma)):
-    product = await prisma.product.find_unique(where={"id": product_id})
+async def get_product(product_id: str, request: Request, read=Depends(catalog_reader)):
+    cache_key = ("product", product_id)
+    body = catalog.get(cache_key)
+    if body is not None:
+        return catalog.respond(request, body)
+    version = catalog.version
+    async with read() as prisma:
+        product = await prisma.product.find_unique(where={"id": product_id})
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    return ProductOut(
-        id=product.id,
-        title=product.name,
-        description=product.description,
-        category=str(product.categoryId) if product.categoryId else "General",
-        price=product.price,
-        image=product.image
-    )
+    body = catalog.put(cache_key, dump(ProductOut, product_row(product)), version)
+    return catalog.respond(request, body)
 
 # ---------------------------
 # Create product
@@ -111,6 +294,10 @@ async def create_product(payload: ProductIn, prisma: Prisma = Depends(get_prisma
         },
         include={"category": True}
     )
+    catalog.invalidate_product(new_product.id)
+    search_index.add(new_product)
+    facet_index.add(new_product)
+    await changes.publish(prisma, "product", [new_product.id])
 
     return ProductOut(
         id=new_product.id,
@@ -121,6 +308,38 @@ async def create_product(payload: ProductIn, prisma: Prisma = Depends(get_prisma
         image=new_product.image
     )
 
+# ---------------------------
+# Bulk import (CSV / NDJSON stream)
+# ---------------------------
+
+@router.post("/import")
+async def import_products(
+    request: Request,
+    format: Optional[Literal["csv", "ndjson"]] = None,
+    importId: Optional[str] = None,
+    current = Depends(require_role({"seller", "admin"})),
+):
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = "ndjson" if "ndjson" in content_type or "jsonl" in content_type else "csv"
+    # No request-scoped client: the importer leases one per batch.
+    importer = ProductImporter(pool.acquire, seller_id=current.id)
+    records = iter_records(iter_lines(request.stream()), format)
+    try:
+        report = await importer.run(records, import_id=importId)
+    except PermissionError:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    finally:
+        # Rows may have landed even if the upload broke off midway. Only
+        # this run's rows are new, so the indexes take just those.
+        catalog.clear()
+        carts.prices.clear()
+        async for product in importer.imported_products():
+            search_index.add(product)
+            facet_index.add(product)
+        await changes.publish_now("catalog")
+    return report
+
 # ---------------------------
 # Update & Delete omitted for brevity/safety unless needed.
 # The original file had them, so I should probably implement them to be safe.
@@ -129,4 +348,37 @@ async def create_product(payload: ProductIn, prisma: Prisma = Depends(get_prisma
 @router.delete("/{product_id}")
 async def delete_product(product_id: str, prisma: Prisma = Depends(get_prisma)):
     await prisma.product.delete(where={"id": product_id})
+    catalog.invalidate_product(product_id)
+    carts.prices.invalidate(product_id)
+    search_index.remove(product_id)
+    facet_index.remove(product_id)
+    await changes.publish(prisma, "product", [product_id])
     return {"message": "Product deleted"}
+
+# ---------------------------
+# Writes made by other workers (app/changes.py)
+# ---------------------------
+
+@changes.handler("product")
+async def products_changed(product_ids: list[str]):
+    async with pool.acquire() as prisma:
+        rows = {p.id: p for p in await prisma.product.find_many(where={"id": {"in": product_ids}})}
+    for product_id in product_ids:
+        catalog.invalidate_product(product_id)
+        carts.prices.invalidate(product_id)
+        product = rows.get(product_id)
+        if product is None:
+            search_index.remove(product_id)
+            facet_index.remove(product_id)
+        else:
+            search_index.add(product)
+            facet_index.add(product)
+
+@changes.handler("catalog")
+async def catalog_changed(keys: list[str]):
+    # An import: too many rows to name, so reconcile against the table.
+    catalog.clear()
+    carts.prices.clear()
+    async with pool.acquire() as prisma:
+        await search_index.reconcile(prisma)
+        await facet_index.build(prisma)
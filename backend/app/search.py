@@ -0,0 +1,225 @@
+import bisect
+import gzip
+import json
+import math
+import os
+import re
+import time
+from collections import Counter, defaultdict
+from typing import AsyncIterator, Optional
+
+from .db import pool
+
+# ---------------------------
+# Product search index
+# ---------------------------
+# In-memory inverted index over name, description and tags, ranked with
+# BM25. The last query term also matches as a prefix for autocomplete.
+# The index is loaded from a snapshot on disk when one exists and then
+# reconciled against the Product table, so a cold start only reads the
+# rows that changed.
+
+SEARCH_SNAPSHOT_PATH = os.getenv("SEARCH_SNAPSHOT_PATH", "search_index.json.gz")
+SNAPSHOT_FORMAT = 1
+BUILD_BATCH = 1000
+MAX_PREFIX_EXPANSION = 50
+
+# Field weights are applied to term frequencies before BM25.
+FIELD_WEIGHTS = {"name": 3, "tags": 2, "description": 1}
+K1 = 1.2
+B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: Optional[str]) -> list[str]:
+    if not text:
+        return []
+    return _TOKEN_RE.findall(text.lower())
+
+
+def product_terms(product) -> Counter:
+    terms: Counter = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        for tok in tokenize(getattr(product, field, None)):
+            terms[tok] += weight
+    return terms
+
+
+class SearchIndex:
+    def __init__(self):
+        self._postings: dict[str, dict[str, int]] = defaultdict(dict)
+        self._terms: list[str] = []  # sorted, for prefix lookups
+        self._docs: dict[str, tuple[Optional[int], int]] = {}  # id -> (categoryId, length)
+        self._doc_terms: dict[str, dict[str, int]] = {}
+        self._total_len = 0
+        self.built_at: Optional[float] = None
+        self.build_seconds = 0.0
+        self.loaded_from_snapshot = False
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def _add_terms(self, doc_id: str, category_id: Optional[int], terms: dict[str, int], keep_sorted: bool = True) -> None:
+        if doc_id in self._docs:
+            self.remove(doc_id)
+        length = sum(terms.values())
+        self._docs[doc_id] = (category_id, length)
+        self._doc_terms[doc_id] = dict(terms)
+        self._total_len += length
+        for term, tf in terms.items():
+            posting = self._postings[term]
+            if not posting and keep_sorted:
+                bisect.insort(self._terms, term)
+            posting[doc_id] = tf
+
+    def add(self, product) -> None:
+        self._add_terms(product.id, product.categoryId, product_terms(product))
+
+    def remove(self, doc_id: str) -> None:
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        self._total_len -= doc[1]
+        for term in self._doc_terms.pop(doc_id):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(doc_id, None)
+            if not posting:
+                del self._postings[term]
+                i = bisect.bisect_left(self._terms, term)
+                if i < len(self._terms) and self._terms[i] == term:
+                    del self._terms[i]
+
+    def _expand_prefix(self, prefix: str) -> list[str]:
+        i = bisect.bisect_left(self._terms, prefix)
+        out = []
+        while i < len(self._terms) and self._terms[i].startswith(prefix) and len(out) < MAX_PREFIX_EXPANSION:
+            out.append(self._terms[i])
+            i += 1
+        return out
+
+    def search(self, query: str, category_id: Optional[int] = None, limit: int = 20, prefix: bool = True) -> dict:
+        tokens = tokenize(query)
+        n = len(self._docs)
+        if not tokens or not n:
+            return {"ids": [], "total": 0, "facets": {}}
+        avg_len = self._total_len / n
+
+        scores: dict[str, float] = defaultdict(float)
+        for pos, tok in enumerate(tokens):
+            if prefix and pos == len(tokens) - 1:
+                terms = self._expand_prefix(tok)
+            else:
+                terms = [tok] if tok in self._postings else []
+            for term in terms:
+                posting = self._postings[term]
+                idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                for doc_id, tf in posting.items():
+                    length = self._docs[doc_id][1]
+                    scores[doc_id] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_len))
+
+        facets: Counter = Counter()
+        for doc_id in scores:
+            facets[self._docs[doc_id][0]] += 1
+        if category_id is not None:
+            matched = [(s, d) for d, s in scores.items() if self._docs[d][0] == category_id]
+        else:
+            matched = [(s, d) for d, s in scores.items()]
+        matched.sort(key=lambda x: (-x[0], x[1]))
+        return {
+            "ids": [d for _, d in matched[:limit]],
+            "total": len(matched),
+            "facets": {str(k) if k is not None else "General": v for k, v in facets.items()},
+        }
+
+    # ---------------------------
+    # Build / snapshot
+    # ---------------------------
+
+    async def _iter_products(self, prisma) -> AsyncIterator:
+        cursor = None
+        while True:
+            kwargs = {"take": BUILD_BATCH, "order": {"id": "asc"}}
+            if cursor:
+                kwargs["cursor"] = {"id": cursor}
+                kwargs["skip"] = 1
+            rows = await prisma.product.find_many(**kwargs)
+            for row in rows:
+                yield row
+            if len(rows) < BUILD_BATCH:
+                return
+            cursor = rows[-1].id
+
+    async def build(self) -> None:
+        started = time.perf_counter()
+        fresh = SearchIndex()
+        async with pool.acquire() as prisma:
+            async for product in self._iter_products(prisma):
+                fresh._add_terms(product.id, product.categoryId, product_terms(product), keep_sorted=False)
+        fresh._terms = sorted(fresh._postings)
+        self.__dict__.update(fresh.__dict__)
+        self.built_at = time.time()
+        self.build_seconds = time.perf_counter() - started
+
+    async def load_or_build(self, path: str = SEARCH_SNAPSHOT_PATH) -> None:
+        started = time.perf_counter()
+        if not self.load_snapshot(path):
+            await self.build()
+            self.save_snapshot(path)
+            return
+        async with pool.acquire() as prisma:
+            await self.reconcile(prisma)
+        self.build_seconds = time.perf_counter() - started
+
+    async def reconcile(self, prisma) -> None:
+        # Drop deleted ids and index rows the index hasn't seen.
+        rows = await prisma.query_raw('SELECT id FROM "Product"')
+        live = {r["id"] for r in rows}
+        for doc_id in set(self._docs) - live:
+            self.remove(doc_id)
+        missing = list(live - set(self._docs))
+        for i in range(0, len(missing), BUILD_BATCH):
+            for product in await prisma.product.find_many(where={"id": {"in": missing[i:i + BUILD_BATCH]}}):
+                self.add(product)
+        self.built_at = time.time()
+
+    def save_snapshot(self, path: str = SEARCH_SNAPSHOT_PATH) -> None:
+        data = {
+            "format": SNAPSHOT_FORMAT,
+            "docs": [[doc_id, cat, self._doc_terms[doc_id]] for doc_id, (cat, _) in self._docs.items()],
+        }
+        # Per process: several workers may save at the same time.
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    def load_snapshot(self, path: str = SEARCH_SNAPSHOT_PATH) -> bool:
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get("format") != SNAPSHOT_FORMAT:
+            return False
+        fresh = SearchIndex()
+        for doc_id, cat, terms in data["docs"]:
+            fresh._add_terms(doc_id, cat, terms, keep_sorted=False)
+        fresh._terms = sorted(fresh._postings)
+        self.__dict__.update(fresh.__dict__)
+        self.loaded_from_snapshot = True
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "docs": len(self._docs),
+            "terms": len(self._terms),
+            "built_at": self.built_at,
+            "build_seconds": round(self.build_seconds, 3),
+            "loaded_from_snapshot": self.loaded_from_snapshot,
+        }
+
+
+search_index = SearchIndex()
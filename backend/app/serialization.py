@@ -0,0 +1,56 @@
+from functools import lru_cache
+from types import UnionType
+from typing import Any, Dict, List, Optional, Union, get_args, get_origin
+
+from fastapi.responses import Response
+from pydantic import BaseModel, TypeAdapter
+from typing_extensions import TypedDict
+
+# ---------------------------
+# Response serialization fast path
+# ---------------------------
+# Returning Pydantic objects from a route with response_model makes FastAPI
+# validate them a second time and then encode them with the stdlib json
+# module. For list endpoints this dominates the request. Instead, routes map
+# Prisma rows to plain dicts and encode them here in one pass with a
+# pydantic-core serializer compiled once per response type, then return the
+# bytes directly (FastAPI leaves a returned Response alone). The serializer
+# schema is derived from the existing response models, so the wire format
+# and the OpenAPI docs stay exactly as they were.
+
+
+@lru_cache(maxsize=None)
+def _row_typeddict(model: type) -> type:
+    fields = {name: row_type(f.annotation) for name, f in model.model_fields.items()}
+    return TypedDict(f"{model.__name__}Row", fields)
+
+
+def row_type(tp: Any) -> Any:
+    """The shape of `tp` with every Pydantic model replaced by a TypedDict."""
+    if isinstance(tp, type) and issubclass(tp, BaseModel):
+        return _row_typeddict(tp)
+    origin = get_origin(tp)
+    if origin is None:
+        return tp
+    args = tuple(row_type(a) for a in get_args(tp))
+    if origin in (list, List):
+        return List[args[0]]
+    if origin in (dict, Dict):
+        return Dict[args[0], args[1]]
+    if origin in (Union, UnionType):
+        return Union[args]
+    return tp
+
+
+@lru_cache(maxsize=None)
+def _adapter(tp: Any) -> TypeAdapter:
+    return TypeAdapter(row_type(tp))
+
+
+def dump(tp: Any, data: Any) -> bytes:
+    """Encode rows shaped like `tp` (a response model or List[...] of one) to JSON."""
+    return _adapter(tp).dump_json(data)
+
+
+def json_response(tp: Any, data: Any, status_code: int = 200, headers: Optional[dict] = None) -> Response:
+    return Response(content=dump(tp, data), status_code=status_code, media_type="application/json", headers=headers)
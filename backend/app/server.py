@@ -0,0 +1,253 @@
+import argparse
+import importlib
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from multiprocessing.connection import wait
+from typing import Optional
+
+import uvicorn
+
+# ---------------------------
+# Production launcher
+# ---------------------------
+#     python -m app.server --workers 4 --port 8000
+#
+# The master binds the listening socket once and pre-forks the workers onto
+# it. The kernel hands each connection to a worker that is accepting. A
+# worker runs the app's startup first: it connects the engine, loads the
+# indexes and warms up (app/warmup.py). Only then does it start accepting,
+# so until it reports ready the other workers take its share. The master
+# logs each worker's time to ready, and the worker exports its phases under
+# "startup" in /stats.
+#
+# Every worker keeps its own caches and indexes. The launcher turns on the
+# change feed (app/changes.py), through which each worker applies the
+# writes the others made; carts write through and idempotency keys are
+# claimed in the database while it is on.
+#
+# SIGHUP does a rolling restart, one slot at a time. A replacement is
+# started and must report ready before the old worker gets SIGTERM and
+# drains. If a replacement does not come up, the rollout stops and the old
+# worker keeps serving. SIGTERM or SIGINT drains every worker and exits. A
+# worker that dies is replaced.
+#
+# Slot 0 is the leader: the only worker running the singleton loops
+# (trending, dispatch, hold sweeper). While it is being replaced the old and
+# new leader briefly overlap; the loops only make conditional writes, so
+# whichever gets there second finds nothing to do. With --preload (the default) the
+# master imports the app once and every fork inherits it, so workers skip
+# the import. Run with --no-preload when rolling restarts must pick up new
+# code; each worker then imports the app itself.
+
+APP = "app.main:app"
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+WORKER_READY_TIMEOUT = float(os.getenv("WORKER_READY_TIMEOUT", "120"))
+WORKER_GRACEFUL_TIMEOUT = float(os.getenv("WORKER_GRACEFUL_TIMEOUT", "30"))
+RESPAWN_BACKOFF = 1.0
+LISTEN_BACKLOG = 2048
+
+log = logging.getLogger("cartify.server")
+
+
+class WorkerServer(uvicorn.Server):
+    def __init__(self, config: uvicorn.Config, conn, spawned_at: float):
+        super().__init__(config)
+        self.conn = conn
+        self.spawned_at = spawned_at
+
+    async def startup(self, sockets=None) -> None:
+        # Lifespan startup runs first; the sockets are only served after it.
+        await super().startup(sockets=sockets)
+        if self.should_exit:
+            return
+        # Loaded by now, either inherited from the master or imported by
+        # uvicorn just above.
+        from .main import startup_report
+
+        startup_report["ready_seconds"] = round(time.time() - self.spawned_at, 3)
+        self.conn.send(dict(startup_report))
+
+
+def run_worker(slot: int, sock: socket.socket, conn, spawned_at: float, log_level: str) -> None:
+    os.environ["CARTIFY_WORKER"] = str(slot)
+    os.environ["CARTIFY_LEADER"] = "1" if slot == 0 else "0"
+    if hasattr(signal, "SIGHUP"):
+        # Meant for the master only.
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    config = uvicorn.Config(APP, log_level=log_level, timeout_graceful_shutdown=WORKER_GRACEFUL_TIMEOUT)
+    WorkerServer(config, conn, spawned_at).run(sockets=[sock])
+
+
+class Worker:
+    def __init__(self, slot: int, process, conn, spawned_at: float):
+        self.slot = slot
+        self.process = process
+        self.conn = conn
+        self.spawned_at = spawned_at
+        self.report: Optional[dict] = None
+
+
+class Master:
+    def __init__(self, host: str, port: int, workers: int, preload: bool, log_level: str):
+        self.host = host
+        self.port = port
+        self.size = max(1, workers)
+        self.preload = preload
+        self.log_level = log_level
+        self.ctx = multiprocessing.get_context("fork" if hasattr(os, "fork") else "spawn")
+        self.sock: Optional[socket.socket] = None
+        self.workers: dict[int, Worker] = {}
+        self.stopping = False
+        self.restart_requested = False
+
+    def bind(self) -> None:
+        family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(LISTEN_BACKLOG)
+        sock.set_inheritable(True)
+        self.sock = sock
+
+    def spawn(self, slot: int) -> Worker:
+        reader, writer = self.ctx.Pipe(duplex=False)
+        spawned_at = time.time()
+        process = self.ctx.Process(
+            target=run_worker,
+            args=(slot, self.sock, writer, spawned_at, self.log_level),
+            name=f"cartify-worker-{slot}",
+        )
+        process.start()
+        writer.close()
+        return Worker(slot, process, reader, spawned_at)
+
+    def wait_ready(self, workers: list[Worker], timeout: float = WORKER_READY_TIMEOUT) -> bool:
+        """Block until every worker reports ready; False if any dies or times out."""
+        pending = {w.conn: w for w in workers}
+        deadline = time.monotonic() + timeout
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self.stopping:
+                return False
+            for conn in wait(list(pending), timeout=min(remaining, 0.5)):
+                worker = pending.pop(conn)
+                try:
+                    worker.report = conn.recv()
+                except (EOFError, OSError):
+                    log.error("worker %d [pid %s] exited during startup", worker.slot, worker.process.pid)
+                    return False
+                self._log_ready(worker)
+        return True
+
+    def _log_ready(self, worker: Worker) -> None:
+        r = worker.report
+        log.info(
+            "worker %d [pid %s] ready in %.2fs (connect %.2fs, indexes %.2fs, warm-up %.2fs%s)%s",
+            worker.slot, worker.process.pid, r["ready_seconds"], r["connect_seconds"], r["indexes_seconds"],
+            r["warmup_seconds"], f", {r['warmup_failed']} warm-up requests failed" if r["warmup_failed"] else "",
+            " leader" if r["leader"] else "",
+        )
+
+    def stop(self, workers: list[Worker]) -> None:
+        # All drain in parallel; stragglers are killed after the grace period.
+        for w in workers:
+            if w.process.is_alive():
+                w.process.terminate()
+        deadline = time.monotonic() + WORKER_GRACEFUL_TIMEOUT + 5
+        for w in workers:
+            w.process.join(max(0.0, deadline - time.monotonic()))
+            if w.process.is_alive():
+                log.warning("worker %d [pid %s] did not drain in time, killing it", w.slot, w.process.pid)
+                w.process.kill()
+                w.process.join()
+            w.conn.close()
+
+    def rolling_restart(self) -> None:
+        log.info("rolling restart of %d workers", len(self.workers))
+        started = time.monotonic()
+        for slot in sorted(self.workers):
+            if self.stopping:
+                return
+            old = self.workers[slot]
+            new = self.spawn(slot)
+            if not self.wait_ready([new]):
+                log.error("replacement for worker %d did not become ready; keeping the old one and stopping the rollout", slot)
+                self.stop([new])
+                return
+            self.workers[slot] = new
+            self.stop([old])
+        log.info("rolling restart done in %.2fs", time.monotonic() - started)
+
+    def replace_dead(self) -> None:
+        for slot, w in list(self.workers.items()):
+            if w.process.is_alive() or self.stopping:
+                continue
+            log.warning("worker %d [pid %s] exited with %s, replacing it", slot, w.process.pid, w.process.exitcode)
+            w.conn.close()
+            # Don't spin if it dies straight away every time.
+            time.sleep(max(0.0, RESPAWN_BACKOFF - (time.time() - w.spawned_at)))
+            self.workers[slot] = self.spawn(slot)
+            self.wait_ready([self.workers[slot]])
+
+    def _on_stop(self, signum, frame) -> None:
+        self.stopping = True
+
+    def _on_restart(self, signum, frame) -> None:
+        self.restart_requested = True
+
+    def run(self) -> int:
+        self.bind()
+        log.info("listening on %s:%d with %d workers", self.host, self.port, self.size)
+        # Before the preload: app modules read it at import.
+        os.environ.setdefault("CHANGE_FEED", "1")
+        if self.preload:
+            started = time.perf_counter()
+            importlib.import_module(APP.split(":")[0])
+            log.info("app preloaded in %.2fs", time.perf_counter() - started)
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self._on_restart)
+
+        started = time.monotonic()
+        self.workers = {slot: self.spawn(slot) for slot in range(self.size)}
+        if not self.wait_ready(list(self.workers.values())):
+            log.error("workers failed to start")
+            self.stop(list(self.workers.values()))
+            return 1
+        log.info("%d workers ready in %.2fs", self.size, time.monotonic() - started)
+
+        while not self.stopping:
+            if self.restart_requested:
+                self.restart_requested = False
+                self.rolling_restart()
+            self.replace_dead()
+            time.sleep(0.5)
+
+        log.info("shutting down")
+        self.stop(list(self.workers.values()))
+        self.sock.close()
+        return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the API with pre-forked, warmed-up workers.")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY)
+    parser.add_argument("--preload", action=argparse.BooleanOptionalAction, default=True,
+                        help="import the app in the master before forking (default: on)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s [%(process)d] %(name)s: %(message)s")
+    raise SystemExit(Master(args.host, args.port, args.workers, args.preload, args.log_level).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from prisma import Prisma
+
+from .catalog import catalog
+from .changes import changes
+from .db import pool
+
+# ---------------------------
+# Trending scores
+# ---------------------------
+# Popularity is a time-decayed sum of units sold with a half-life of
+# TRENDING_HALF_LIFE_HOURS. It uses forward decay: a unit sold at time t
+# adds 2 ** ((t - epoch) / half_life) to its product's score. Older sales
+# weigh exponentially less relative to newer ones, yet no stored score ever
+# has to be decayed, and scores of products that have not sold lately stay
+# comparable. The epoch is moved forward (and every score divided down)
+# before the weights get large.
+#
+# Each run reads only order items past the watermark (OrderItem.id is
+# autoincrement, so it is a safe high-water mark), folds them in and then
+# flips Product.trending for the top TRENDING_TOP_N in two bulk updates.
+# The watermark and epoch only move from the values a batch was read at,
+# so two processes running the job at once never fold the same items twice
+# or rebase twice.
+
+TRENDING_INTERVAL = float(os.getenv("TRENDING_INTERVAL", "300"))  # 0 disables
+TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "72"))
+TRENDING_TOP_N = int(os.getenv("TRENDING_TOP_N", "50"))
+TRENDING_BATCH = int(os.getenv("TRENDING_BATCH", "5000"))
+# Rebase once the newest weight would exceed 2 ** REBASE_AFTER_HALF_LIVES.
+REBASE_AFTER_HALF_LIVES = 64
+PRODUCT_LOOKUP_CHUNK = 500
+STATE_ID = 1
+
+log = logging.getLogger("cartify.trending")
+
+
+class WatermarkMoved(Exception):
+    pass
+
+
+class TrendingJob:
+    def __init__(self, half_life_hours: float = TRENDING_HALF_LIFE_HOURS, top_n: int = TRENDING_TOP_N, batch_size: int = TRENDING_BATCH):
+        self.half_life = half_life_hours * 3600
+        self.top_n = top_n
+        self.batch_size = batch_size
+        self.runs = 0
+        self.items_folded = 0
+        self.watermark = 0
+        self.last_run_seconds = 0.0
+
+    def weight(self, at: datetime, epoch: datetime) -> float:
+        return 2.0 ** ((at - epoch).total_seconds() / self.half_life)
+
+    async def _state(self, prisma: Prisma):
+        state = await prisma.trendingstate.find_unique(where={"id": STATE_ID})
+        if state is None:
+            state = await prisma.trendingstate.create(data={"id": STATE_ID, "lastItemId": 0, "epoch": datetime.now(timezone.utc)})
+        return state
+
+    async def _rebase(self, prisma: Prisma, epoch: datetime) -> datetime:
+        half_lives = int((datetime.now(timezone.utc) - epoch).total_seconds() // self.half_life)
+        if half_lives < REBASE_AFTER_HALF_LIVES:
+            return epoch
+        new_epoch = epoch + timedelta(seconds=half_lives * self.half_life)
+        try:
+            async with prisma.tx() as tx:
+                if not await tx.trendingstate.update_many(where={"id": STATE_ID, "epoch": epoch}, data={"epoch": new_epoch}):
+                    raise WatermarkMoved()
+                await tx.execute_raw('UPDATE "ProductPopularity" SET "score" = "score" / ?', 2.0 ** half_lives)
+        except WatermarkMoved:
+            # Rebased by another process already.
+            return (await self._state(prisma)).epoch
+        return new_epoch
+
+    async def fold_new_items(self, prisma: Prisma) -> int:
+        state = await self._state(prisma)
+        epoch = await self._rebase(prisma, state.epoch)
+        last_id = state.lastItemId
+        folded = 0
+        while True:
+            start_id = last_id
+            items = await prisma.orderitem.find_many(
+                where={"id": {"gt": start_id}},
+                order={"id": "asc"},
+                take=self.batch_size,
+                include={"order": True},
+            )
+            if not items:
+                break
+            last_id = items[-1].id
+            scores: dict[str, float] = defaultdict(float)
+            for item in items:
+                if item.order is None or item.order.status == "cancelled":
+                    continue
+                scores[item.productId] += item.quantity * self.weight(item.order.createdAt, epoch)
+            ids = list(scores)
+            categories = {}
+            for i in range(0, len(ids), PRODUCT_LOOKUP_CHUNK):
+                for p in await prisma.product.find_many(where={"id": {"in": ids[i:i + PRODUCT_LOOKUP_CHUNK]}}):
+                    categories[p.id] = p.categoryId
+            try:
+                async with prisma.tx(timeout=timedelta(seconds=60)) as tx:
+                    # Watermark moves in the same transaction as the scores, and
+                    # only if nobody folded or rebased since we read it.
+                    moved = await tx.trendingstate.update_many(
+                        where={"id": STATE_ID, "lastItemId": start_id, "epoch": epoch},
+                        data={"lastItemId": last_id},
+                    )
+                    if not moved:
+                        raise WatermarkMoved()
+                    for pid, score in scores.items():
+                        await tx.productpopularity.upsert(
+                            where={"productId": pid},
+                            data={
+                                "create": {"productId": pid, "categoryId": categories.get(pid), "score": score},
+                                "update": {"categoryId": categories.get(pid), "score": {"increment": score}},
+                            },
+                        )
+            except WatermarkMoved:
+                # Another process folded this batch first; leave the rest to it.
+                last_id = start_id
+                break
+            folded += len(items)
+        self.watermark = last_id
+        return folded
+
+    async def refresh_flags(self, prisma: Prisma) -> None:
+        top = [r.productId for r in await prisma.productpopularity.find_many(order={"score": "desc"}, take=self.top_n)]
+        async with prisma.tx() as tx:
+            await tx.product.update_many(where={"trending": True, "id": {"not_in": top}}, data={"trending": False})
+            if top:
+                await tx.product.update_many(where={"id": {"in": top}}, data={"trending": True})
+
+    async def run(self, prisma: Prisma) -> int:
+        started = time.perf_counter()
+        folded = await self.fold_new_items(prisma)
+        if folded or not self.runs:
+            await self.refresh_flags(prisma)
+            # Product pages filtered on trending, and the cached trending lists.
+            catalog.invalidate_pages()
+            await changes.publish(prisma, "pages")
+        self.runs += 1
+        self.items_folded += folded
+        self.last_run_seconds = time.perf_counter() - started
+        return folded
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "items_folded": self.items_folded,
+            "watermark": self.watermark,
+            "last_run_ms": round(self.last_run_seconds * 1000, 3),
+        }
+
+
+trending = TrendingJob()
+
+
+async def top_trending(prisma: Prisma, category_id=None, limit: int = 20) -> list:
+    """Products in descending score order, optionally within one category."""
+    where = {"categoryId": category_id} if category_id is not None else {}
+    ranked = await prisma.productpopularity.find_many(where=where, order={"score": "desc"}, take=limit)
+    rows = await prisma.product.find_many(where={"id": {"in": [r.productId for r in ranked]}}) if ranked else []
+    by_id = {p.id: p for p in rows}
+    return [by_id[r.productId] for r in ranked if r.productId in by_id]
+
+
+async def run_trending_job(interval: float = TRENDING_INTERVAL) -> None:
+    while True:
+        try:
+            async with pool.acquire() as prisma:
+                await trending.run(prisma)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("trending run failed")
+        await asyncio.sleep(interval)
@@ -0,0 +1,82 @@
+import logging
+import os
+import time
+from collections import Counter
+
+from .db import pool
+
+# ---------------------------
+# Worker warm-up
+# ---------------------------
+# Run at the end of startup, before the worker takes traffic. Requests go
+# through the app in-process, so they exercise the same path a client
+# would: middleware, the Prisma engine's first queries, the response
+# serializers (compiled on first use) and the catalog snapshot, which
+# keeps the bodies. The first real visitor to the storefront, a category
+# page or a hot product then gets a cached body. Only cached routes are
+# warmed; anything else would just cost startup time.
+
+WARMUP = os.getenv("WARMUP", "1") != "0"
+WARMUP_CATEGORIES = int(os.getenv("WARMUP_CATEGORIES", "20"))
+WARMUP_HOT_PRODUCTS = int(os.getenv("WARMUP_HOT_PRODUCTS", "50"))
+
+log = logging.getLogger("cartify.warmup")
+
+
+async def _get(app, path: str, query: str = "") -> int:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": [(b"host", b"warmup"), (b"accept-encoding", b"gzip, br")],
+        "client": ("127.0.0.1", 0),
+        "server": ("warmup", 80),
+    }
+    status = 500
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def targets() -> list[tuple[str, str]]:
+    async with pool.acquire() as prisma:
+        categories = await prisma.category.find_many(order={"id": "asc"}, take=WARMUP_CATEGORIES)
+        hot = [r.productId for r in await prisma.productpopularity.find_many(order={"score": "desc"}, take=WARMUP_HOT_PRODUCTS)]
+        if not hot:
+            hot = [p.id for p in await prisma.product.find_many(order={"createdAt": "desc"}, take=WARMUP_HOT_PRODUCTS)]
+    paths = [("/products/", ""), ("/products/trending", ""), ("/products/facets", "")]
+    paths += [("/products/", f"category={c.id}") for c in categories]
+    paths += [(f"/products/{pid}", "") for pid in hot]
+    return paths
+
+
+async def warm_up(app) -> dict:
+    started = time.perf_counter()
+    statuses: Counter = Counter()
+    for path, query in await targets():
+        try:
+            statuses[await _get(app, path, query)] += 1
+        except Exception:
+            log.exception("warm-up request %s failed", path)
+            statuses["error"] += 1
+    report = {
+        "requests": sum(statuses.values()),
+        "failed": sum(n for status, n in statuses.items() if status == "error" or status >= 400),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    log.info("warm-up: %(requests)d requests, %(failed)d failed, %(seconds).3fs", report)
+    return report
@@ -0,0 +1,61 @@
+"""Fold existing orders into the sales rollup tables.
+
+Walks orders that have not been rolled up yet (Order.rolledUp = false) in
+id order and folds each batch in its own transaction, so it can be stopped
+and rerun at any time and is safe to run next to a live server. --rebuild
+first empties the rollups and marks every order as not rolled up.
+
+Usage (from backend/):
+    python scripts/backfill_rollups.py
+    python scripts/backfill_rollups.py --rebuild --batch-size 2000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DATABASE_URL", "file:./dev.db")
+
+from prisma import Prisma  # noqa: E402
+
+from app.analytics import reset_rollups, roll_up_orders  # noqa: E402
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--rebuild", action="store_true", help="recompute the rollups from scratch")
+    args = parser.parse_args()
+
+    prisma = Prisma()
+    await prisma.connect()
+    started = time.perf_counter()
+    folded = 0
+    try:
+        if args.rebuild:
+            async with prisma.tx(timeout=timedelta(seconds=300)) as tx:
+                await reset_rollups(tx)
+        total = await prisma.order.count(where={"rolledUp": False})
+        last_id = None
+        while True:
+            where: dict = {"rolledUp": False}
+            if last_id is not None:
+                where["id"] = {"gt": last_id}
+            batch = await prisma.order.find_many(where=where, order={"id": "asc"}, take=args.batch_size)
+            if not batch:
+                break
+            last_id = batch[-1].id
+            async with prisma.tx(timeout=timedelta(seconds=120)) as tx:
+                folded += await roll_up_orders(tx, [o.id for o in batch])
+            rate = folded / max(time.perf_counter() - started, 1e-9)
+            print(f"\r{folded:>10}/{total:<10} {rate:>10.0f} orders/s", end="", flush=True)
+    finally:
+        await prisma.disconnect()
+    print(f"\nfolded {folded} orders in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
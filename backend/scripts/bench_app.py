@@ -0,0 +1,207 @@
+"""In-process load test for app.main:app over httpx's ASGI transport.
+
+Runs a weighted mix of storefront, auth, checkout, order-history and admin
+traffic against the SQLite database, then reports p50/p95/p99 and
+requests/s per route and writes them to a JSON file. Pass --compare with an
+earlier results file to flag regressions. The database needs products and
+the default accounts; scripts/generate_data.py creates both (seed.py only
+creates the accounts).
+
+Usage (from backend/):
+    python scripts/generate_data.py --products 20000 --users 2000 --order-items 50000
+    python scripts/bench_app.py --duration 20 --concurrency 32 --out bench.json
+    python scripts/bench_app.py --out bench2.json --compare bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DATABASE_URL", "file:./dev.db")
+# Every simulated client shares one address; keep the login limiter out of the way.
+os.environ.setdefault("LOGIN_RATE_PER_MINUTE", "1000000")
+os.environ.setdefault("LOGIN_BURST", "1000000")
+
+import httpx  # noqa: E402
+
+from app.main import app  # noqa: E402
+
+PASSWORD = "password123"
+CUSTOMER_EMAIL = "customer@cartify.com"
+ADMIN_EMAIL = "admin@cartify.com"
+
+# scenario -> weight
+MIX = {
+    "browse": 50,
+    "product": 20,
+    "search": 10,
+    "login": 5,
+    "checkout": 5,
+    "orders_me": 7,
+    "admin_applications": 3,
+}
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.statuses: dict[str, dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    def add(self, route: str, status: int, seconds: float) -> None:
+        self.latencies[route].append(seconds)
+        self.statuses[route][status] += 1
+
+    def summary(self, elapsed: float) -> dict:
+        out = {}
+        for route, values in sorted(self.latencies.items()):
+            values.sort()
+            n = len(values)
+            out[route] = {
+                "requests": n,
+                "rps": round(n / elapsed, 1),
+                "p50_ms": round(values[int(0.50 * (n - 1))] * 1000, 2),
+                "p95_ms": round(values[int(0.95 * (n - 1))] * 1000, 2),
+                "p99_ms": round(values[int(0.99 * (n - 1))] * 1000, 2),
+                "max_ms": round(values[-1] * 1000, 2),
+                "statuses": dict(self.statuses[route]),
+            }
+        return out
+
+
+async def timed(client: httpx.AsyncClient, rec: Recorder, route: str, method: str, url: str, **kwargs) -> httpx.Response:
+    started = time.perf_counter()
+    resp = await client.request(method, url, **kwargs)
+    rec.add(route, resp.status_code, time.perf_counter() - started)
+    return resp
+
+
+async def login(client: httpx.AsyncClient, email: str) -> dict:
+    resp = await client.post("/auth/login", json={"email": email, "password": PASSWORD})
+    resp.raise_for_status()
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+async def run_scenario(name: str, client: httpx.AsyncClient, rec: Recorder, ctx: dict, rng: random.Random) -> None:
+    if name == "browse":
+        params = {"limit": 24}
+        if ctx["cursors"] and rng.random() < 0.5:
+            params["cursor"] = rng.choice(ctx["cursors"])
+        if ctx["categories"] and rng.random() < 0.3:
+            params["category"] = str(rng.choice(ctx["categories"]))
+        resp = await timed(client, rec, "GET /products/", "GET", "/products/", params=params)
+        if resp.status_code == 200:
+            nxt = resp.json().get("nextCursor")
+            if nxt and len(ctx["cursors"]) < 200:
+                ctx["cursors"].append(nxt)
+    elif name == "product":
+        await timed(client, rec, "GET /products/{id}", "GET", f"/products/{rng.choice(ctx['product_ids'])}")
+    elif name == "search":
+        await timed(client, rec, "GET /products/search", "GET", "/products/search", params={"q": rng.choice(ctx["terms"])})
+    elif name == "login":
+        await timed(client, rec, "POST /auth/login", "POST", "/auth/login", json={"email": CUSTOMER_EMAIL, "password": PASSWORD})
+    elif name == "checkout":
+        items = [{"productId": pid, "quantity": 1} for pid in rng.sample(ctx["product_ids"], min(len(ctx["product_ids"]), rng.randint(1, 3)))]
+        await timed(client, rec, "POST /orders/", "POST", "/orders/", headers=ctx["customer"], json={"items": items, "shippingAddress": "1 Bench Street"})
+    elif name == "orders_me":
+        await timed(client, rec, "GET /orders/me", "GET", "/orders/me", headers=ctx["customer"])
+    elif name == "admin_applications":
+        await timed(client, rec, "GET /admin/applications", "GET", "/admin/applications", headers=ctx["admin"], params={"status": "pending"})
+
+
+async def worker(client: httpx.AsyncClient, rec: Recorder, ctx: dict, deadline: float, seed: int) -> None:
+    rng = random.Random(seed)
+    names = list(MIX)
+    weights = [MIX[n] for n in names]
+    while time.perf_counter() < deadline:
+        await run_scenario(rng.choices(names, weights)[0], client, rec, ctx, rng)
+
+
+def compare(current: dict, baseline_path: str, threshold: float) -> int:
+    with open(baseline_path) as f:
+        baseline = json.load(f)["routes"]
+    regressions = 0
+    print(f"\n{'route':32} {'p95 base':>10} {'p95 now':>10} {'change':>8}")
+    for route, now in current.items():
+        base = baseline.get(route)
+        if not base or not base["p95_ms"]:
+            continue
+        change = (now["p95_ms"] - base["p95_ms"]) / base["p95_ms"]
+        flag = "  REGRESSION" if change > threshold else ""
+        regressions += bool(flag)
+        print(f"{route:32} {base['p95_ms']:>10} {now['p95_ms']:>10} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def git_rev() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare")
+    parser.add_argument("--threshold", type=float, default=0.10, help="p95 increase counted as a regression")
+    args = parser.parse_args()
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            first = (await client.get("/products/", params={"limit": 100})).json()
+            if not first["items"]:
+                sys.exit("No products in the database; run scripts/generate_data.py first")
+            cats = (await client.get("/admin/categories")).json()
+            ctx = {
+                "product_ids": [p["id"] for p in first["items"]],
+                "cursors": [first["nextCursor"]] if first.get("nextCursor") else [],
+                "categories": [c["id"] for c in cats],
+                "terms": sorted({w.lower() for p in first["items"] for w in p["title"].split() if len(w) > 2}) or ["shoe"],
+                "customer": await login(client, CUSTOMER_EMAIL),
+                "admin": await login(client, ADMIN_EMAIL),
+            }
+            rec = Recorder()
+            started = time.perf_counter()
+            deadline = started + args.duration
+            await asyncio.gather(*(worker(client, rec, ctx, deadline, args.seed + i) for i in range(args.concurrency)))
+            elapsed = time.perf_counter() - started
+
+    routes = rec.summary(elapsed)
+    results = {
+        "meta": {
+            "git": git_rev(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "duration_s": round(elapsed, 2),
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "mix": MIX,
+            "total_rps": round(sum(r["requests"] for r in routes.values()) / elapsed, 1),
+        },
+        "routes": routes,
+    }
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"{'route':32} {'req':>7} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for route, r in routes.items():
+        print(f"{route:32} {r['requests']:>7} {r['rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8}")
+    print(f"total {results['meta']['total_rps']} req/s -> {args.out}")
+
+    if args.compare and compare(routes, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
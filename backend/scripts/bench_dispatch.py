@@ -0,0 +1,99 @@
+"""Benchmark delivery-partner assignment.
+
+By default plans synthetic in-memory orders, which times the heap planner
+alone. With --db it runs the real batch sweep (reads, plan, bulk writes)
+against DATABASE_URL, e.g. a database filled by generate_data.py; add
+--dry-run to plan without writing.
+
+Usage (from backend/):
+    python scripts/bench_dispatch.py --orders 100000 --partners 1000
+    python scripts/bench_dispatch.py --db --dry-run
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DATABASE_URL", "file:./dev.db")
+
+from app.dispatch import Dispatcher, assign_pending  # noqa: E402
+
+
+def synthetic(args) -> None:
+    rng = random.Random(args.seed)
+    partners = [
+        SimpleNamespace(id=f"d{i:06d}", address=f"{rng.randint(1, 999)} Depot Rd, Zone {rng.randint(1, args.zones)}")
+        for i in range(args.partners)
+    ]
+    loads = {p.id: rng.randint(0, args.capacity // 2) for p in partners}
+    orders = [
+        SimpleNamespace(id=f"o{i:09d}", shippingAddress=f"{rng.randint(1, 999)} Main St, Zone {rng.randint(1, args.zones)}")
+        for i in range(args.orders)
+    ]
+
+    started = time.perf_counter()
+    dispatcher = Dispatcher(partners, loads, capacity=args.capacity, affinity=not args.no_affinity)
+    unassigned = 0
+    per_partner: Counter = Counter()
+    for i in range(0, len(orders), args.batch_size):
+        assigned, left = dispatcher.plan(orders[i:i + args.batch_size])
+        unassigned += len(left)
+        for pid, ids in assigned.items():
+            per_partner[pid] += len(ids)
+    elapsed = time.perf_counter() - started
+
+    final = sorted(dispatcher.load.values())
+    print(f"planned {args.orders - unassigned} of {args.orders} orders over {args.partners} partners in {elapsed:.3f}s "
+          f"({args.orders / elapsed:,.0f} orders/s)")
+    print(f"unassigned {unassigned}, zone hits {dispatcher.zone_hits}, fallbacks {dispatcher.fallbacks}")
+    print(f"final load min/median/max: {final[0]}/{final[len(final) // 2]}/{final[-1]} (capacity {args.capacity})")
+
+
+async def against_db(args) -> None:
+    from prisma import Prisma
+
+    prisma = Prisma()
+    await prisma.connect()
+    try:
+        report = await assign_pending(
+            prisma,
+            batch_size=args.batch_size,
+            dry_run=args.dry_run,
+            affinity=not args.no_affinity,
+            capacity=args.capacity,
+            limit=args.orders,
+        )
+    finally:
+        await prisma.disconnect()
+    report.pop("perPartner")
+    for key, value in report.items():
+        print(f"{key:12} {value}")
+    if report["seconds"]:
+        print(f"{report['planned'] / report['seconds']:,.0f} orders/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--partners", type=int, default=1000)
+    parser.add_argument("--zones", type=int, default=50)
+    parser.add_argument("--capacity", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--no-affinity", action="store_true")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--db", action="store_true", help="run the real sweep against DATABASE_URL")
+    parser.add_argument("--dry-run", action="store_true", help="with --db: plan only, write nothing")
+    args = parser.parse_args()
+    if args.db:
+        asyncio.run(against_db(args))
+    else:
+        synthetic(args)
+
+
+if __name__ == "__main__":
+    main()
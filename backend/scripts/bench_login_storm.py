@@ -0,0 +1,100 @@
+"""Latency of other routes while a login storm runs through the app.
+
+Drives app.main:app in-process over httpx's ASGI transport, against the
+seeded database. A probe keeps requesting a non-auth route that needs a
+database client (GET /admin/categories by default), first on its own and
+then while --logins concurrent logins run. Logins hash on the password
+pool; if they held their database lease while hashing, the probe would
+queue for a client and fail with 503 once PRISMA_ACQUIRE_TIMEOUT passed.
+
+Usage (from backend/, after `python seed.py`):
+    python scripts/bench_login_storm.py --logins 200 --probe-concurrency 8
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DATABASE_URL", "file:./dev.db")
+# Every simulated client shares one address; keep the login limiter out of the way.
+os.environ.setdefault("LOGIN_RATE_PER_MINUTE", "1000000")
+os.environ.setdefault("LOGIN_BURST", "1000000")
+os.environ.setdefault("PASSWORD_MAX_QUEUE", "100000")
+os.environ.setdefault("WARMUP", "0")
+
+import httpx  # noqa: E402
+
+from app.main import app  # noqa: E402
+
+EMAIL = "customer@cartify.com"
+PASSWORD = "password123"
+
+
+def summarize(latencies: list, statuses: Counter) -> dict:
+    latencies = sorted(latencies)
+    n = len(latencies)
+    return {
+        "requests": n,
+        "p50_ms": round(latencies[int(0.50 * (n - 1))] * 1000, 2) if n else None,
+        "p99_ms": round(latencies[int(0.99 * (n - 1))] * 1000, 2) if n else None,
+        "max_ms": round(latencies[-1] * 1000, 2) if n else None,
+        "statuses": dict(statuses),
+    }
+
+
+async def probe(client: httpx.AsyncClient, path: str, latencies: list, statuses: Counter, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        resp = await client.get(path)
+        latencies.append(time.perf_counter() - started)
+        statuses[resp.status_code] += 1
+
+
+async def phase(client: httpx.AsyncClient, args, logins: int) -> dict:
+    latencies: list = []
+    statuses: Counter = Counter()
+    stop = asyncio.Event()
+    probes = [asyncio.create_task(probe(client, args.probe, latencies, statuses, stop)) for _ in range(args.probe_concurrency)]
+    login_statuses: Counter = Counter()
+
+    async def login():
+        resp = await client.post("/auth/login", json={"email": EMAIL, "password": PASSWORD})
+        login_statuses[resp.status_code] += 1
+
+    started = time.perf_counter()
+    if logins:
+        await asyncio.gather(*(login() for _ in range(logins)))
+    else:
+        await asyncio.sleep(args.quiet_seconds)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await asyncio.gather(*probes)
+    out = {"phase": "storm" if logins else "quiet", "elapsed_s": round(elapsed, 3), "probe": summarize(latencies, statuses)}
+    if logins:
+        out["logins"] = {"count": logins, "per_s": round(logins / elapsed, 1), "statuses": dict(login_statuses)}
+    return out
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--probe", default="/admin/categories", help="non-auth route to time during the storm")
+    parser.add_argument("--probe-concurrency", type=int, default=8)
+    parser.add_argument("--quiet-seconds", type=float, default=3.0, help="probe-only baseline before the storm")
+    args = parser.parse_args()
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            resp = await client.post("/auth/login", json={"email": EMAIL, "password": PASSWORD})
+            if resp.status_code != 200:
+                sys.exit(f"login as {EMAIL} failed ({resp.status_code}); run `python seed.py` first")
+            for logins in (0, args.logins):
+                print(await phase(client, args, logins))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+"""Benchmark response serialization for the list endpoints.
+
+Compares the old path (build Pydantic response objects, let FastAPI
+validate them against response_model, encode with the stdlib json module)
+with app.serialization (plain dicts encoded in one pass). Rows are
+synthetic stand-ins for Prisma records, so no database is needed.
+
+Usage (from backend/):
+    python scripts/bench_serialization.py --rows 10000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DATABASE_URL", "file:./dev.db")
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_model_field  # noqa: E402
+
+from app.routers.orders import OrderOut, order_out, order_row  # noqa: E402
+from app.routers.products import ProductOut, product_row  # noqa: E402
+from app.serialization import dump  # noqa: E402
+
+
+def products(n: int) -> list:
+    return [
+        SimpleNamespace(id=f"p{i:08d}", name=f"Product {i}", description="Lorem ipsum dolor sit amet " * 4,
+                        categoryId=i % 40 or None, price=100 + i % 5000, image=f"https://img.example.com/{i}.jpg")
+        for i in range(n)
+    ]
+
+
+def orders(n: int) -> list:
+    now = datetime.now(timezone.utc)
+    return [
+        SimpleNamespace(id=f"o{i:08d}", customerId="c0001", total=1000 + i, status="placed", paymentStatus="paid",
+                        deliveryPartnerId=None, createdAt=now, shippingAddress="12 Main St, Zone 3", trackingNumber=None,
+                        items=[SimpleNamespace(productId=f"p{j:08d}", quantity=1 + j % 3) for j in range(i % 4 + 1)])
+        for i in range(n)
+    ]
+
+
+def old_path(tp, objects) -> bytes:
+    field = create_model_field(name="Response", type_=tp, mode="serialization")
+    content = asyncio.run(serialize_response(field=field, response_content=objects))
+    return JSONResponse(content).body
+
+
+def timed(label: str, fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    print(f"  {label:<12} {best * 1000:>9.1f} ms")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    cases = [
+        ("products", ProductOut, products(args.rows), lambda p: ProductOut(**product_row(p)), product_row),
+        ("orders", OrderOut, orders(args.rows), order_out, order_row),
+    ]
+    for name, model, rows, to_model, to_row in cases:
+        print(f"{name} x {args.rows}")
+        old = timed("pydantic", lambda: old_path(List[model], [to_model(r) for r in rows]), args.repeat)
+        new = timed("single-pass", lambda: dump(List[model], [to_row(r) for r in rows]), args.repeat)
+        print(f"  speedup      {old / new:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Fire many simultaneous checkouts at one SKU and check nothing is oversold.
+
+Usage (from backend/, against a scratch database):
+    DATABASE_URL=file:./bench.db python scripts/bench_stock_contention.py --orders 500 --stock 120
+Exits non-zero if more units were sold than were in stock.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.db import PrismaPool  # noqa: E402
+from app.inventory import OutOfStock, reserve_stock  # noqa: E402
+
+
+async def checkout(pool: PrismaPool, product_id: str, customer_id: str, latencies: list) -> bool:
+    started = time.perf_counter()
+    try:
+        async with pool.acquire() as prisma:
+            async with prisma.tx() as tx:
+                await reserve_stock(tx, {product_id: 1})
+                await tx.order.create(data={
+                    "customerId": customer_id,
+                    "total": 1,
+                    "status": "pending",
+                    "paymentStatus": "paid",
+                    "shippingAddress": "bench",
+                    "items": {"create": [{"productId": product_id, "quantity": 1}]},
+                })
+        return True
+    except OutOfStock:
+        return False
+    finally:
+        latencies.append(time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=500)
+    parser.add_argument("--stock", type=int, default=120)
+    parser.add_argument("--pool-size", type=int, default=8)
+    args = parser.parse_args()
+
+    pool = PrismaPool(size=args.pool_size, acquire_timeout=120)
+    await pool.connect()
+    try:
+        async with pool.acquire() as prisma:
+            user = await prisma.user.create(data={
+                "name": "Bench Customer", "email": f"bench-{time.time_ns()}@cartify.local",
+                "password": "x", "role": "customer",
+            })
+            product = await prisma.product.create(data={
+                "name": "Flash sale SKU", "price": 1, "image": "", "description": "",
+                "rating": 0.0, "reviews": 0, "stock": args.stock, "sellerId": user.id,
+            })
+
+        latencies: list = []
+        started = time.perf_counter()
+        results = await asyncio.gather(*(checkout(pool, product.id, user.id, latencies) for _ in range(args.orders)))
+        elapsed = time.perf_counter() - started
+
+        async with pool.acquire() as prisma:
+            final = await prisma.product.find_unique(where={"id": product.id})
+            sold = await prisma.orderitem.count(where={"productId": product.id})
+
+        won = sum(results)
+        latencies.sort()
+        print({
+            "orders": args.orders,
+            "initial_stock": args.stock,
+            "succeeded": won,
+            "rejected": args.orders - won,
+            "final_stock": final.stock,
+            "order_items": sold,
+            "orders_per_s": round(args.orders / elapsed, 1),
+            "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+            "p99_ms": round(latencies[int(0.99 * (len(latencies) - 1))] * 1000, 2),
+            "pool": pool.stats(),
+        })
+        expected = min(args.orders, args.stock)
+        if won != expected or sold != won or final.stock != args.stock - won or final.stock < 0:
+            sys.exit("OVERSOLD or lost update detected")
+    finally:
+        await pool.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,253 @@
+"""Deterministic synthetic data generator for benchmarking and index tuning.
+
+Generates users, categories, products, orders and order items with skewed,
+realistic shapes: category sizes and product popularity follow power laws,
+order sizes are mostly small with a long tail, prices are log-normal.
+The same --seed always yields the same rows (bar the password hash's salt):
+timestamps count back from a fixed --epoch, not from the current time.
+Rows are written with create_many in batches, each batch in its own
+transaction.
+
+Usage (from backend/):
+    python scripts/generate_data.py --products 1000000 --users 100000 --order-items 5000000
+    python scripts/generate_data.py --products 20000 --snapshot prisma/bench.db
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DATABASE_URL", "file:./dev.db")
+
+from prisma import Prisma  # noqa: E402
+
+from seed import USERS, pwd_context  # noqa: E402
+
+ID_PREFIX = "gen-"
+CATEGORY_NAMES = [
+    "Electronics", "Fashion", "Home & Garden", "Groceries", "Books", "Beauty & Personal Care",
+    "Sports & Outdoors", "Toys & Games", "Automotive", "Health", "Office", "Pet Supplies",
+    "Music", "Jewelry", "Baby", "Tools", "Furniture", "Kitchen", "Garden", "Video Games",
+]
+ADJECTIVES = ["Classic", "Premium", "Eco", "Smart", "Compact", "Deluxe", "Ultra", "Vintage", "Pro", "Lite"]
+NOUNS = ["Watch", "Jacket", "Lamp", "Speaker", "Backpack", "Bottle", "Shoes", "Kettle", "Headphones", "Chair",
+         "Notebook", "Camera", "Blender", "Tent", "Puzzle", "Serum", "Drill", "Mat", "Mug", "Charger"]
+STATUSES = ["pending", "shipped", "delivered", "delivered", "delivered", "cancelled"]
+EPOCH = "2025-01-01"
+
+
+class Progress:
+    def __init__(self, label: str, total: int):
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.started = time.perf_counter()
+        self._last_print = 0.0
+
+    def add(self, n: int) -> None:
+        self.done += n
+        now = time.perf_counter()
+        if now - self._last_print >= 1.0 or self.done >= self.total:
+            self._last_print = now
+            rate = self.done / max(now - self.started, 1e-9)
+            print(f"\r{self.label:12} {self.done:>10}/{self.total:<10} {rate:>10.0f} rows/s", end="", flush=True)
+        if self.done >= self.total:
+            print()
+
+
+def zipf_cum_weights(n: int, s: float) -> list[float]:
+    total = 0.0
+    cum = []
+    for rank in range(1, n + 1):
+        total += 1.0 / rank ** s
+        cum.append(total)
+    return cum
+
+
+def order_size(rng: random.Random) -> int:
+    # Geometric with mean ~2.5, capped: most carts are small, a few are large.
+    return min(1 + int(rng.expovariate(1 / 1.5)), 25)
+
+
+async def insert_batches(prisma: Prisma, model: str, rows_iter, total: int, batch_size: int) -> None:
+    progress = Progress(model, total)
+    batch = []
+    for row in rows_iter:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            await _flush(prisma, model, batch)
+            progress.add(len(batch))
+            batch = []
+    if batch:
+        await _flush(prisma, model, batch)
+        progress.add(len(batch))
+
+
+async def _flush(prisma: Prisma, model: str, batch: list) -> None:
+    async with prisma.tx(timeout=timedelta(seconds=120)) as tx:
+        await getattr(tx, model).create_many(data=batch)
+
+
+async def reset(prisma: Prisma) -> None:
+    # Children before parents. Once the app has run against the generated
+    # data, other rows point at it too: orders placed by generated customers,
+    # products listed by generated sellers, and real orders holding generated
+    # products. Those orders go as a whole, not just their lines.
+    generated = {"startswith": ID_PREFIX}
+    products = {"OR": [{"id": generated}, {"sellerId": generated}]}
+    mixed = await prisma.order.find_many(
+        where={"items": {"some": {"product": {"is": products}}}, "NOT": [{"id": generated}, {"customerId": generated}]},
+    )
+    orders = {"OR": [{"id": generated}, {"customerId": generated}, {"id": {"in": [o.id for o in mixed]}}]}
+    await prisma.orderitem.delete_many(where={"order": {"is": orders}})
+    await prisma.order.delete_many(where=orders)
+    await prisma.product.delete_many(where=products)
+    await prisma.user.delete_many(where={"id": generated})
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--seller-ratio", type=float, default=0.02)
+    parser.add_argument("--delivery-ratio", type=float, default=0.01)
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--order-items", type=int, default=500_000)
+    parser.add_argument("--days", type=int, default=365, help="spread createdAt over this many days")
+    parser.add_argument("--epoch", default=EPOCH, help="latest createdAt, as an ISO date (default: %(default)s)")
+    parser.add_argument("--popularity-skew", type=float, default=1.1, help="Zipf exponent for product popularity")
+    parser.add_argument("--category-skew", type=float, default=0.8, help="Zipf exponent for category sizes")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--reset", action="store_true", help="delete previously generated rows first")
+    parser.add_argument("--snapshot", help="write a compacted copy of the SQLite database here")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    now = datetime.fromisoformat(args.epoch).replace(tzinfo=timezone.utc)
+    started = time.perf_counter()
+
+    prisma = Prisma()
+    await prisma.connect()
+    try:
+        if args.reset:
+            await reset(prisma)
+
+        # Default accounts, so the benchmark and the seeded credentials keep working.
+        for u in USERS:
+            if not await prisma.user.find_unique(where={"email": u["email"]}):
+                await prisma.user.create(data={**u, "password": pwd_context.hash(u["password"])})
+
+        for name in CATEGORY_NAMES:
+            await prisma.category.upsert(where={"name": name}, data={"create": {"name": name}, "update": {}})
+        category_ids = [c.id for c in await prisma.category.find_many(where={"name": {"in": CATEGORY_NAMES}}, order={"id": "asc"})]
+        category_cum = zipf_cum_weights(len(category_ids), args.category_skew)
+
+        # Users: one shared hash keeps generation fast; every generated user logs in with password123.
+        shared_hash = pwd_context.hash("password123")
+        n_sellers = max(1, int(args.users * args.seller_ratio))
+        n_delivery = max(1, int(args.users * args.delivery_ratio))
+        roles = ["seller"] * n_sellers + ["delivery"] * n_delivery + ["customer"] * max(1, args.users - n_sellers - n_delivery)
+        user_ids = [f"{ID_PREFIX}u{i:08d}" for i in range(len(roles))]
+        sellers = user_ids[:n_sellers]
+        customers = user_ids[n_sellers + n_delivery:]
+
+        def users():
+            for i, (uid, role) in enumerate(zip(user_ids, roles)):
+                yield {
+                    "id": uid,
+                    "name": f"User {i}",
+                    "email": f"user{i}.{args.seed}@gen.cartify.local",
+                    "password": shared_hash,
+                    "role": role,
+                    "rewards": 0,
+                    "address": f"{rng.randint(1, 999)} {rng.choice(['Main', 'Oak', 'Pine', 'Lake'])} St, Zone {rng.randint(1, 50)}",
+                }
+
+        await insert_batches(prisma, "user", users(), len(user_ids), args.batch_size)
+
+        product_ids = [f"{ID_PREFIX}p{i:08d}" for i in range(args.products)]
+        prices: list[int] = []
+
+        def products():
+            for i, pid in enumerate(product_ids):
+                price = max(1, int(math.exp(rng.gauss(3.5, 1.0))))
+                prices.append(price)
+                discount = rng.choice([None, None, None, 5, 10, 20, 30, 50])
+                yield {
+                    "id": pid,
+                    "name": f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {i}",
+                    "categoryId": rng.choices(category_ids, cum_weights=category_cum)[0],
+                    "price": price,
+                    "comparePrice": int(price * 100 / (100 - discount)) if discount else None,
+                    "discount": discount,
+                    "image": f"https://picsum.photos/seed/{i}/400/400",
+                    "description": f"Generated product {i}",
+                    "rating": round(min(5.0, max(1.0, rng.gauss(4.1, 0.6))), 1),
+                    "reviews": min(int(rng.paretovariate(1.2)) - 1, 50_000),
+                    "stock": rng.choice([0, rng.randint(1, 20), rng.randint(20, 500)]),
+                    "sellerId": rng.choice(sellers),
+                    "trending": False,
+                    "createdAt": now - timedelta(seconds=rng.randint(0, args.days * 86400)),
+                }
+
+        await insert_batches(prisma, "product", products(), len(product_ids), args.batch_size)
+
+        # Popularity rank -> product, shuffled so popularity isn't tied to id order.
+        by_popularity = product_ids[:]
+        rng.shuffle(by_popularity)
+        index_of = {pid: i for i, pid in enumerate(product_ids)}
+        popularity_cum = zipf_cum_weights(len(by_popularity), args.popularity_skew)
+
+        # Orders and their items are written together, one batch of orders
+        # per transaction, so nothing but the current batch is held in memory.
+        item_progress = Progress("orderitem", args.order_items)
+        remaining = args.order_items
+        order_no = 0
+        while remaining > 0:
+            orders, items = [], []
+            while remaining > 0 and len(orders) < args.batch_size:
+                size = min(order_size(rng), remaining)
+                remaining -= size
+                oid = f"{ID_PREFIX}o{order_no:09d}"
+                order_no += 1
+                total = 0
+                for pid in rng.choices(by_popularity, cum_weights=popularity_cum, k=size):
+                    qty = 1 if rng.random() < 0.8 else rng.randint(2, 5)
+                    total += prices[index_of[pid]] * qty
+                    items.append({"orderId": oid, "productId": pid, "quantity": qty})
+                orders.append({
+                    "id": oid,
+                    "customerId": rng.choice(customers),
+                    "total": total,
+                    "status": rng.choice(STATUSES),
+                    "paymentStatus": "paid",
+                    "shippingAddress": f"{rng.randint(1, 999)} Generated Ave, Zone {rng.randint(1, 50)}",
+                    "createdAt": now - timedelta(seconds=rng.randint(0, args.days * 86400)),
+                })
+            async with prisma.tx(timeout=timedelta(seconds=120)) as tx:
+                await tx.order.create_many(data=orders)
+                for i in range(0, len(items), args.batch_size):
+                    await tx.orderitem.create_many(data=items[i:i + args.batch_size])
+            item_progress.add(len(items))
+
+        if args.snapshot:
+            if os.path.exists(args.snapshot):
+                os.remove(args.snapshot)
+            path = args.snapshot.replace("'", "''")
+            await prisma.execute_raw(f"VACUUM INTO '{path}'")
+            print(f"snapshot written to {args.snapshot}")
+    finally:
+        await prisma.disconnect()
+
+    elapsed = time.perf_counter() - started
+    total = len(user_ids) + len(product_ids) + order_no + args.order_items
+    print(f"done: {total} rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/s), seed={args.seed}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
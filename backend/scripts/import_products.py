@@ -0,0 +1,65 @@
+"""Bulk-import products from a CSV or NDJSON file.
+
+Usage (from backend/):
+    python scripts/import_products.py catalog.csv --seller-email seller@cartify.com
+    python scripts/import_products.py catalog.ndjson --import-id <id>   # resume
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from contextlib import nullcontext
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from prisma import Prisma  # noqa: E402
+
+from app.importer import IMPORT_BATCH_SIZE, ProductImporter, iter_lines, iter_records  # noqa: E402
+
+CHUNK_SIZE = 1 << 16
+
+
+async def read_chunks(path: str):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path")
+    parser.add_argument("--seller-email", default=os.getenv("SELLER_EMAIL", "seller@cartify.com"))
+    parser.add_argument("--format", choices=["csv", "ndjson"])
+    parser.add_argument("--import-id")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    fmt = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    prisma = Prisma()
+    await prisma.connect()
+    try:
+        seller = await prisma.user.find_unique(where={"email": args.seller_email})
+        if not seller:
+            sys.exit(f"No user with email {args.seller_email}")
+        importer = ProductImporter(lambda: nullcontext(prisma), seller_id=seller.id, batch_size=args.batch_size)
+        records = iter_records(iter_lines(read_chunks(args.path)), fmt)
+        try:
+            report = await importer.run(records, import_id=args.import_id)
+        except Exception:
+            if importer.import_id:
+                print(f"Import failed; resume with --import-id {importer.import_id}", file=sys.stderr)
+            raise
+    finally:
+        await prisma.disconnect()
+    errors = report.pop("errors")
+    for err in errors[:20]:
+        print(f"record {err['record']}: {err['error']}", file=sys.stderr)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
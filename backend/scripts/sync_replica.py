@@ -0,0 +1,64 @@
+"""Keep a copy of the SQLite database up to date as a stand-in read replica.
+
+Copies the primary into the replica file with SQLite's online backup API
+every --interval seconds, so the replica trails the primary by up to that
+long, much like an asynchronous replica. The copy is written in place, so
+a server already connected to the replica sees each refresh.
+
+Usage (from backend/):
+    python scripts/sync_replica.py --interval 2
+    REPLICA_DATABASE_URLS=file:./replica.db uvicorn app.main:app
+
+Relative paths are resolved against prisma/, like the file: URLs Prisma
+uses. Stop syncing (Ctrl-C) to watch reads fall back to the primary once
+the replica is more than REPLICA_MAX_LAG behind.
+"""
+import argparse
+import os
+import sqlite3
+import time
+
+PRISMA_DIR = os.path.join(os.path.dirname(__file__), "..", "prisma")
+
+
+def resolve(path: str) -> str:
+    path = path.removeprefix("file:")
+    return path if os.path.isabs(path) else os.path.normpath(os.path.join(PRISMA_DIR, path))
+
+
+def sync(primary: str, replica: str) -> float:
+    started = time.perf_counter()
+    src = sqlite3.connect(primary)
+    dst = sqlite3.connect(replica)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--primary", default=os.getenv("DATABASE_URL", "file:./dev.db"))
+    parser.add_argument("--replica", default="file:./replica.db")
+    parser.add_argument("--interval", type=float, default=2.0)
+    parser.add_argument("--once", action="store_true")
+    args = parser.parse_args()
+
+    primary, replica = resolve(args.primary), resolve(args.replica)
+    if not os.path.exists(primary):
+        parser.error(f"primary database not found: {primary}")
+    while True:
+        took = sync(primary, replica)
+        print(f"{time.strftime('%H:%M:%S')} synced {primary} -> {replica} in {took * 1000:.0f} ms", flush=True)
+        if args.once:
+            return
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
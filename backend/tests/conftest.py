@@ -0,0 +1,22 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+SCHEMA = os.path.join(os.path.dirname(__file__), "..", "prisma", "schema.prisma")
+
+
+@pytest.fixture(scope="session")
+def database_url(tmp_path_factory) -> str:
+    """A fresh SQLite database with the current schema, shared by the session."""
+    url = f"file:{tmp_path_factory.mktemp('db') / 'test.db'}"
+    prisma_cli = shutil.which("prisma") or os.path.join(os.path.dirname(sys.executable), "prisma")
+    subprocess.run(
+        [prisma_cli, "db", "push", f"--schema={SCHEMA}", "--skip-generate", "--accept-data-loss"],
+        env={**os.environ, "DATABASE_URL": url},
+        check=True,
+        capture_output=True,
+    )
+    return url
@@ -0,0 +1,120 @@
+"""Concurrent checkouts racing for the last unit of stock.
+
+Runs against a real SQLite database (see conftest.py): the guarantee rests
+on the conditional UPDATE in app/inventory.py, which a fake client would
+not exercise.
+"""
+import asyncio
+import uuid
+
+import pytest
+
+try:
+    from prisma import Prisma  # noqa: F401
+except (ImportError, RuntimeError) as exc:
+    # Nothing in app/ imports without an installed, generated client.
+    pytest.skip(f"needs a generated Prisma client ({exc.__class__.__name__})", allow_module_level=True)
+
+from fastapi import HTTPException  # noqa: E402
+
+from app.db import PrismaPool  # noqa: E402
+from app.routers.orders import (  # noqa: E402
+    BulkOrderRequest,
+    BulkOrderResponse,
+    CreateOrderRequest,
+    OrderItemIn,
+    OrderOut,
+    place_order,
+    place_orders_bulk,
+)
+
+CHECKOUTS = 20
+POOL_SIZE = 4
+
+
+def order_for(product_id: str) -> CreateOrderRequest:
+    return CreateOrderRequest(items=[OrderItemIn(productId=product_id, quantity=1)], shippingAddress="1 Test Street")
+
+
+async def create_customer_and_product(pool: PrismaPool, stock: int):
+    async with pool.acquire() as prisma:
+        customer = await prisma.user.create(data={
+            "name": "Test Customer", "email": f"{uuid.uuid4().hex}@test.cartify.local",
+            "password": "x", "role": "customer",
+        })
+        product = await prisma.product.create(data={
+            "name": "Last unit", "price": 10, "image": "", "description": "",
+            "rating": 0.0, "reviews": 0, "stock": stock, "sellerId": customer.id,
+        })
+    return customer, product
+
+
+async def watch_stock(pool: PrismaPool, product_id: str, seen: list, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        async with pool.acquire() as prisma:
+            seen.append((await prisma.product.find_unique(where={"id": product_id})).stock)
+        await asyncio.sleep(0)
+
+
+async def race(database_url: str, checkouts) -> tuple[list, int, int, list]:
+    """Run checkouts(pool, customer, product_id) concurrently against one unit."""
+    pool = PrismaPool(size=POOL_SIZE, acquire_timeout=60, datasource_url=database_url)
+    await pool.connect()
+    try:
+        customer, product = await create_customer_and_product(pool, stock=1)
+        seen: list = []
+        stop = asyncio.Event()
+        watcher = asyncio.create_task(watch_stock(pool, product.id, seen, stop))
+        results = await asyncio.gather(*checkouts(pool, customer, product.id), return_exceptions=True)
+        stop.set()
+        await watcher
+        async with pool.acquire() as prisma:
+            stock = (await prisma.product.find_unique(where={"id": product.id})).stock
+            sold = await prisma.orderitem.count(where={"productId": product.id})
+    finally:
+        await pool.disconnect()
+    return results, stock, sold, seen
+
+
+async def single(pool: PrismaPool, customer, product_id: str):
+    async with pool.acquire() as prisma:
+        return await place_order(order_for(product_id), customer, prisma)
+
+
+async def bulk(pool: PrismaPool, customer, product_id: str):
+    async with pool.acquire() as prisma:
+        return await place_orders_bulk(BulkOrderRequest(orders=[order_for(product_id)] * 2), customer, prisma)
+
+
+def is_out_of_stock(exc) -> bool:
+    return isinstance(exc, HTTPException) and exc.status_code == 409 and exc.detail["error"] == "out_of_stock"
+
+
+def check_outcomes(results: list) -> int:
+    """Every checkout either won or was told it is out of stock; returns the wins."""
+    errors = [r for r in results if isinstance(r, BaseException) and not is_out_of_stock(r)]
+    assert not errors, errors
+    lines = [line for r in results if isinstance(r, BulkOrderResponse) for line in r.results]
+    assert all(line.ok or line.error.startswith("Out of stock") for line in lines), lines
+    return sum(isinstance(r, OrderOut) for r in results) + sum(line.ok for line in lines)
+
+
+def test_place_order_sells_the_last_unit_once(database_url):
+    results, stock, sold, seen = asyncio.run(race(
+        database_url, lambda pool, customer, pid: [single(pool, customer, pid) for _ in range(CHECKOUTS)],
+    ))
+
+    assert check_outcomes(results) == 1
+    assert (stock, sold) == (0, 1)
+    assert min(seen, default=0) >= 0
+
+
+def test_bulk_and_single_checkouts_sell_the_last_unit_once(database_url):
+    def checkouts(pool, customer, pid):
+        return [single(pool, customer, pid) if i % 2 else bulk(pool, customer, pid) for i in range(CHECKOUTS)]
+
+    results, stock, sold, seen = asyncio.run(race(database_url, checkouts))
+
+    assert check_outcomes(results) == 1
+    assert (stock, sold) == (0, 1)
+    assert min(seen, default=0) >= 0
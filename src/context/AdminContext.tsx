@@ -31,7 +31,7 @@ export const AdminProvider: React.FC<{ children: React.ReactNode }> = ({ childre
       const savedCats = localStorage.getItem('cartify_categories');
       if (savedCats) setCategories(JSON.parse(savedCats));
     });
-    api.admin.applications.list().then((apps: {
+    api.admin.applications.list({ sort: 'newest', limit: 200 }).then((page: { items: {
       id: string;
       name: string;
       email: string;
@@ -41,8 +41,8 @@ export const AdminProvider: React.FC<{ children: React.ReactNode }> = ({ childre
       extraInfo: string;
       status: 'pending' | 'approved' | 'rejected';
       date: string;
-    }[]) => {
-      const normalized = apps.map(a => ({
+    }[] }) => {
+      const normalized = page.items.map(a => ({
         id: a.id,
         name: a.name,
         email: a.email,
@@ -8,7 +8,8 @@ interface ProductContextType {
   updateProduct: (product: Product) => Promise<void>;
   deleteProduct: (productId: string) => Promise<void>;
   getProductsBySeller: (sellerId: string) => Product[];
-  refreshProducts: (params?: Record<string, string | number | boolean>) => Promise<void>;
+  // Resolves to the cursor of the next page, or null on the last one.
+  refreshProducts: (params?: Record<string, string | number | boolean>) => Promise<string | null>;
   loading: boolean;
 }
 
@@ -145,13 +146,15 @@ export const ProductProvider = ({ children }: { children: ReactNode }) => {
     } as Product));
   };
 
-  const refreshProducts = async (params: Record<string, string | number | boolean> = {}) => {
+  const refreshProducts = async (params: Record<string, string | number | boolean> = {}): Promise<string | null> => {
     try {
       setLoading(true);
-      const list = await api.products.list(params);
-      setProducts(mapProducts(list));
+      const page = await api.products.list(params);
+      setProducts(mapProducts(page.items));
+      return page.nextCursor ?? null;
     } catch {
       setProducts([]);
+      return null;
     } finally {
       setLoading(false);
     }
@@ -86,8 +86,14 @@ export const api = {
   admin: {
     applications: {
       submit: (payload: ApplicationPayload) => request('/admin/applications', { method: 'POST', body: JSON.stringify(payload) }),
-      list: (status?: string) => request(`/admin/applications${status ? `?status=${status}` : ''}`),
+      list: (params: Record<string, string | number> = {}) => {
+        const q = new URLSearchParams(Object.entries(params).map(([k, v]) => [k, String(v)])).toString();
+        return request(`/admin/applications${q ? `?${q}` : ''}`);
+      },
+      counts: () => request('/admin/applications/counts'),
       updateStatus: (id: string, status: string) => request(`/admin/applications/${id}`, { method: 'PATCH', body: JSON.stringify({ status }) }),
+      bulkUpdateStatus: (ids: string[], status: 'pending' | 'approved' | 'rejected') =>
+        request('/admin/applications/bulk-status', { method: 'POST', body: JSON.stringify({ ids, status }) }),
     },
     categories: {
       list: () => request('/admin/categories'),
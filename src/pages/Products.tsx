@@ -6,6 +6,15 @@ import { useProducts } from '../context/ProductContext';
 import { useAdmin } from '../context/AdminContext';
 import { Product } from '../types';
 
+// Storefront sort options -> /products query parameters.
+const SORT_PARAMS: Record<string, Record<string, string | boolean>> = {
+  featured: { sort: 'recent' },
+  'price-low': { sort: 'price_asc' },
+  'price-high': { sort: 'price_desc' },
+  rating: { sort: 'rating' },
+  trending: { sort: 'recent', trending: true },
+};
+
 const Products: React.FC = () => {
   const { products: allProducts, refreshProducts, loading } = useProducts();
   const { categories: adminCategories, categoryList } = useAdmin();
@@ -18,6 +27,9 @@ const Products: React.FC = () => {
   const [viewMode, setViewMode] = useState<'grid' | 'list'>('grid');
   const [page, setPage] = useState<number>(1);
   const [pageSize, setPageSize] = useState<number>(12);
+  // The API pages by cursor: cursors[i] fetches page i + 1.
+  const [cursors, setCursors] = useState<(string | undefined)[]>([undefined]);
+  const [hasNext, setHasNext] = useState<boolean>(false);
   const [showFilters, setShowFilters] = useState(false);
 
   const categories = useMemo(() => ['all', ...adminCategories], [adminCategories]);
@@ -62,6 +74,12 @@ const Products: React.FC = () => {
     return products;
   }, [searchParams, selectedCategory, priceRange, sortBy, show10Min, allProducts]);
   
+  // Any filter change starts again from the first page.
+  useEffect(() => {
+    setPage(1);
+    setCursors([undefined]);
+  }, [selectedCategory, show10Min, sortBy, pageSize, priceRange]);
+
   useEffect(() => {
     const params = new URLSearchParams();
     if (selectedCategory !== 'all') params.set('category', selectedCategory);
@@ -75,20 +93,30 @@ const Products: React.FC = () => {
     setSearchParams(params, { replace: true });
 
     const q: Record<string, string | number | boolean> = {};
-    if (selectedCategory !== 'all') q.category = selectedCategory;
     if (selectedCategory !== 'all') {
+      // The API takes a category id or name; the id uses the categoryId indexes.
       const match = categoryList.find(c => c.name === selectedCategory);
-      if (match) q.categoryId = match.id;
+      q.category = match ? String(match.id) : selectedCategory;
     }
     if (show10Min) q.deliveryTime = 10;
-    if (sortBy) q.sort = sortBy;
-    if (priceRange) q.priceMax = priceRange;
+    Object.assign(q, SORT_PARAMS[sortBy] ?? SORT_PARAMS.featured);
+    if (priceRange) q.maxPrice = priceRange;
     if (searchQuery) q.search = searchQuery;
-    q.page = page;
-    q.pageSize = pageSize;
+    q.limit = pageSize;
+    const cursor = cursors[page - 1];
+    if (cursor) q.cursor = cursor;
 
     const t = setTimeout(() => {
-      refreshProducts(q);
+      refreshProducts(q).then(next => {
+        setHasNext(next !== null);
+        if (next) {
+          setCursors(prev => {
+            const known = prev.slice(0, page);
+            known[page] = next;
+            return known;
+          });
+        }
+      });
     }, 300);
     return () => clearTimeout(t);
   }, [selectedCategory, show10Min, sortBy, page, pageSize, priceRange]);
@@ -197,7 +225,8 @@ const Products: React.FC = () => {
                 </button>
                 <button
                   onClick={() => setPage(page + 1)}
-                  className="px-3 py-2 bg-white border rounded-lg"
+                  className="px-3 py-2 bg-white border rounded-lg disabled:opacity-50"
+                  disabled={!hasNext}
                 >
                   Next
                 </button>